@@ -0,0 +1,196 @@
+"""Benchmark both drivers against the local mock API
+
+Starts a benchmarks.mock_server.MockServer in a child process and, for
+every combination of driver, fleet size and concurrency, measures requests
+per second, p50 and p99 latency and the peak memory allocated by the client
+while running. Run it before a release and compare with the previous
+numbers:
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --servers 100 10000 --concurrency 1 16 64 \\
+        --latency 0.02 --scenario summary --sync-transport urllib3
+
+Scenarios:
+    servers   servers(), the whole fleet in one response
+    iter      iter_servers() / aiter_servers(), the same list streamed
+    summary   summary() of one node per request, small responses
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+# pylint: disable=wrong-import-position
+from benchmarks.mock_server import MockProcess, fleet
+from naapi import aioapi, aiotransports, api, transports
+
+SCENARIOS = ('servers', 'iter', 'summary')
+KEY = 'benchmark-key'
+
+
+def percentile(latencies, fraction):
+    """Return the given percentile of a sorted list of latencies"""
+    if not latencies:
+        return 0.0
+    index = min(len(latencies) - 1, int(round(fraction * len(latencies))))
+    return latencies[index]
+
+
+def sync_call(conn, scenario, mbpkgid):
+    """Make one request of scenario with the sync driver"""
+    if scenario == 'servers':
+        return conn.servers().json()
+    if scenario == 'iter':
+        return sum(1 for _ in conn.iter_servers())
+    return conn.summary(mbpkgid).json()
+
+
+async def async_call(conn, scenario, mbpkgid):
+    """Make one request of scenario with the asyncio driver"""
+    if scenario == 'servers':
+        return (await conn.servers()).json()
+    if scenario == 'iter':
+        count = 0
+        async for _ in conn.aiter_servers():
+            count += 1
+        return count
+    return (await conn.summary(mbpkgid)).json()
+
+
+# pylint: disable=too-many-arguments
+def run_sync(url, scenario, requests, concurrency, mbpkgids, transport=None):
+    """Return the per-request latencies of requests calls on threads"""
+    latencies = []
+    with api.NetActuateNodeDriver(KEY, host=url, retry=False,
+                                  pool_maxsize=concurrency,
+                                  transport=transport) as conn:
+
+        def one(index):
+            start = time.perf_counter()
+            sync_call(conn, scenario, mbpkgids[index % len(mbpkgids)])
+            latencies.append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(one, range(requests)))
+    return latencies
+
+
+# pylint: disable=too-many-arguments
+def run_async(url, scenario, requests, concurrency, mbpkgids,
+              transport=None):
+    """Return the per-request latencies of requests calls as tasks"""
+    latencies = []
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        async with aioapi.NetActuateNodeDriver(
+                KEY, host=url, retry=False, limit=concurrency,
+                transport=transport) as conn:
+
+            async def one(index):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await async_call(conn, scenario,
+                                     mbpkgids[index % len(mbpkgids)])
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(one(index) for index in range(requests)))
+
+    asyncio.run(main())
+    return latencies
+
+
+DRIVERS = {'sync': run_sync, 'async': run_async}
+
+
+# pylint: disable=too-many-arguments
+def measure(driver, url, scenario, requests, concurrency, mbpkgids,
+            transport=None):
+    """Run one benchmark, return a dict of its results
+
+    The timed run and the memory run are separate, tracing allocations
+    slows Python down enough to skew the latencies
+    """
+    start = time.perf_counter()
+    latencies = DRIVERS[driver](url, scenario, requests, concurrency,
+                                mbpkgids, transport)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    DRIVERS[driver](url, scenario, requests, concurrency, mbpkgids,
+                    transport)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        'driver': driver,
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p99': percentile(latencies, 0.99),
+        'peak_mb': peak / 1048576.0,
+    }
+
+
+ROW = ('{driver:<6} {scenario:<8} {servers:>7} {concurrency:>5} '
+       '{requests:>6} {rps:>9.1f} {p50_ms:>9.2f} {p99_ms:>9.2f} '
+       '{peak_mb:>8.1f}')
+HEADER = ('{0:<6} {1:<8} {2:>7} {3:>5} {4:>6} {5:>9} {6:>9} {7:>9} '
+          '{8:>8}'.format('driver', 'scenario', 'servers', 'conc', 'reqs',
+                          'req/s', 'p50 ms', 'p99 ms', 'peak MB'))
+
+
+def main():
+    """Run the benchmark matrix and print a table"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('Scenarios:')[1])
+    parser.add_argument('--driver', nargs='+', choices=sorted(DRIVERS),
+                        default=['sync', 'async'])
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS,
+                        default=['servers', 'summary'])
+    parser.add_argument('--servers', nargs='+', type=int,
+                        default=[100, 5000], help='fleet sizes')
+    parser.add_argument('--concurrency', nargs='+', type=int,
+                        default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per run')
+    parser.add_argument('--sync-transport', default='requests',
+                        choices=sorted(transports.TRANSPORTS))
+    parser.add_argument('--async-transport', default='aiohttp',
+                        choices=aiotransports.TRANSPORTS)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the mock server adds per response')
+    parser.add_argument('--padding', type=int, default=0,
+                        help='extra bytes per server record')
+    args = parser.parse_args()
+
+    print(HEADER)
+    for servers in args.servers:
+        with MockProcess(servers=servers, latency=args.latency,
+                         padding=args.padding) as server:
+            mbpkgids = [record['mbpkgid'] for record in fleet(servers)]
+            for scenario in args.scenario:
+                for driver in args.driver:
+                    for concurrency in args.concurrency:
+                        transport = args.sync_transport \
+                            if driver == 'sync' else args.async_transport
+                        result = measure(driver, server.url, scenario,
+                                         args.requests, concurrency,
+                                         mbpkgids, transport)
+                        print(ROW.format(servers=servers,
+                                         p50_ms=result['p50'] * 1000,
+                                         p99_ms=result['p99'] * 1000,
+                                         **result))
+
+
+if __name__ == '__main__':
+    main()
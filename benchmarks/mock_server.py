@@ -0,0 +1,387 @@
+"""Local mock of the NetActuate API for benchmarks
+
+Serves the /cloud/* endpoints both drivers use with generated fleet-sized
+payloads, so naapi can be measured without touching production. Every
+response is delayed by latency seconds (plus up to jitter more) to stand
+in for the network and the API itself.
+
+    python benchmarks/mock_server.py --port 8080 --servers 5000
+    NAAPI_API_HOST=http://127.0.0.1:8080 python examples/list_servers.py
+
+or from Python:
+
+    with MockServer(servers=5000, latency=0.02) as server:
+        conn = NetActuateNodeDriver('key', host=server.url)
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LOCATIONS = ('Los Angeles, US', 'Ashburn, US', 'Amsterdam, NL',
+             'Frankfurt, DE', 'Singapore, SG', 'Tokyo, JP', 'Sydney, AU',
+             'Sao Paulo, BR')
+PLANS = ('VR1x1x25', 'VR2x2x50', 'VR4x4x100', 'VR8x8x200')
+IMAGES = ('Ubuntu 22.04', 'Debian 12', 'Rocky 9', 'FreeBSD 14')
+STATES = ('RUNNING', 'RUNNING', 'RUNNING', 'STOPPED')
+
+# Lifecycle POSTs, answered with a job
+JOB_ACTIONS = ('start', 'shutdown', 'reboot', 'start_rescue', 'stop_rescue',
+               'delete')
+
+
+def fleet(count, seed=0):
+    """Return count generated server records"""
+    rand = random.Random(seed)
+    servers = []
+    for index in range(count):
+        mbpkgid = 100000 + index
+        location = rand.randrange(len(LOCATIONS))
+        plan = rand.randrange(len(PLANS))
+        image = rand.randrange(len(IMAGES))
+        state = STATES[rand.randrange(len(STATES))]
+        servers.append({
+            'mbpkgid': mbpkgid,
+            'fqdn': 'node{0}.pop{1}.example.com'.format(index, location),
+            'status': 'Active',
+            'state': state,
+            'location_id': location + 1,
+            'location': LOCATIONS[location],
+            'plan_id': plan + 1,
+            'plan': PLANS[plan],
+            'os_id': image + 1,
+            'os': IMAGES[image],
+            'ip': '10.{0}.{1}.{2}'.format(location, index // 250 % 250,
+                                          index % 250 + 1),
+            'installed': 1,
+        })
+    return servers
+
+
+# pylint: disable=too-many-instance-attributes
+class MockAPI:
+    """Generated payloads and the routing of /cloud/* paths to them
+
+    padding adds that many bytes of filler to every server record to try
+    larger payloads
+    """
+    def __init__(self, servers=1000, padding=0, seed=0):
+        self.servers = fleet(servers, seed)
+        if padding:
+            for server in self.servers:
+                server['notes'] = 'x' * padding
+        self.by_id = dict((str(server['mbpkgid']), server)
+                          for server in self.servers)
+        self._bodies = {}
+        self._job_id = 0
+        self._lock = threading.Lock()
+        self.routes = [
+            (re.compile(r'^/cloud/servers/?$'), self.list_servers),
+            (re.compile(r'^/cloud/packages/?$'), self.list_servers),
+            (re.compile(r'^/cloud/locations/?$'), self.locations),
+            (re.compile(r'^/cloud/images/?$'), self.images),
+            (re.compile(r'^/cloud/sizes(?:/(\w+))?/?$'), self.plans),
+            (re.compile(r'^/cloud/server/({0})/(\d+)$'.format(
+                '|'.join(JOB_ACTIONS))), self.job_action),
+            (re.compile(r'^/cloud/(?:server|package)/(\d+)$'), self.server),
+            (re.compile(r'^/cloud/serversummary/(\d+)$'), self.summary),
+            (re.compile(r'^/cloud/(ipv4|ipv6|networkips)/(\d+)$'), self.ips),
+            (re.compile(r'^/cloud/status/(\d+)$'), self.status),
+            (re.compile(r'^/cloud/servermonthlybw/(\d+)$'), self.bandwidth),
+            (re.compile(r'^/cloud/serverjobs?/?$'), self.jobs),
+            (re.compile(r'^/cloud/bgpsessions2/?$'), self.bgp_sessions),
+            (re.compile(r'^/cloud/bgpsession2/(\d+)$'), self.bgp_session),
+            (re.compile(r'^/cloud/bgpsummary/?$'), self.bgp_summary),
+        ]
+
+    def route(self, path, params):
+        """Return (status, body bytes) for a request"""
+        if not params.get('key'):
+            return 401, b'{"error": 1, "msg": "missing key"}'
+        for pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                result = handler(params, *match.groups())
+                if isinstance(result, bytes):
+                    return 200, result
+                if result is None:
+                    return 404, b'{"error": 1, "msg": "not found"}'
+                return 200, json.dumps(result).encode('utf-8')
+        return 404, b'{"error": 1, "msg": "unknown endpoint"}'
+
+    def _static(self, name, build):
+        """Encode a payload that never changes once"""
+        body = self._bodies.get(name)
+        if body is None:
+            body = self._bodies[name] = json.dumps(build()).encode('utf-8')
+        return body
+
+    def list_servers(self, _params):
+        """GET /cloud/servers/"""
+        return self._static('servers', lambda: self.servers)
+
+    def locations(self, _params):
+        """GET /cloud/locations/, keyed by id like the real API"""
+        return self._static('locations', lambda: dict(
+            (str(index + 1), {'id': index + 1, 'name': name,
+                              'continent': 'N/A'})
+            for index, name in enumerate(LOCATIONS)))
+
+    def images(self, _params):
+        """GET /cloud/images/"""
+        return self._static('images', lambda: [
+            {'id': index + 1, 'os': name, 'type': 'linux', 'size': '25'}
+            for index, name in enumerate(IMAGES)])
+
+    def plans(self, _params, _location=None):
+        """GET /cloud/sizes/[location]"""
+        return self._static('plans', lambda: [
+            {'plan_id': index + 1, 'plan': name, 'ram': 1024 << index,
+             'disk': 25 << index, 'transfer': 1000 << index,
+             'price': 5 << index}
+            for index, name in enumerate(PLANS)])
+
+    def server(self, _params, mbpkgid):
+        """GET /cloud/server/{mbpkgid}"""
+        return self.by_id.get(mbpkgid)
+
+    def summary(self, _params, mbpkgid):
+        """GET /cloud/serversummary/{mbpkgid}"""
+        server = self.by_id.get(mbpkgid)
+        if server is None:
+            return None
+        return dict(server, cpu=1, ram=1024, disk=25, bandwidth_used=12345)
+
+    def ips(self, _params, kind, mbpkgid):
+        """GET /cloud/ipv4|ipv6|networkips/{mbpkgid}"""
+        server = self.by_id.get(mbpkgid)
+        if server is None:
+            return None
+        ip = server['ip'] if kind != 'ipv6' else '2001:db8::{0:x}'.format(
+            int(mbpkgid))
+        return [{'id': int(mbpkgid), 'ip': ip, 'netmask': '255.255.255.0',
+                 'gateway': ip.rsplit('.', 1)[0] + '.254', 'broadcast': '',
+                 'reverse': server['fqdn'], 'primary': 1, 'type': kind}]
+
+    def status(self, _params, mbpkgid):
+        """GET /cloud/status/{mbpkgid}"""
+        server = self.by_id.get(mbpkgid)
+        return None if server is None else {'status': server['state']}
+
+    def bandwidth(self, _params, mbpkgid):
+        """GET /cloud/servermonthlybw/{mbpkgid}"""
+        if mbpkgid not in self.by_id:
+            return None
+        scale = int(mbpkgid) % 7 + 1
+        return [{'day': day, 'rx': day * 1000 * scale,
+                 'tx': day * 2000 * scale} for day in range(1, 31)]
+
+    def job_action(self, params, action, mbpkgid):
+        """POST /cloud/server/{action}/{mbpkgid}, starts a job"""
+        if mbpkgid not in self.by_id:
+            return None
+        with self._lock:
+            self._job_id += 1
+            job_id = self._job_id
+        return {'id': job_id, 'mbpkgid': int(mbpkgid), 'status': 5,
+                'command': action, 'ts_insert': int(time.time()),
+                'params': sorted(params)}
+
+    def jobs(self, params):
+        """GET /cloud/serverjob(s)/, every job has finished"""
+        mbpkgid = params.get('mbpkgid', '0')
+        job = {'id': int(params.get('job_id', 1)), 'mbpkgid': int(mbpkgid),
+               'status': 5, 'command': 'build',
+               'ts_insert': int(time.time())}
+        return job if 'job_id' in params else [job]
+
+    def _session(self, index):
+        server = self.servers[index % len(self.servers)]
+        return {'id': index + 1, 'mbpkgid': server['mbpkgid'],
+                'group_id': 1, 'group_name': 'anycast',
+                'customer_ip': server['ip'], 'provider_ip': '10.255.0.1',
+                'customer_asn': 64512, 'provider_asn': 36236,
+                'state': 'Established', 'description': server['fqdn']}
+
+    def bgp_sessions(self, _params):
+        """GET /cloud/bgpsessions2"""
+        return self._static('bgp', lambda: [
+            self._session(index) for index in range(len(self.servers))])
+
+    def bgp_session(self, _params, session_id):
+        """GET /cloud/bgpsession2/{id}"""
+        return self._session(int(session_id) - 1)
+
+    def bgp_summary(self, _params):
+        """GET /cloud/bgpsummary"""
+        return {'sessions': len(self.servers),
+                'established': len(self.servers)}
+
+
+def _handler(api, latency, jitter):
+    class Handler(BaseHTTPRequestHandler):
+        """Answers every request through api.route()"""
+        protocol_version = 'HTTP/1.1'
+        # send the status line, headers and body in one write with no
+        # Nagle delay, otherwise every response waits ~40ms for an ACK
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def _respond(self, params):
+            delay = latency + (random.random() * jitter if jitter else 0)
+            if delay:
+                time.sleep(delay)
+            url = urlparse(self.path)
+            params.update((key, values[0]) for key, values in
+                          parse_qs(url.query).items())
+            status, body = api.route(url.path, params)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # pylint: disable=invalid-name
+        def do_GET(self):
+            """Serve a GET"""
+            self._respond({})
+
+        # pylint: disable=invalid-name
+        def do_POST(self):
+            """Serve a POST with a JSON or form encoded body"""
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8') if length else ''
+            try:
+                params = dict((key, str(value)) for key, value in
+                              json.loads(body or '{}').items())
+            except ValueError:
+                params = dict((key, values[0]) for key, values in
+                              parse_qs(body).items())
+            self._respond(params)
+
+        def log_message(self, *args):
+            """Keep quiet, benchmarks print their own output"""
+
+    return Handler
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # listen() runs in the constructor, the backlog has to be set here or
+    # bursts of new connections wait out a SYN retransmit
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockServer:
+    """Runs a MockAPI on a local port in a background thread
+
+    url is what to pass as host= to either driver
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, servers=1000, latency=0.0, jitter=0.0, padding=0,
+                 port=0, host='127.0.0.1'):
+        self.api = MockAPI(servers=servers, padding=padding)
+        self.httpd = _HTTPServer(
+            (host, port), _handler(self.api, latency, jitter))
+        self._thread = None
+
+    @property
+    def url(self):
+        """Root url of the server"""
+        host, port = self.httpd.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def _serve(conn, kwargs):
+    """Child process side of MockProcess"""
+    server = MockServer(**kwargs)
+    conn.send(server.url)
+    server.start()
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    server.stop()
+
+
+class MockProcess:
+    """Runs a MockServer in a child process
+
+    Takes the arguments of MockServer. The server's CPU time and memory
+    stay out of the process being measured, url is set once started.
+    """
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._conn = None
+        self._process = None
+        self.url = None
+
+    def start(self):
+        """Start the child process and wait until it serves"""
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(child, self._kwargs), daemon=True)
+        self._process.start()
+        self.url = self._conn.recv()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for the child process"""
+        self._conn.send(None)
+        self._process.join()
+        self._conn.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """Run a mock server in the foreground"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--servers', type=int, default=1000,
+                        help='fleet size')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--padding', type=int, default=0,
+                        help='extra bytes per server record')
+    args = parser.parse_args()
+    server = MockServer(servers=args.servers, latency=args.latency,
+                        jitter=args.jitter, padding=args.padding,
+                        port=args.port)
+    print("Serving {0} servers on {1}".format(args.servers, server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Measure and bound the startup cost of the naapi command line tool
+
+Imports naapi.cli in fresh interpreters and reports the median import
+time, and checks that no HTTP library was imported on the way. Exits 1
+when the median goes over the budget or an HTTP library shows up, so it
+can gate a release:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --budget 60
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules naapi.cli must only import once a request is sent
+LAZY = ('requests', 'urllib3', 'aiohttp', 'httpx', 'naapi.api',
+        'naapi.aioapi', 'naapi.transports')
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import naapi.cli
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(' '.join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+
+def probe():
+    """Import naapi.cli in a new interpreter, return (ms, eager modules)"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(lazy=LAZY)], env=env,
+        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    elapsed, eager = (output.split('\n') + [''])[:2]
+    return float(elapsed), eager.split()
+
+
+def main():
+    """Run the probes and print the result"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=80.0,
+                        help='milliseconds allowed for import naapi.cli')
+    args = parser.parse_args()
+
+    times = []
+    eager = set()
+    for _ in range(args.runs):
+        elapsed, modules = probe()
+        times.append(elapsed)
+        eager.update(modules)
+    median = statistics.median(times)
+    print("import naapi.cli: median {0:.1f} ms, min {1:.1f} ms, "
+          "max {2:.1f} ms over {3} runs (budget {4:.0f} ms)".format(
+              median, min(times), max(times), args.runs, args.budget))
+    status = 0
+    if eager:
+        print("imported eagerly: {0}".format(' '.join(sorted(eager))))
+        status = 1
+    if median > args.budget:
+        print("over budget")
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
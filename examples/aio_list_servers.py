@@ -16,12 +16,12 @@ if API_KEY is None:
 
 async def main():
     """Basic Main"""
-    conn = NetActuateNodeDriver(API_KEY)
-    servers = json.loads(await conn.servers())
-    print("server 0: ", servers[0])
-    locations = json.loads(await conn.locations())
-    print("location 0: ", locations[0])
-    bw_report = json.loads(await conn.bandwidth_report(mbpkgid=servers[0]['mbpkgid']))
-    print("bw_report: ", bw_report)
+    async with NetActuateNodeDriver(API_KEY) as conn:
+        servers = json.loads(await conn.servers())
+        print("server 0: ", servers[0])
+        locations = json.loads(await conn.locations())
+        print("location 0: ", locations[0])
+        bw_report = json.loads(await conn.bandwidth_report(mbpkgid=servers[0]['mbpkgid']))
+        print("bw_report: ", bw_report)
 
 asyncio.run(main())
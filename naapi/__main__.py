@@ -0,0 +1,5 @@
+"""python -m naapi runs the naapi command line tool"""
+import sys
+from .cli import main
+
+sys.exit(main())
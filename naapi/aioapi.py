@@ -2,47 +2,76 @@
 
 It is very basic, like the plain one
 """
-import json
+import asyncio
+from urllib.parse import urlencode
 import aiohttp
-
-async def get_path(url=None, data=None):
-    """TODO"""
+from .aiotransports import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_DNS_CACHE_TTL,
+                            DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_LIMIT,
+                            DEFAULT_LIMIT_PER_HOST, DEFAULT_READ_TIMEOUT,
+                            AiohttpTransport, make_transport)
+from .bulk import BulkResult, check_operation, schedule, server_locations
+from .cache import FRESH, STALE, make_cache
+from .endpoints import install
+from .exceptions import (NetActuateException, CONNECTION_ERROR,
+                         TIMEOUT)
+from .jobs import JobWatcher
+from .hedge import make_breaker, make_hedge
+from .metrics import body_size, endpoint_template, make_instrumentation
+from .models import Location, returns
+from .ratelimit import (make_limiter, make_retry, parse_retry_after,
+                        retries_exhausted)
+from .response import JSONText
+from .singleflight import AsyncSingleFlight
+from .stream import CHUNK_SIZE, aiter_items
+from .util import api_root, decode
+
+# Per-node endpoints fetched by NetActuateNodeDriver.fan_out()
+FAN_OUT_ENDPOINTS = ('summary', 'ipv4', 'ipv6', 'networkips', 'status')
+
+async def request_path(method, url, data=None, session=None):
+    """Send one request and return (status, headers, body text)
+
+    A throwaway ClientSession is used unless session is given
+    """
     if data is None:
         data = {}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, data=data) as resp:
-            response = await resp.text()
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await request_path(method, url, data=data,
+                                      session=session)
+    async with session.request(method, url, data=data) as resp:
+        return resp.status, resp.headers, await resp.text()
+
+async def open_path(method, url, session):
+    """Send one request and return the ClientResponse with its body unread
+
+    The caller reads it from resp.content and must release() it
+    """
+    return await session.request(method, url)
+
+async def get_path(url=None, data=None, session=None):
+    """GET url and return the body text
 
+    A throwaway ClientSession is used unless session is given
+    """
+    _, _, response = await request_path('GET', url, data=data,
+                                        session=session)
     return response
 
-async def post_path(url=None, data=None):
-    """TODO"""
-    if data is None:
-        data = {}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, data=data) as resp:
-            response = await resp.text()
+async def post_path(url=None, data=None, session=None):
+    """POST data to url and return the body text
 
+    A throwaway ClientSession is used unless session is given
+    """
+    _, _, response = await request_path('POST', url, data=data,
+                                        session=session)
     return response
 
 API_HOSTS = {
     'v1': 'vapi.netactuate.com',
 }
 
-
-class NetActuateException(Exception):
-    """TODO"""
-    def __init__(self, code, message):
-        self.code = code
-        self.message = message
-        self.args = (code, message)
-        super().__init__(message)
-
-    async def __str__(self):
-        return self.__repr__()
-
-    async def __repr__(self):
-        return "<NetActuateException in %d : %s>" % (self.code, self.message)
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
 
 
 # pylint: disable=useless-object-inheritance, too-few-public-methods
@@ -58,6 +87,27 @@ class HVFromDict(object):
         return len(self.__dict__)
 
 
+class HVNodeResult:
+    """Per-node results collected by NetActuateNodeDriver.fan_out()
+
+    results maps endpoint name to its response, errors maps endpoint name
+    to the exception it raised
+    """
+    def __init__(self, mbpkgid):
+        self.mbpkgid = mbpkgid
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        """True when every endpoint for this node succeeded"""
+        return not self.errors
+
+    def __repr__(self):
+        return "<HVNodeResult {0} results={1} errors={2}>".format(
+            self.mbpkgid, sorted(self.results), sorted(self.errors))
+
+
 class HVJobStatus:
     """TODO"""
     def __init__(self, conn=None, node_id=None, job_result=None):
@@ -76,7 +126,7 @@ class HVJobStatus:
         result = await self.conn.connection(
             '/cloud/serverjob',
             data=params)
-        return json.loads(result) # json.loads(result)
+        return decode(result)
 
     async def status(self):
         """TODO"""
@@ -127,15 +177,115 @@ class HVJobStatus:
 
 
 # This is a closure that returns the request method below pre-configured
-def connection(key, api_version):
-    """TODO"""
-    __key__ = key
-    if api_version in ['v1', 'v1.1', 'v2']:
-        root_url = 'https://{0}'.format(API_HOSTS[api_version])
-    else:
-        root_url = 'https://{0}'.format(API_HOSTS['v1'])
+# pylint: disable=too-many-arguments
+def connection(key, api_version, session=None, coalesce=None, limiter=None,
+               retry=None, instrument=None, host=None, transport=None,
+               hedge=None, breaker=None):
+    """TODO
+
+    Requests are sent with transport, a naapi.aiotransports transport.
+    Without one they go through a naapi.aiotransports.AiohttpTransport on
+    session, a callable returning the ClientSession to send requests
+    through, when it is None every request opens its own session. With
+    coalesce, a naapi.singleflight.AsyncSingleFlight, concurrent identical
+    GETs share one request. POSTs are never coalesced.
+    limiter is a naapi.ratelimit.TokenBucket every attempt waits on and
+    retry a naapi.ratelimit.RetryPolicy, a request still failing once its
+    retries are used up raises NetActuateException.
+    instrument is a naapi.metrics.Instrumentation told about every request
+    sent, coalesced GETs that share a request are reported once.
+    host overrides the API host, see naapi.util.api_root().
+    hedge is a naapi.hedge.HedgePolicy duplicating slow GETs and breaker a
+    naapi.hedge.CircuitBreaker failing calls to a failing endpoint fast.
+    """
+    if transport is None:
+        transport = AiohttpTransport(session=session,
+                                     shared=session is not None)
+    root_url = api_root(API_HOSTS, api_version, host)
+    # the key is encoded once, the rest of the query per request
+    key_query = '?' + urlencode({'key': key})
+
+    async def send(path, url_root, data, method, stream=False):
+        if instrument is None:
+            return await attempt_send(url_root, data, method, stream)
+        info = instrument.start(path, method)
+        try:
+            response = await attempt_send(url_root, data, method, stream,
+                                          info)
+        except NetActuateException as exc:
+            instrument.finish(info, exc.status, retries=exc.attempts - 1,
+                              error=exc.code)
+            raise
+        except Exception as exc:
+            instrument.finish(info, retries=info.retries,
+                              error=type(exc).__name__)
+            raise
+        instrument.finish(info, response.status_code,
+                          body_size(response.headers,
+                                    None if stream else response),
+                          retries=info.retries)
+        return response
 
-    async def request(url, data=None, method=None):
+    async def attempt_send(url_root, data, method, stream, info=None):
+        # POST bodies are form encoded, as this driver always sent them,
+        # once for every attempt
+        body, headers = (None, None) if method == 'GET' \
+            else (urlencode(data, doseq=True).encode(), FORM_HEADERS)
+        attempt = 0
+        while True:
+            if info is not None:
+                info.retries = attempt
+            if limiter is not None:
+                await limiter.aacquire()
+            try:
+                response = await transport.request(
+                    method, url_root, body=body, headers=headers,
+                    stream=stream)
+            except transport.errors as exc:
+                if retry is None or not retry.retry_error(method, attempt):
+                    code = TIMEOUT if isinstance(exc, transport.timeouts) \
+                        else CONNECTION_ERROR
+                    # never let the url, and so the key, into the message
+                    raise NetActuateException(
+                        code, type(exc).__name__, attempts=attempt + 1)
+                await asyncio.sleep(retry.delay(attempt))
+                attempt += 1
+                continue
+            status = response.status_code
+            if retry is None or status not in retry.statuses:
+                return response
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+            if not retry.retry_status(method, status, attempt):
+                if attempt >= retry.retries:
+                    if stream:
+                        text = await response.text()
+                        response.release()
+                        response = text
+                    raise retries_exhausted(status, response, attempt + 1,
+                                            retry_after)
+                return response
+            if stream:
+                response.release()
+            await asyncio.sleep(retry.delay(attempt, retry_after))
+            attempt += 1
+
+    async def guarded(endpoint, fetch):
+        if breaker is None:
+            return await fetch()
+        return await breaker.acall(endpoint, fetch)
+
+    async def hedged(endpoint, fetch):
+        if hedge is None:
+            return await fetch()
+        return await hedge.acall(endpoint, fetch)
+
+    async def request(url, data=None, method=None, stream=False):
+        """Send a request and return the body text
+
+        With stream a GET returns a naapi.aiotransports.AsyncStreamedResponse
+        with its body unread instead, it is never coalesced or hedged.
+        """
         if method is None:
             method = 'GET'
         if data is None:
@@ -144,223 +294,278 @@ def connection(key, api_version):
             url = '/{0}'.format(url)
 
         # build full url
-        url_root = '{0}{1}?key={2}'.format(root_url, url, __key__)
-
-        try:
-            if method == 'GET':
-                for key, val in data.items():
-                    url_root = "{0}&{1}={2}".format(url_root, key, val)
-                response = await get_path(url_root)
-            elif method == 'POST':
-                response = post_path(url_root, data=data)
-        except aiohttp.ClientError:
-            raise NetActuateException(
-                response.status_code, response.content)
-
-        return response
+        url_root = root_url + url + key_query
+        endpoint = endpoint_template(url) \
+            if hedge is not None or breaker is not None else None
+
+        if method == 'GET':
+            if data:
+                url_root = url_root + '&' + urlencode(data)
+            if stream:
+                return await guarded(endpoint, lambda: send(
+                    url, url_root, data, method, stream=True))
+
+            def get():
+                return guarded(endpoint, lambda: hedged(
+                    endpoint, lambda: send(url, url_root, data, method)))
+
+            if coalesce is not None:
+                return await coalesce.do(url_root, get)
+            return await get()
+        return await guarded(endpoint,
+                             lambda: send(url, url_root, data, method))
 
     return request
 
 
 class NetActuateNodeDriver():
-    """TODO"""
+    """Asyncio NetActuate API driver
+
+    The driver owns one transport, by default an aiohttp ClientSession and
+    TCPConnector, that every endpoint method reuses. It is created on first
+    use inside the running loop, use the driver with async with or await
+    close() when done. The endpoint methods are generated from
+    naapi.endpoints.ENDPOINTS.
+    """
     name = 'NetActuate'
     website = 'http://www.netactuate.com'
 
-    def __init__(self, key, api_version=None):
+    # pylint: disable=too-many-arguments
+    def __init__(self, key, api_version=None, limit=DEFAULT_LIMIT,
+                 limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                 ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, cache=None,
+                 coalesce=False, rate_limit=None, retry=True,
+                 typed=False, instrument=None, host=None, transport=None,
+                 hedge=None, breaker=None):
         if api_version is None:
             self.api_version = 'v1'
         else:
             self.api_version = api_version
         self.key = key
+        # return naapi.models records instead of raw responses
+        self.typed = typed
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        # transport is a naapi.aiotransports name or instance, an instance
+        # handed in by the caller is theirs to close
+        self.transport, self._owns_transport = make_transport(
+            transport, limit=limit, limit_per_host=limit_per_host,
+            ttl_dns_cache=ttl_dns_cache,
+            keepalive_timeout=keepalive_timeout,
+            connect_timeout=connect_timeout, read_timeout=read_timeout)
+        # concurrent identical GETs share one request when coalesce is set
+        self.singleflight = AsyncSingleFlight() if coalesce else None
+        # rate_limit is requests per second or a shared TokenBucket
+        self.limiter = make_limiter(rate_limit)
+        self.retry = make_retry(retry)
+        # instrument is True or a shared naapi.metrics.Instrumentation
+        self.instrument = make_instrumentation(instrument)
+        # hedge is True, a percentile or a shared naapi.hedge.HedgePolicy,
+        # breaker True, a failure count or a shared CircuitBreaker
+        self.hedge = make_hedge(hedge)
+        self.breaker = make_breaker(breaker)
         self.connection = connection(
             self.key,
-            api_version=api_version)
+            api_version=api_version,
+            coalesce=self.singleflight,
+            limiter=self.limiter,
+            retry=self.retry,
+            instrument=self.instrument,
+            host=host,
+            transport=self.transport,
+            hedge=self.hedge,
+            breaker=self.breaker)
+        # opt-in naapi.cache.TTLCache for the catalog endpoints
+        self.cache = make_cache(cache)
+        self._refresh_tasks = set()
+
+    async def __aenter__(self):
+        if hasattr(self.transport, 'get_session'):
+            self.transport.get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def get_session(self):
+        """Return the aiohttp transport's shared ClientSession"""
+        return self.transport.get_session()
+
+    async def close(self):
+        """Close the transport and its pooled connections"""
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        if self._owns_transport:
+            await self.transport.close()
 
+    async def _cached(self, key, fetch):
+        """Serve key from the catalog cache, awaiting fetch() to fill it
 
+        A stale entry is returned right away and refreshed in a background
+        task.
+        """
+        if self.cache is None:
+            return await fetch()
+        value, state = self.cache.lookup(key)
+        if state == FRESH:
+            return value
+        if state == STALE:
+            if self.cache.start_refresh(key):
+                task = asyncio.ensure_future(self._refresh(key, fetch))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return value
+        value = await fetch()
+        if getattr(value, 'ok', False):
+            self.cache.store(key, value)
+        return value
+
+    async def _refresh(self, key, fetch):
+        """Background refresh of a stale cache entry"""
+        try:
+            value = await fetch()
+            if getattr(value, 'ok', False):
+                self.cache.store(key, value)
+        # pylint: disable=broad-except
+        except Exception:
+            # keep serving the stale entry, the next lookup retries
+            pass
+        finally:
+            self.cache.end_refresh(key)
+
+    def job_watcher(self, **kwargs):
+        """Return a naapi.jobs.JobWatcher polling through this driver"""
+        return JobWatcher(self, **kwargs)
+
+    # pylint: disable=too-many-arguments
+    async def bulk(self, operation, mbpkgids, concurrency=None, stagger=None,
+                   progress=None, **kwargs):
+        """Run a lifecycle operation such as reboot over many nodes
+
+        operation is one of naapi.bulk.BULK_OPERATIONS and kwargs are
+        passed to it, eg force=True. At most concurrency calls run at once
+        (defaults to the connector limit). With stagger nodes in one
+        location are dispatched stagger seconds apart (locations are looked
+        up with servers()). progress(result, done, total) is called as each
+        node finishes and may be a coroutine function. Returns a
+        naapi.bulk.BulkResult per node in input order, with the job id to
+        wait on when the API returned one.
+        """
+        check_operation(operation)
+        mbpkgids = list(mbpkgids)
+        locations = server_locations(await self.servers()) if stagger else {}
+        semaphore = asyncio.Semaphore(concurrency or self.limit or
+                                      DEFAULT_LIMIT)
+        results = [None] * len(mbpkgids)
+        finished = []
+
+        async def run(delay, index, mbpkgid, location):
+            if delay:
+                await asyncio.sleep(delay)
+            result = results[index] = BulkResult(mbpkgid, operation,
+                                                 location)
+            async with semaphore:
+                try:
+                    result.set_response(
+                        await getattr(self, operation)(mbpkgid, **kwargs))
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    result.exception = exc
+            finished.append(result)
+            if progress is not None:
+                called = progress(result, len(finished), len(mbpkgids))
+                if asyncio.iscoroutine(called):
+                    await called
+
+        await asyncio.gather(*[
+            run(*item) for item in schedule(mbpkgids, locations, stagger)])
+        return results
+
+    async def fan_out(self, mbpkgids, endpoints=FAN_OUT_ENDPOINTS,
+                      concurrency=None):
+        """Fetch endpoints for many nodes at once
+
+        Each name in endpoints is a driver method taking an mbpkgid, at
+        most concurrency calls are in flight at a time (defaults to the
+        connector limit). This is an async generator yielding one
+        HVNodeResult per node as soon as all of its endpoints finished,
+        a failing call is recorded in the node's errors and does not stop
+        the rest of the batch.
+        """
+        for endpoint in endpoints:
+            if not callable(getattr(self, endpoint, None)):
+                raise ValueError("Unknown endpoint {0}".format(endpoint))
+        if concurrency is None:
+            concurrency = self.limit or DEFAULT_LIMIT
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(node, endpoint):
+            async with semaphore:
+                try:
+                    node.results[endpoint] = await getattr(
+                        self, endpoint)(node.mbpkgid)
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    node.errors[endpoint] = exc
+
+        async def fetch(mbpkgid):
+            node = HVNodeResult(mbpkgid)
+            await asyncio.gather(
+                *[call(node, endpoint) for endpoint in endpoints])
+            return node
+
+        tasks = [asyncio.ensure_future(fetch(mbpkgid))
+                 for mbpkgid in mbpkgids]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            # the consumer stopped early, don't leave requests running
+            for task in tasks:
+                task.cancel()
+
+    @returns(Location)
     async def locations(self):
         """Rewriting the dictionary into a list
         Also adding a key to each location named 'country'
         based off the name value
         """
+        return await self._cached(('locations',), self._locations)
+
+    async def _locations(self):
+        """Uncached locations()"""
         locs_resp = await self.connection('/cloud/locations/')
         locations = []
-        locs_dict = json.loads(locs_resp)
+        locs_dict = locs_resp.json()
         for loc_key in locs_dict:
-            # just add the country from part of the name afer comma
-            locs_dict[loc_key]['country'] = (
-                locs_dict[loc_key]['name']
-                .split(',')[1].replace(" ", "")
+            # just add the country from part of the name afer comma, on a
+            # copy as a coalesced response is shared with other callers
+            location = dict(locs_dict[loc_key])
+            location['country'] = (
+                location['name'].split(',')[1].replace(" ", "")
             )
             # put in list
-            locations.append(locs_dict[loc_key])
-
-        # update the response object so we can return it as a list
-        # like other response objects. TODO: Update api to return a list
-        # pylint: disable=protected-access
-        return json.dumps(locations)
-
-    async def os_list(self):
-        """TODO"""
-        return await self.connection('/cloud/images/')
-
-    async def plans(self, location=False):
-        """TODO"""
-        if location:
-            return await self.connection('/cloud/sizes/' + str(location))
-        return await self.connection('/cloud/sizes/')
+            locations.append(location)
 
-    async def servers(self, mbpkgid=False):
-        """TODO"""
-        if mbpkgid:
-            return await self.connection('/cloud/server/' + str(mbpkgid))
-        return await self.connection('/cloud/servers/')
-
-    async def packages(self, mbpkgid=False):
-        """TODO"""
-        if mbpkgid:
-            return await self.connection('/cloud/package/' + str(mbpkgid))
-        return await self.connection('/cloud/packages')
-
-    async def ipv4(self, mbpkgid):
-        """TODO"""
-        return await self.connection('/cloud/ipv4/' + str(mbpkgid))
-
-    async def ipv6(self, mbpkgid):
-        """TODO"""
-        return await self.connection('/cloud/ipv6/' + str(mbpkgid))
-
-    async def networkips(self, mbpkgid):
-        """TODO"""
-        return await self.connection('/cloud/networkips/' + str(mbpkgid))
-
-    async def summary(self, mbpkgid):
-        """TODO"""
-        return await self.connection('/cloud/serversummary/' + str(mbpkgid))
-
-    async def start(self, mbpkgid):
-        """TODO"""
-        return await self.connection(
-            '/cloud/server/start/{0}'.format(mbpkgid), method='POST')
-
-    async def shutdown(self, mbpkgid, force=False):
-        """TODO"""
-        params = {}
-        if force:
-            params['force'] = 1
-        return await self.connection(
-            '/cloud/server/shutdown/{0}'.format(mbpkgid), data=params, method='POST')
-
-    async def reboot(self, mbpkgid, force=False):
-        """TODO"""
-        params = {}
-        if force:
-            params['force'] = 1
-        return await self.connection(
-            '/cloud/server/reboot/{0}'.format(mbpkgid), data=params,
-            method='POST')
-
-    async def rescue(self, mbpkgid, password):
-        """TODO"""
-        params = {'rescue_pass': str(password)}
-        return await self.connection(
-            '/cloud/server/start_rescue/{0}'.format(mbpkgid), data=params,
-            method='POST')
-
-    async def rescue_stop(self, mbpkgid):
-        """TODO"""
-        return await self.connection(
-            '/cloud/server/stop_rescue/{0}'.format(mbpkgid), method='POST')
-
-    # pylint: disable=too-many-arguments
-    async def build(self, site, image, fqdn, passwd, mbpkgid):
-        """TODO"""
-        params = {'fqdn': fqdn, 'mbpkgid': mbpkgid,
-                  'image': image, 'location': site,
-                  'password': passwd}
-
-        return await self.connection(
-            '/cloud/server/build/', data=params, method='POST')
-
-    async def delete(self, mbpkgid, extra_params=None):
-        """TODO"""
-        if extra_params is not None:
-            extra_params['mbpkgid'] = mbpkgid
-            return await self.connection(
-                '/cloud/server/delete', data=extra_params, method='POST'
-            )
-        return await self.connection(
-            '/cloud/server/delete/{0}'.format(mbpkgid), method='POST'
-        )
-
-    async def unlink(self, mbpkgid):
-        """TODO"""
-        return await self.connection(
-            '/cloud/unlink/{0}'.format(mbpkgid), method='POST')
-
-    async def status(self, mbpkgid):
-        """TODO"""
-        return await self.connection('/cloud/status/{0}'.format(mbpkgid))
-
-    async def bandwidth_report(self, mbpkgid):
-        """TODO"""
-        return await self.connection('/cloud/servermonthlybw/' + str(mbpkgid))
-
-    async def cancel(self, mbpkgid):
-        """TODO"""
-        return await self.connection(
-            '/cloud/cancel/{0}'.format(mbpkgid), method='POST')
-
-    async def buy(self, plan):
-        """TODO"""
-        return await self.connection('/cloud/buy/' + plan)
-
-    async def buy_build(self, params):
-        """TODO"""
-        return await self.connection(
-            '/cloud/buy_build/', data=params, method='POST')
+        # return a new response holding the list like other response
+        # objects. TODO: Update api to return a list
+        return JSONText.from_value(locations,
+                                   status_code=locs_resp.status_code)
 
-    async def get_job(self, mbpkgid, job_id):
-        """Gets all server jobs for this mbpkgid with the provided jobid
-
-        TODO:   update get_job and get_jobs to be more explicit
-                This will require an api change
-        """
-        params = {'job_id': job_id, 'mbpkgid': mbpkgid}
-        return await self.connection('/cloud/serverjob/', data=params)
-
-    async def get_jobs(self, mbpkgid):
-        """Gets all server jobs for this mbpkgid
-
-        TODO:   update get_job and get_jobs to be more explicit
-                This will require an api change
-        """
-        params = {'mbpkgid': mbpkgid}
-        return await self.connection('/cloud/serverjobs/', data=params)
-
-    async def bgp_sessions(self, session_id=False):
-        """
-            Retrieve BGP session information
-        """
-        if session_id:
-            return await self.connection('/cloud/bgpsession2/' + str(session_id))
-        return await self.connection('/cloud/bgpsessions2')
+    async def _aiter(self, url, data=None, chunk_size=CHUNK_SIZE):
+        """Stream a list endpoint, yielding one parsed record at a time"""
+        response = await self.connection(url, data=data, stream=True)
+        try:
+            async for item in aiter_items(
+                    response.iter_chunked(chunk_size)):
+                yield item
+        finally:
+            response.release()
 
-    async def bgp_summary(self):
-        """
-            Retrieve BGP session summary
-        """
-        return await self.connection('/cloud/bgpsummary')
 
-    async def bgp_create_sessions(self, mbpkgid, group_id, ipv6=True, redundant=False):
-        """
-            Build BGP sessions for a node in a given BGP group
-        """
-        params = { "group_id": group_id }
-        if ipv6:
-            params['ipv6'] = 1
-        if redundant:
-            params['redundant'] = 1
-        return await self.connection(
-            '/cloud/bgpcreatesessions/{0}'.format(mbpkgid), data=params, method='POST'
-        )
\ No newline at end of file
+install(NetActuateNodeDriver, asynchronous=True)
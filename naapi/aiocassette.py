@@ -0,0 +1,128 @@
+"""Record and replay cassettes with the naapi.aioapi driver
+
+The asyncio counterparts of naapi.cassette.RecordingTransport and
+ReplayTransport, writing and reading the same cassette files:
+
+    replay = AsyncReplayTransport('fleet.cassette', latency=uniform(0.02, 0.2),
+                                  concurrency=50)
+    async with NetActuateNodeDriver('any', transport=replay) as conn:
+        await conn.servers()
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+from .aiotransports import AsyncStreamedResponse, make_transport
+from .cassette import (REDACT, Cassette, Recorder, Replayer, ReplayError,
+                       ReplayTimeout)
+from .response import JSONText
+
+
+def _streamed(status, headers, content):
+    """An AsyncStreamedResponse over a body already in memory"""
+    async def chunks(chunk_size):
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+    async def read():
+        return content.decode('utf-8')
+
+    return AsyncStreamedResponse(status, headers, chunks, read,
+                                 lambda: None)
+
+
+class AsyncRecordingTransport:
+    """Records every exchange of another asyncio transport to a cassette
+
+    transport is as for the driver and defaults to aiohttp. Streamed GETs
+    are read in full and handed to the driver from memory. close()
+    finishes the cassette.
+    """
+    def __init__(self, path, transport=None, redact=REDACT, **kwargs):
+        self.transport, self._owns_transport = make_transport(transport,
+                                                              **kwargs)
+        self.errors = self.transport.errors
+        self.timeouts = self.transport.timeouts
+        self.recorder = Recorder(path, redact)
+
+    def get_session(self):
+        """The wrapped transport's session, for the driver"""
+        get_session = getattr(self.transport, 'get_session', None)
+        return get_session() if get_session is not None else None
+
+    async def request(self, method, url, body=None, headers=None,
+                      stream=False):
+        """Send one request through the wrapped transport and record it"""
+        start = time.perf_counter()
+        response = await self.transport.request(
+            method, url, body=body, headers=headers, stream=stream)
+        if stream:
+            text = await response.text()
+            response.release()
+        else:
+            text = str.__str__(response)
+        elapsed = time.perf_counter() - start
+        self.recorder.record(method, url, body, response.status_code,
+                             response.headers, text.encode('utf-8'),
+                             elapsed)
+        if stream:
+            return _streamed(response.status_code, response.headers,
+                             text.encode('utf-8'))
+        return response
+
+    async def close(self):
+        """Finish the cassette and close the wrapped transport if ours"""
+        self.recorder.close()
+        if self._owns_transport:
+            await self.transport.close()
+
+
+class AsyncReplayTransport:
+    """Serves a cassette back to the naapi.aioapi driver without a network
+
+    The arguments are those of naapi.cassette.ReplayTransport, delays are
+    slept with asyncio.sleep() so replayed requests overlap like real ones
+    """
+    errors = (ReplayError,)
+    timeouts = (ReplayTimeout,)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, cassette, latency=None, error_rate=0.0,
+                 error_statuses=(500, 502, 503), timeout_rate=0.0,
+                 concurrency=None, seed=0, redact=REDACT):
+        self._owns_cassette = not isinstance(cassette, Cassette)
+        self.replayer = Replayer(cassette, latency, error_rate,
+                                 error_statuses, timeout_rate, seed, redact)
+        self.concurrency = concurrency
+        # made on first use, inside the running loop
+        self._slots = None
+
+    async def _serve(self, method, url, body):
+        entry, delay, fault = self.replayer.plan(method, url, body)
+        if delay:
+            await asyncio.sleep(delay)
+        if fault == 'timeout':
+            raise ReplayTimeout("injected timeout for {0}".format(
+                urlsplit(url).path))
+        return self.replayer.response(entry, fault)
+
+    async def request(self, method, url, body=None, headers=None,
+                      stream=False):
+        """Answer one request from the cassette"""
+        if not self.concurrency:
+            status, response_headers, content = await self._serve(
+                method, url, body)
+        else:
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self.concurrency)
+            async with self._slots:
+                status, response_headers, content = await self._serve(
+                    method, url, body)
+        if stream:
+            return _streamed(status, response_headers, content)
+        return JSONText.from_body(content.decode('utf-8'), status,
+                                  response_headers)
+
+    async def close(self):
+        """Unmap the cassette if this transport opened it"""
+        if self._owns_cassette:
+            self.replayer.cassette.close()
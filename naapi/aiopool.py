@@ -0,0 +1,104 @@
+"""Many API keys behind one connection pool, asyncio version
+
+The naapi.aioapi counterpart of naapi.pool.ClientPool: one driver per
+account, all sending through one shared transport, each with its own rate
+limit and concurrency budget.
+
+    async with AsyncClientPool(keys, rate_limit=5, concurrency=4) as pool:
+        result = await pool.merge('bgp_summary')
+        for summary in result.records:
+            print(summary['account'], summary)
+"""
+import asyncio
+from .aioapi import NetActuateNodeDriver
+from .aiotransports import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT,
+                            make_transport)
+from .pool import (DEFAULT_CONCURRENCY, PoolResult, account_keys,
+                   account_rate_limit)
+
+
+class AsyncClientPool:
+    """One naapi.aioapi driver per account over a shared transport
+
+    keys is {account: API key} or a list of keys. rate_limit (requests per
+    second, or a TokenBucket used as a template) and concurrency apply to
+    each account on its own. limit is the size of the shared connection
+    pool and defaults to every account's budget at once. Other keyword
+    arguments are passed to each driver.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, keys, rate_limit=None,
+                 concurrency=DEFAULT_CONCURRENCY, transport=None, limit=None,
+                 **driver_kwargs):
+        keys = account_keys(keys)
+        self.concurrency = concurrency
+        self.limit = limit or max(1, concurrency * len(keys))
+        self.transport, self._owns_transport = make_transport(
+            transport, limit=self.limit, limit_per_host=self.limit,
+            connect_timeout=driver_kwargs.get('connect_timeout',
+                                              DEFAULT_CONNECT_TIMEOUT),
+            read_timeout=driver_kwargs.get('read_timeout',
+                                           DEFAULT_READ_TIMEOUT))
+        self.drivers = dict(
+            (account, NetActuateNodeDriver(
+                key, rate_limit=account_rate_limit(rate_limit),
+                transport=self.transport, **driver_kwargs))
+            for account, key in keys.items())
+        # semaphores are made on first use, inside the running loop
+        self._budgets = {}
+
+    def __len__(self):
+        return len(self.drivers)
+
+    def __getitem__(self, account):
+        return self.drivers[account]
+
+    async def __aenter__(self):
+        if hasattr(self.transport, 'get_session'):
+            self.transport.get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Close every driver and the shared transport"""
+        for driver in self.drivers.values():
+            await driver.close()
+        if self._owns_transport:
+            await self.transport.close()
+
+    async def run(self, account, method, *args, **kwargs):
+        """Call a driver method for one account within its budget"""
+        budget = self._budgets.get(account)
+        if budget is None:
+            budget = self._budgets[account] = asyncio.Semaphore(
+                self.concurrency)
+        async with budget:
+            return await getattr(self.drivers[account], method)(
+                *args, **kwargs)
+
+    async def call(self, method, *args, accounts=None, **kwargs):
+        """Call a driver method on every account at once
+
+        Returns {account: response}, an account whose call raised maps to
+        the exception
+        """
+        accounts = list(self.drivers if accounts is None else accounts)
+        responses = await asyncio.gather(
+            *(self.run(account, method, *args, **kwargs)
+              for account in accounts),
+            return_exceptions=True)
+        return dict(zip(accounts, responses))
+
+    async def merge(self, method, *args, accounts=None, **kwargs):
+        """call() and merge every account's records into one PoolResult"""
+        result = PoolResult()
+        responses = await self.call(method, *args, accounts=accounts,
+                                    **kwargs)
+        for account, response in responses.items():
+            if isinstance(response, Exception):
+                result.errors[account] = response
+            else:
+                result.add(account, response)
+        return result
@@ -0,0 +1,205 @@
+"""HTTP transports for the naapi.aioapi driver
+
+The asyncio counterpart of naapi.transports. request() is a coroutine
+returning a naapi.response.JSONText, or for a streamed GET an
+AsyncStreamedResponse with the body still unread.
+
+    aiohttp  one aiohttp ClientSession and TCPConnector, the default
+    httpx    an httpx.AsyncClient, over HTTP/2 when h2 is installed
+             (pip install naapi[httpx])
+"""
+import asyncio
+import aiohttp
+from .response import JSONText
+
+# Connector defaults
+DEFAULT_LIMIT = 100
+DEFAULT_LIMIT_PER_HOST = 0
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 15
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+
+class AsyncStreamedResponse:
+    """A response with its body unread
+
+    iter_chunked(chunk_size) iterates over the body, release() gives the
+    connection back
+    """
+    def __init__(self, status, headers, chunks, read, release):
+        self.status = self.status_code = status
+        self.headers = headers
+        self._chunks = chunks
+        self._read = read
+        self._release = release
+
+    def iter_chunked(self, chunk_size):
+        """Async iterator over the body in chunks of up to chunk_size"""
+        return self._chunks(chunk_size)
+
+    async def text(self):
+        """Read the rest of the body as text"""
+        return await self._read()
+
+    def release(self):
+        """Release the connection"""
+        result = self._release()
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+
+class AiohttpTransport:
+    """Sends requests through one shared aiohttp ClientSession
+
+    The session is created on first use inside the running loop, session
+    is a callable returning the ClientSession to use instead. With
+    shared=False every request opens and closes its own session, which
+    cannot stream.
+    """
+    errors = (aiohttp.ClientError, asyncio.TimeoutError)
+    timeouts = (asyncio.TimeoutError,)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, limit=DEFAULT_LIMIT,
+                 limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                 ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 timeout=None, session=None, shared=True):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout if timeout is not None else \
+            aiohttp.ClientTimeout(sock_connect=DEFAULT_CONNECT_TIMEOUT,
+                                  sock_read=DEFAULT_READ_TIMEOUT)
+        self.shared = shared
+        self._session = None
+        if session is not None:
+            self.get_session = session
+
+    def get_session(self):
+        """Return the shared ClientSession, creating it if needed"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=self.timeout)
+        return self._session
+
+    async def request(self, method, url, body=None, headers=None,
+                      stream=False):
+        """Send one request"""
+        if not self.shared:
+            if stream:
+                raise ValueError("streaming needs a shared session")
+            async with aiohttp.ClientSession(timeout=self.timeout) as session:
+                return await self._request(session, method, url, body,
+                                           headers)
+        if stream:
+            response = await self.get_session().request(
+                method, url, data=body, headers=headers)
+            return AsyncStreamedResponse(
+                response.status, response.headers,
+                response.content.iter_chunked, response.text,
+                response.release)
+        return await self._request(self.get_session(), method, url, body,
+                                   headers)
+
+    # pylint: disable=too-many-arguments
+    @staticmethod
+    async def _request(session, method, url, body, headers):
+        async with session.request(method, url, data=body,
+                                   headers=headers) as response:
+            return JSONText.from_body(await response.text(),
+                                      response.status, response.headers)
+
+    async def close(self):
+        """Close the shared session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class AsyncHttpxTransport:
+    """Sends requests through an httpx.AsyncClient
+
+    http2 needs the h2 package, it is used when installed unless
+    http2=False
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, limit=DEFAULT_LIMIT, keepalive_timeout=None,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, http2=None):
+        # pylint: disable=import-outside-toplevel
+        import httpx
+        if http2 is None:
+            try:
+                # pylint: disable=unused-import
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+        self.errors = (httpx.TransportError,)
+        self.timeouts = (httpx.TimeoutException,)
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(None, connect=connect_timeout,
+                                  read=read_timeout),
+            limits=httpx.Limits(max_connections=limit or None,
+                                max_keepalive_connections=limit or None,
+                                keepalive_expiry=keepalive_timeout))
+
+    async def request(self, method, url, body=None, headers=None,
+                      stream=False):
+        """Send one request"""
+        request = self.client.build_request(method, url, content=body,
+                                            headers=headers)
+        response = await self.client.send(request, stream=stream)
+        if stream:
+            async def read():
+                return (await response.aread()).decode('utf-8')
+            return AsyncStreamedResponse(
+                response.status_code, response.headers,
+                response.aiter_bytes, read, response.aclose)
+        return JSONText.from_body(response.text, response.status_code,
+                                  response.headers)
+
+    async def close(self):
+        """Close the client and its connections"""
+        await self.client.aclose()
+
+
+TRANSPORTS = ('aiohttp', 'httpx')
+
+
+# pylint: disable=too-many-arguments
+def make_transport(transport, limit=DEFAULT_LIMIT,
+                   limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                   ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+                   keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                   connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                   read_timeout=DEFAULT_READ_TIMEOUT):
+    """Turn a driver's transport argument into (transport, owned)
+
+    transport is a name from TRANSPORTS, None for aiohttp, or a transport
+    instance which stays its owner's to close
+    """
+    if transport is None or transport == 'aiohttp':
+        return AiohttpTransport(
+            limit=limit, limit_per_host=limit_per_host,
+            ttl_dns_cache=ttl_dns_cache,
+            keepalive_timeout=keepalive_timeout,
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                          sock_read=read_timeout)), True
+    if transport == 'httpx':
+        return AsyncHttpxTransport(
+            limit=limit, keepalive_timeout=keepalive_timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout), True
+    if isinstance(transport, str):
+        raise ValueError("Unknown transport {0}".format(transport))
+    return transport, False
@@ -2,39 +2,137 @@
 
 Author: Dennis Durling<djdtahoe@gmail.com>
 """
-import json
-import requests as rq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+from . import jsonlib
+from .bulk import BulkResult, check_operation, schedule, server_locations
+from .cache import FRESH, STALE, make_cache
+from .endpoints import install
+from .exceptions import (NetActuateException, CONNECTION_ERROR,
+                         TIMEOUT)
+from .hedge import make_breaker, make_hedge
+from .metrics import body_size, endpoint_template, make_instrumentation
+from .models import Location, returns
+from .ratelimit import (make_limiter, make_retry, parse_retry_after,
+                        retries_exhausted)
+from .response import Response
+from .singleflight import SingleFlight
+from .stream import CHUNK_SIZE, iter_items
+from .transports import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_CONNECTIONS,
+                         DEFAULT_POOL_MAXSIZE, DEFAULT_READ_TIMEOUT,
+                         RequestsTransport, make_transport)
+from .util import api_root
 
 API_HOSTS = {
     'v1': 'vapi.netactuate.com',
 }
 
-class NetActuateException(Exception):
-    """TODO"""
-    def __init__(self, code, message):
-        self.code = code
-        self.message = message
-        self.args = (code, message)
-        super(NetActuateException, self).__init__()
-
-    def __str__(self):
-        return self.__repr__()
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# pylint: disable=too-many-arguments
+def connection(key, api_version, session=None, timeout=None,
+               coalesce=None, limiter=None, retry=None,
+               instrument=None, host=None, transport=None, hedge=None,
+               breaker=None):
+    """Return the request method below pre-configured
+
+    Requests are sent with transport, a naapi.transports transport. Without
+    one they go through a naapi.transports.RequestsTransport on session (or
+    a new pooled session) with timeout, (connect, read) or a number.
+    With coalesce, a naapi.singleflight.SingleFlight, concurrent identical
+    GETs share one request. POSTs are never coalesced.
+    limiter is a naapi.ratelimit.TokenBucket every attempt waits on and
+    retry a naapi.ratelimit.RetryPolicy, a request still failing once its
+    retries are used up raises NetActuateException.
+    instrument is a naapi.metrics.Instrumentation told about every request
+    sent, coalesced GETs that share a request are reported once.
+    host overrides the API host, see naapi.util.api_root().
+    hedge is a naapi.hedge.HedgePolicy duplicating slow GETs and breaker a
+    naapi.hedge.CircuitBreaker failing calls to a failing endpoint fast.
+    """
+    if transport is None:
+        transport = RequestsTransport(session=session, timeout=timeout)
+    root_url = api_root(API_HOSTS, api_version, host)
+    # the key is encoded once, the rest of the query per request
+    key_query = '?' + urlencode({'key': key})
+
+    def send(path, url_root, data, method, stream=False):
+        if instrument is None:
+            return attempt_send(url_root, data, method, stream)
+        info = instrument.start(path, method)
+        try:
+            response = attempt_send(url_root, data, method, stream, info)
+        except NetActuateException as exc:
+            instrument.finish(info, exc.status, retries=exc.attempts - 1,
+                              error=exc.code)
+            raise
+        except Exception as exc:
+            instrument.finish(info, retries=info.retries,
+                              error=type(exc).__name__)
+            raise
+        instrument.finish(info, response.status_code,
+                          body_size(response.headers, None if stream
+                                    else response.content),
+                          retries=info.retries)
+        return response
 
-    def __repr__(self):
-        return (
-            "<NetActuateException in {0} : {1}>"
-            .format(self.code, self.message)
-        )
-
-def connection(key, api_version):
-    """TODO"""
-    __key__ = key
-    if api_version in API_HOSTS.keys():
-        root_url = 'https://{0}'.format(API_HOSTS[api_version])
-    else:
-        root_url = 'https://{0}'.format(API_HOSTS['v1'])
-
-    def request(url, data=None, method=None):
+    def attempt_send(url_root, data, method, stream, info=None):
+        # POST bodies are encoded once for every attempt
+        body, headers = (None, None) if method == 'GET' \
+            else (jsonlib.dumpb(data), JSON_HEADERS)
+        attempt = 0
+        while True:
+            if info is not None:
+                info.retries = attempt
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                response = transport.request(method, url_root, body=body,
+                                             headers=headers, stream=stream)
+            except transport.errors as exc:
+                if retry is None or not retry.retry_error(method, attempt):
+                    code = TIMEOUT if isinstance(exc, transport.timeouts) \
+                        else CONNECTION_ERROR
+                    # never let the url, and so the key, into the message
+                    raise NetActuateException(
+                        code, type(exc).__name__, attempts=attempt + 1)
+                time.sleep(retry.delay(attempt))
+                attempt += 1
+                continue
+            if retry is None or response.status_code not in retry.statuses:
+                return response
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+            if not retry.retry_status(method, response.status_code, attempt):
+                if attempt >= retry.retries:
+                    body = response.content
+                    response.close()
+                    raise retries_exhausted(
+                        response.status_code, body, attempt + 1,
+                        retry_after)
+                return response
+            response.close()
+            time.sleep(retry.delay(attempt, retry_after))
+            attempt += 1
+
+    def guarded(endpoint, fetch):
+        if breaker is None:
+            return fetch()
+        return breaker.call(endpoint, fetch)
+
+    def hedged(endpoint, fetch):
+        if hedge is None:
+            return fetch()
+        return hedge.call(endpoint, fetch)
+
+    def request(url, data=None, method=None, stream=False):
+        """Send a request and return the response
+
+        With stream the body of a GET is left unread for the caller to
+        consume with iter_content(), it is never coalesced or hedged
+        """
         if method is None:
             method = 'GET'
         if data is None:
@@ -43,42 +141,286 @@ def connection(key, api_version):
             url = '/{0}'.format(url)
 
         # build full url
-        url_root = '{0}{1}?key={2}'.format(root_url, url, __key__)
+        url_root = root_url + url + key_query
+        endpoint = endpoint_template(url) \
+            if hedge is not None or breaker is not None else None
+
+        if method == 'GET':
+            if data:
+                url_root = url_root + '&' + urlencode(data)
+            if stream:
+                return guarded(endpoint, lambda: send(
+                    url, url_root, data, method, stream=True))
+
+            def get():
+                return guarded(endpoint, lambda: hedged(
+                    endpoint, lambda: send(url, url_root, data, method)))
+
+            if coalesce is not None:
+                return coalesce.do(url_root, get)
+            return get()
+        return guarded(endpoint, lambda: send(url, url_root, data, method))
 
-        try:
-            if method == 'GET':
-                for key, value in data.items():
-                    url_root = "{0}&{1}={2}".format(url_root, key, value)
-                response = rq.get(url_root)
-            elif method == 'POST':
-                response = rq.post(url_root, json=data)
-        except rq.HTTPError:
-            raise NetActuateException(
-                response.status_code, response.content)
+    return request
 
-        return response
+# pylint: disable=too-few-public-methods
+class BatchResult(object):
+    """Outcome of one call made by NetActuateNodeDriver.batch()
+
+    Holds either the call's result or the exception it raised
+    """
+    def __init__(self, index, method, args, kwargs):
+        self.index = index
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exception = None
+
+    @property
+    def ok(self):
+        """True when the call did not raise"""
+        return self.exception is None
 
-    return request
+    def __repr__(self):
+        return "<BatchResult {0}{1} ok={2}>".format(
+            self.method, self.args, self.ok)
+
+def _batch_call(call):
+    """Normalize a batch call spec to (method, args, kwargs)
+
+    A spec is a method name, or a (method, args) or (method, args, kwargs)
+    tuple where args may be a single value instead of a tuple
+    """
+    if isinstance(call, str):
+        return call, (), {}
+    method, args = call[0], call[1] if len(call) > 1 else ()
+    kwargs = call[2] if len(call) > 2 else {}
+    if not isinstance(args, (tuple, list)):
+        args = (args,)
+    return method, tuple(args), dict(kwargs)
 
 # pylint: disable=too-many-public-methods
 class NetActuateNodeDriver():
-    """Todo"""
+    """Synchronous NetActuate API driver
+
+    The driver owns a single keep-alive transport, by default a
+    requests.Session, that is shared by every call, including calls made
+    from several threads at once. Close it with close() or use the driver
+    as a context manager. The endpoint methods are generated from
+    naapi.endpoints.ENDPOINTS.
+    """
     name = 'NetActuate'
     website = 'http://www.netactuate.com'
 
-    def __init__(self, key, api_version=None):
+    # pylint: disable=too-many-arguments, too-many-locals
+    def __init__(self, key, api_version=None,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, session=None,
+                 cache=None, coalesce=False, rate_limit=None, retry=True,
+                 typed=False, instrument=None, host=None, transport=None,
+                 hedge=None, breaker=None):
         if api_version is None:
             self.api_version = 'v1'
         else:
             self.api_version = api_version
         self.key = key
-        self.connection = connection(self.key, api_version=api_version)
+        # return naapi.models records instead of raw responses
+        self.typed = typed
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        # transport is a naapi.transports name or instance, an instance or
+        # a session handed in by the caller is theirs to close
+        self.transport, self._owns_transport = make_transport(
+            transport, session=session, timeout=self.timeout,
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            pool_block=pool_block)
+        self.session = getattr(self.transport, 'session', None)
+        # concurrent identical GETs share one request when coalesce is set
+        self.singleflight = SingleFlight() if coalesce else None
+        # rate_limit is requests per second or a shared TokenBucket
+        self.limiter = make_limiter(rate_limit)
+        self.retry = make_retry(retry)
+        # instrument is True or a shared naapi.metrics.Instrumentation
+        self.instrument = make_instrumentation(instrument)
+        # hedge is True, a percentile or a shared naapi.hedge.HedgePolicy,
+        # breaker True, a failure count or a shared CircuitBreaker
+        self.hedge = make_hedge(hedge, pool_maxsize=pool_maxsize)
+        self._owns_hedge = self.hedge is not None and self.hedge is not hedge
+        self.breaker = make_breaker(breaker)
+        self.connection = connection(self.key, api_version=api_version,
+                                     coalesce=self.singleflight,
+                                     limiter=self.limiter,
+                                     retry=self.retry,
+                                     instrument=self.instrument,
+                                     host=host,
+                                     transport=self.transport,
+                                     hedge=self.hedge,
+                                     breaker=self.breaker)
+        # opt-in naapi.cache.TTLCache for the catalog endpoints
+        self.cache = make_cache(cache)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Release the pooled connections held by this driver"""
+        if self._owns_hedge:
+            self.hedge.close()
+        if self._owns_transport:
+            self.transport.close()
+
+    def _cached(self, key, fetch):
+        """Serve key from the catalog cache, calling fetch() to fill it
+
+        A stale entry is returned right away and refreshed on a background
+        thread. Only successful responses are cached.
+        """
+        if self.cache is None:
+            return fetch()
+        value, state = self.cache.lookup(key)
+        if state == FRESH:
+            return value
+        if state == STALE:
+            if self.cache.start_refresh(key):
+                thread = threading.Thread(target=self._refresh,
+                                          args=(key, fetch))
+                thread.daemon = True
+                thread.start()
+            return value
+        value = fetch()
+        if getattr(value, 'ok', False):
+            self.cache.store(key, value)
+        return value
+
+    def _refresh(self, key, fetch):
+        """Background refresh of a stale cache entry"""
+        try:
+            value = fetch()
+            if getattr(value, 'ok', False):
+                self.cache.store(key, value)
+        # pylint: disable=broad-except
+        except Exception:
+            # keep serving the stale entry, the next lookup retries
+            pass
+        finally:
+            self.cache.end_refresh(key)
+
+    # pylint: disable=too-many-arguments, too-many-locals
+    def bulk(self, operation, mbpkgids, max_workers=None, stagger=None,
+             progress=None, **kwargs):
+        """Run a lifecycle operation such as reboot over many nodes
+
+        operation is one of naapi.bulk.BULK_OPERATIONS and kwargs are
+        passed to it, eg force=True. Calls run on up to max_workers
+        threads. With stagger nodes in one location are dispatched stagger
+        seconds apart (locations are looked up with servers()).
+        progress(result, done, total) is called from the worker thread as
+        each node finishes. Returns a naapi.bulk.BulkResult per node in
+        input order, with the job id to wait on when the API returned one.
+        """
+        check_operation(operation)
+        mbpkgids = list(mbpkgids)
+        locations = server_locations(self.servers()) if stagger else {}
+        results = [None] * len(mbpkgids)
+        lock = threading.Lock()
+        finished = []
+
+        def run(index, mbpkgid, location):
+            result = results[index] = BulkResult(mbpkgid, operation,
+                                                 location)
+            try:
+                result.set_response(
+                    getattr(self, operation)(mbpkgid, **kwargs))
+            # pylint: disable=broad-except
+            except Exception as exc:
+                result.exception = exc
+            if progress is not None:
+                with lock:
+                    finished.append(result)
+                    done = len(finished)
+                progress(result, done, len(mbpkgids))
+            return result
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers or self.pool_maxsize) as executor:
+            for delay, index, mbpkgid, location in schedule(
+                    mbpkgids, locations, stagger):
+                wait = start + delay - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                executor.submit(run, index, mbpkgid, location)
+        return results
+
+    def _submit_batch(self, executor, calls):
+        """Submit every call to executor, return {future: BatchResult}"""
+        specs = [_batch_call(call) for call in calls]
+        for method, _, _ in specs:
+            if not callable(getattr(self, method, None)):
+                raise ValueError("Unknown method {0}".format(method))
+        futures = {}
+        for index, (method, args, kwargs) in enumerate(specs):
+            batch_result = BatchResult(index, method, args, kwargs)
+            future = executor.submit(getattr(self, method), *args, **kwargs)
+            futures[future] = batch_result
+        return futures
+
+    @staticmethod
+    def _finish_batch(future, batch_result):
+        """Move the future's outcome onto its BatchResult"""
+        exception = future.exception()
+        if exception is None:
+            batch_result.result = future.result()
+        else:
+            batch_result.exception = exception
+        return batch_result
+
+    def batch(self, calls, max_workers=None):
+        """Run many driver calls on a thread pool, results in input order
 
+        calls is a list like [('status', mbpkgid), ('bandwidth_report',
+        (mbpkgid,))], see _batch_call. All threads share this driver's
+        session, max_workers defaults to pool_maxsize so no thread waits
+        on a connection. Returns a BatchResult per call, a call that
+        raised has its exception set instead of stopping the batch.
+        """
+        calls = list(calls)
+        with ThreadPoolExecutor(max_workers or self.pool_maxsize) as executor:
+            futures = self._submit_batch(executor, calls)
+            results = [None] * len(calls)
+            for future, batch_result in futures.items():
+                results[batch_result.index] = self._finish_batch(
+                    future, batch_result)
+        return results
+
+    def batch_as_completed(self, calls, max_workers=None):
+        """Like batch() but yield each BatchResult as soon as it finishes"""
+        calls = list(calls)
+        with ThreadPoolExecutor(max_workers or self.pool_maxsize) as executor:
+            futures = self._submit_batch(executor, calls)
+            try:
+                for future in as_completed(futures):
+                    yield self._finish_batch(future, futures[future])
+            finally:
+                # the consumer stopped early, drop calls not yet started
+                for future in futures:
+                    future.cancel()
+
+    @returns(Location)
     def locations(self):
         """Rewriting the dictionary into a list
         Also adding a key to each location named 'country'
         based off the name value
         """
+        return self._cached(('locations',), self._locations)
+
+    def _locations(self):
+        """Uncached locations()"""
         locs_resp = self.connection('/cloud/locations/')
         locations = []
         locs_dict = locs_resp.json()
@@ -89,188 +431,28 @@ class NetActuateNodeDriver():
                 return locs_dict
 
         for loc_key in locs_dict:
-            # just add the country from part of the name afer comma
-            locs_dict[loc_key]['country'] = (
-                locs_dict[loc_key]['name']
-                .split(',')[1].replace(" ", "")
+            # just add the country from part of the name afer comma, on a
+            # copy as a coalesced response is shared with other callers
+            location = dict(locs_dict[loc_key])
+            location['country'] = (
+                location['name'].split(',')[1].replace(" ", "")
             )
             # put in list
-            locations.append(locs_dict[loc_key])
-
-        # update the response object so we can return it as a list
-        # like other response objects. TODO: Update api to return a list
-        # pylint: disable=protected-access
-        locs_resp._content = json.dumps(locations).encode()
-        return locs_resp
-
-    def os_list(self):
-        """Todo"""
-        return self.connection('/cloud/images/')
-
-    def plans(self, location=False):
-        """Todo"""
-        if location:
-            return self.connection('/cloud/sizes/' + str(location))
-        return self.connection('/cloud/sizes/')
-
-    def servers(self, mbpkgid=False):
-        """Todo"""
-        if mbpkgid:
-            return self.connection('/cloud/server/' + str(mbpkgid))
-        return self.connection('/cloud/servers/')
-
-    def packages(self, mbpkgid=False):
-        """Todo"""
-        if mbpkgid:
-            return self.connection('/cloud/package/' + str(mbpkgid))
-        return self.connection('/cloud/packages')
-
-    def ipv4(self, mbpkgid):
-        """Todo"""
-        return self.connection('/cloud/ipv4/' + str(mbpkgid))
-
-    def ipv6(self, mbpkgid):
-        """Todo"""
-        return self.connection('/cloud/ipv6/' + str(mbpkgid))
-
-    def networkips(self, mbpkgid):
-        """Todo"""
-        return self.connection('/cloud/networkips/' + str(mbpkgid))
-
-    def summary(self, mbpkgid):
-        """Todo"""
-        return self.connection('/cloud/serversummary/' + str(mbpkgid))
-
-    def start(self, mbpkgid):
-        """Todo"""
-        return self.connection(
-            '/cloud/server/start/{0}'.format(mbpkgid), method='POST')
-
-    def shutdown(self, mbpkgid, force=False):
-        """Todo"""
-        params = {}
-        if force:
-            params['force'] = 1
-        return self.connection(
-            '/cloud/server/shutdown/{0}'.format(mbpkgid), data=params, method='POST')
-
-    def reboot(self, mbpkgid, force=False):
-        """Todo"""
-        params = {}
-        if force:
-            params['force'] = 1
-        return self.connection(
-            '/cloud/server/reboot/{0}'.format(mbpkgid), data=params,
-            method='POST')
-
-    def rescue(self, mbpkgid, password):
-        """Todo"""
-        params = {'rescue_pass': str(password)}
-        return self.connection(
-            '/cloud/server/start_rescue/{0}'.format(mbpkgid), data=params,
-            method='POST')
-
-    def rescue_stop(self, mbpkgid):
-        """Todo"""
-        return self.connection(
-            '/cloud/server/stop_rescue/{0}'.format(mbpkgid), method='POST')
-
-    # pylint: disable=too-many-arguments
-    def build(self, site, image, fqdn, passwd, mbpkgid):
-        """Todo"""
-        params = {'fqdn': fqdn, 'mbpkgid': mbpkgid,
-                  'image': image, 'location': site,
-                  'password': passwd}
-
-        return self.connection(
-            '/cloud/server/build/', data=params, method='POST')
-
-    def delete(self, mbpkgid, extra_params=None):
-        """Delete the vm
-        If extra_params which defaults to cancel_billing=False
-        add mbpkgid to extra_params and pass params, otherwise
-        pass just the url with the mbpkgid
-        Ansible role 'node.py' passes cancel_billing by default
-        """
-        if extra_params is not None:
-            extra_params['mbpkgid'] = mbpkgid
-            return self.connection(
-                '/cloud/server/delete/{0}'.format(mbpkgid), data=extra_params, method='POST'
-            )
-        return self.connection(
-            '/cloud/server/delete/{0}'.format(mbpkgid), method='POST'
-        )
-
-    def unlink(self, mbpkgid):
-        """Todo"""
-        return self.connection(
-            '/cloud/unlink/{0}'.format(mbpkgid), method='POST')
-
-    def status(self, mbpkgid):
-        """Todo"""
-        return self.connection('/cloud/status/{0}'.format(mbpkgid))
-
-    def bandwidth_report(self, mbpkgid):
-        """Todo"""
-        return self.connection('/cloud/servermonthlybw/' + str(mbpkgid))
-
-    def cancel(self, mbpkgid):
-        """Todo"""
-        return self.connection(
-            '/cloud/cancel/{0}'.format(mbpkgid), method='POST'
-        )
-
-    def buy(self, plan):
-        """Todo"""
-        return self.connection('/cloud/buy/' + plan)
-
-    def buy_build(self, params):
-        """Todo"""
-        return self.connection(
-            '/cloud/buy_build/', data=params, method='POST'
-        )
-
-    def get_job(self, mbpkgid, job_id):
-        """Gets all server jobs for this mbpkgid with the provided jobid
-
-        TODO:   update get_job and get_jobs to be more explicit
-                This will require an api change
-        """
-        params = {'job_id': job_id, 'mbpkgid': mbpkgid}
-        return self.connection('/cloud/serverjob/', data=params)
-
-    def get_jobs(self, mbpkgid):
-        """Gets all server jobs for this mbpkgid
+            locations.append(location)
 
-        TODO:   update get_job and get_jobs to be more explicit
-                This will require an api change
-        """
-        params = {'mbpkgid': mbpkgid}
-        return self.connection('/cloud/serverjobs/', data=params)
+        # return a new response holding the list like other response
+        # objects. TODO: Update api to return a list
+        return Response.from_value(locations,
+                                   status_code=locs_resp.status_code)
 
-    def bgp_sessions(self, session_id=False):
-        """
-            Retrieve BGP session information
-        """
-        if session_id:
-            return self.connection('/cloud/bgpsession2/' + str(session_id))
-        return self.connection('/cloud/bgpsessions2')
+    def _iter(self, url, data=None, chunk_size=CHUNK_SIZE):
+        """Stream a list endpoint, yielding one parsed record at a time"""
+        response = self.connection(url, data=data, stream=True)
+        try:
+            for item in iter_items(response.iter_content(chunk_size)):
+                yield item
+        finally:
+            response.close()
 
-    def bgp_summary(self):
-        """
-            Retrieve BGP session summary
-        """
-        return self.connection('/cloud/bgpsummary')
 
-    def bgp_create_sessions(self, mbpkgid, group_id, ipv6=True, redundant=False):
-        """
-            Build BGP sessions for a node in a given BGP group
-        """
-        params = { "group_id": group_id }
-        if ipv6:
-            params['ipv6'] = 1
-        if redundant:
-            params['redundant'] = 1
-        return self.connection(
-            '/cloud/bgpcreatesessions/{0}'.format(mbpkgid), data=params, method='POST'
-        )
\ No newline at end of file
+install(NetActuateNodeDriver)
@@ -0,0 +1,419 @@
+"""Fleet bandwidth reports as columns with vectorized rollups
+
+collect() (or acollect() with the asyncio driver) fetches
+bandwidth_report() for every node concurrently and appends each report
+straight into a FleetBandwidth: one row per node and month, held in
+columns of NumPy arrays when NumPy is installed and array.array
+otherwise. Location, package and month are stored as integer codes into
+label lists, so rollups are a bincount over the codes and percentiles and
+top talkers work on whole columns instead of looping over dicts.
+
+    fleet = collect(conn)
+    fleet.rollup('location').write_csv(sys.stdout)
+    fleet.percentiles((50, 95, 99))
+    fleet.top(10).write_ndjson(fp)
+"""
+import csv
+import heapq
+import time
+from array import array
+from . import jsonlib
+from .exceptions import NetActuateException, API_ERROR
+from .util import decode
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Keys tried in order on each report record
+MONTH_KEYS = ('month', 'date', 'period', 'day_date')
+RX_KEYS = ('rx', 'in', 'bytes_in', 'inbound', 'received')
+TX_KEYS = ('tx', 'out', 'bytes_out', 'outbound', 'sent')
+
+# Keys tried in order on each servers() record
+LOCATION_KEYS = ('location', 'location_id')
+PACKAGE_KEYS = ('plan', 'package', 'plan_id')
+
+# Columns that can be grouped on and measured
+GROUPS = ('location', 'package', 'month')
+MEASURES = ('rx', 'tx', 'total')
+
+
+def _first(record, keys, default=None):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    return default
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def month_totals(report, month=None):
+    """Sum one bandwidth_report() by month, return {month: [rx, tx]}
+
+    Records without a date count towards month, by default the current
+    one. A report keyed by date is read like a list of its values. An
+    error payload raises NetActuateException.
+    """
+    data = decode(report)
+    if month is None:
+        month = time.strftime('%Y-%m')
+    if isinstance(data, dict):
+        if 'error' in data:
+            raise NetActuateException(
+                API_ERROR, str(data.get('msg', data['error'])))
+        data = [dict(value, month=key) if isinstance(value, dict) else value
+                for key, value in data.items()]
+    totals = {}
+    for record in data if isinstance(data, list) else ():
+        if not isinstance(record, dict):
+            continue
+        key = str(_first(record, MONTH_KEYS, month))[:7]
+        total = totals.setdefault(key, [0.0, 0.0])
+        total[0] += _number(_first(record, RX_KEYS, 0))
+        total[1] += _number(_first(record, TX_KEYS, 0))
+    return totals
+
+
+class _Labels:
+    """Dictionary encoding of a text column"""
+    def __init__(self):
+        self.labels = []
+        self.codes = {}
+
+    def code(self, label):
+        """Return the code of label, adding it if new"""
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+
+def _column(values, typecode):
+    """Turn an array.array into a NumPy array when NumPy is there"""
+    if numpy is None:
+        return values
+    return numpy.frombuffer(values, dtype=typecode).copy() \
+        if len(values) else numpy.zeros(0, dtype=typecode)
+
+
+class _Table:
+    """Named columns of equal length, written out row by row"""
+    names = ()
+
+    def __len__(self):
+        return len(getattr(self, self.names[-1]))
+
+    def rows(self):
+        """Yield each row as a tuple in the order of names"""
+        return zip(*[self.column(name) for name in self.names])
+
+    def column(self, name):
+        """Return a column, text columns as their labels"""
+        return getattr(self, name)
+
+    def write_csv(self, fp, header=True):
+        """Write the rows to the text file fp as CSV"""
+        writer = csv.writer(fp)
+        if header:
+            writer.writerow(self.names)
+        writer.writerows(self.rows())
+
+    def write_ndjson(self, fp):
+        """Write one JSON object per row to the text file fp"""
+        names = self.names
+        for row in self.rows():
+            fp.write(jsonlib.dumps(dict(zip(names, _plain(row)))))
+            fp.write('\n')
+
+
+def _plain(row):
+    # NumPy scalars are not JSON serializable by every backend
+    return [value.item() if hasattr(value, 'item') else value
+            for value in row]
+
+
+class FleetBandwidth(_Table):
+    """Per node and month bandwidth of a fleet, stored as columns
+
+    mbpkgid, rx and tx are numeric columns, location, package and month
+    hold codes into the matching *_labels lists
+    """
+    names = ('mbpkgid', 'location', 'package', 'month', 'rx', 'tx', 'total')
+
+    def __init__(self):
+        self._mbpkgid = array('q')
+        self._codes = dict((name, array('l')) for name in GROUPS)
+        self._rx = array('d')
+        self._tx = array('d')
+        self._labels = dict((name, _Labels()) for name in GROUPS)
+        self._frozen = None
+        self.errors = {}
+
+    def add(self, mbpkgid, report, location=None, package=None,
+            month=None):
+        """Append every month of one node's bandwidth_report()
+
+        Raises NetActuateException, adding nothing, if report is an error
+        """
+        totals = month_totals(report, month)
+        self._frozen = None
+        location_code = self._labels['location'].code(location)
+        package_code = self._labels['package'].code(package)
+        for key, (rx, tx) in sorted(totals.items()):
+            self._mbpkgid.append(int(mbpkgid))
+            self._codes['location'].append(location_code)
+            self._codes['package'].append(package_code)
+            self._codes['month'].append(self._labels['month'].code(key))
+            self._rx.append(rx)
+            self._tx.append(tx)
+
+    def _columns(self):
+        """The columns as NumPy arrays (or arrays), built once per change"""
+        if self._frozen is None:
+            frozen = {
+                'mbpkgid': _column(self._mbpkgid, 'q'),
+                'rx': _column(self._rx, 'd'),
+                'tx': _column(self._tx, 'd'),
+            }
+            for name in GROUPS:
+                frozen[name] = _column(self._codes[name], 'l')
+            if numpy is not None:
+                frozen['total'] = frozen['rx'] + frozen['tx']
+            else:
+                frozen['total'] = array('d', map(sum, zip(self._rx,
+                                                          self._tx)))
+            self._frozen = frozen
+        return self._frozen
+
+    def __getattr__(self, name):
+        if name in FleetBandwidth.names:
+            return self._columns()[name]
+        raise AttributeError(name)
+
+    def labels(self, group):
+        """Return the labels the codes of a group column point into"""
+        return self._labels[group].labels
+
+    def column(self, name):
+        """Return a column, group columns decoded to their labels"""
+        values = self._columns()[name]
+        if name in GROUPS:
+            labels = self.labels(name)
+            return [labels[code] for code in values]
+        return values
+
+    def rollup(self, by='location'):
+        """Sum rx, tx and total per group, by is a group or a tuple of them
+
+        Returns a Rollup with a column per group plus nodes, rx, tx and
+        total, largest total first
+        """
+        by = (by,) if isinstance(by, str) else tuple(by)
+        for name in by:
+            if name not in GROUPS:
+                raise ValueError("Cannot group by {0}".format(name))
+        columns = self._columns()
+        sizes = [len(self.labels(name)) for name in by]
+        # one combined code per row, mixed radix over the group codes
+        if numpy is not None:
+            keys = numpy.zeros(len(self), dtype='int64')
+            for name, size in zip(by, sizes):
+                keys = keys * size + columns[name]
+            present, keys = numpy.unique(keys, return_inverse=True)
+            sums = [numpy.bincount(keys, weights=columns[measure],
+                                   minlength=len(present))
+                    for measure in MEASURES]
+            # distinct (group, node) pairs counted per group
+            pairs = numpy.unique(numpy.column_stack(
+                (keys, columns['mbpkgid'])), axis=0)
+            nodes = numpy.bincount(pairs[:, 0], minlength=len(present)) \
+                if len(pairs) else numpy.zeros(0, dtype='int64')
+            order = numpy.argsort(-sums[2], kind='stable')
+            present = present[order]
+            sums = [values[order] for values in sums]
+            nodes = nodes[order]
+            present = present.tolist()
+        else:
+            totals = {}
+            members = {}
+            key_columns = [columns[name] for name in by]
+            for index, row_keys in enumerate(zip(*key_columns)):
+                key = 0
+                for size, code in zip(sizes, row_keys):
+                    key = key * size + code
+                total = totals.setdefault(key, [0.0, 0.0, 0.0])
+                total[0] += columns['rx'][index]
+                total[1] += columns['tx'][index]
+                total[2] += columns['total'][index]
+                members.setdefault(key, set()).add(
+                    columns['mbpkgid'][index])
+            present = sorted(totals, key=lambda key: -totals[key][2])
+            sums = [array('d', [totals[key][position] for key in present])
+                    for position in range(3)]
+            nodes = array('q', [len(members[key]) for key in present])
+        groups = []
+        for position, name in enumerate(by):
+            radix = 1
+            for size in sizes[position + 1:]:
+                radix *= size
+            labels = self.labels(name)
+            groups.append([labels[key // radix % sizes[position]]
+                           for key in present])
+        return Rollup(by, groups, nodes, sums[0], sums[1], sums[2])
+
+    def percentiles(self, percents=(50, 95, 99), measure='total'):
+        """Return {percent: value} of a measure over every row"""
+        values = self._columns()[measure]
+        if numpy is not None:
+            if not len(values):
+                return dict((percent, None) for percent in percents)
+            return dict(zip(percents, numpy.percentile(
+                values, list(percents)).tolist()))
+        ordered = sorted(values)
+        result = {}
+        for percent in percents:
+            if not ordered:
+                result[percent] = None
+                continue
+            # linear interpolation, as numpy.percentile does by default
+            rank = (len(ordered) - 1) * percent / 100.0
+            low = int(rank)
+            high = min(low + 1, len(ordered) - 1)
+            result[percent] = ordered[low] + \
+                (ordered[high] - ordered[low]) * (rank - low)
+        return result
+
+    def top(self, count=10, measure='total', month=None):
+        """Return a Rollup by node of the count biggest talkers
+
+        With month only that month's traffic is counted
+        """
+        columns = self._columns()
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool) if month is None else \
+                columns['month'] == self._labels['month'].codes.get(month, -1)
+            ids, inverse = numpy.unique(columns['mbpkgid'][mask],
+                                        return_inverse=True)
+            sums = [numpy.bincount(inverse, weights=columns[name][mask],
+                                   minlength=len(ids))
+                    for name in MEASURES]
+            wanted = sums[MEASURES.index(measure)]
+            count = min(count, len(ids))
+            best = numpy.argpartition(-wanted, count - 1)[:count] \
+                if count else numpy.zeros(0, dtype='int64')
+            best = best[numpy.argsort(-wanted[best], kind='stable')]
+            return Rollup(('mbpkgid',), [ids[best].tolist()],
+                          numpy.ones(len(best), dtype='int64'),
+                          sums[0][best], sums[1][best], sums[2][best])
+        code = None if month is None else \
+            self._labels['month'].codes.get(month, -1)
+        totals = {}
+        for index, node in enumerate(columns['mbpkgid']):
+            if code is not None and columns['month'][index] != code:
+                continue
+            total = totals.setdefault(node, [0.0, 0.0, 0.0])
+            total[0] += columns['rx'][index]
+            total[1] += columns['tx'][index]
+            total[2] += columns['total'][index]
+        position = MEASURES.index(measure)
+        best = heapq.nlargest(count, totals,
+                              key=lambda node: totals[node][position])
+        return Rollup(('mbpkgid',), [best], array('q', [1] * len(best)),
+                      *[array('d', [totals[node][index] for node in best])
+                        for index in range(3)])
+
+
+# pylint: disable=too-few-public-methods
+class Rollup(_Table):
+    """Result of FleetBandwidth.rollup() and top()
+
+    A column per group name, then nodes, rx, tx and total
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, by, groups, nodes, rx, tx, total):
+        self.by = by
+        self.names = tuple(by) + ('nodes', 'rx', 'tx', 'total')
+        self._columns = dict(zip(by, groups))
+        self._columns.update(nodes=nodes, rx=rx, tx=tx, total=total)
+
+    def column(self, name):
+        return self._columns[name]
+
+    def __len__(self):
+        return len(self._columns['total'])
+
+    def __repr__(self):
+        return "<Rollup by {0} {1} rows>".format(','.join(self.by),
+                                                 len(self))
+
+
+def _node_labels(servers):
+    """Map mbpkgid to (location, package) from a servers() response"""
+    data = decode(servers)
+    labels = {}
+    for record in data if isinstance(data, list) else ():
+        if 'mbpkgid' in record:
+            location = _first(record, LOCATION_KEYS)
+            package = _first(record, PACKAGE_KEYS)
+            labels[str(record['mbpkgid'])] = (
+                None if location is None else str(location),
+                None if package is None else str(package))
+    return labels
+
+
+def collect(driver, mbpkgids=None, month=None, max_workers=None):
+    """Fetch bandwidth_report() for a fleet with a naapi.api driver
+
+    mbpkgids defaults to every node of servers(), which also gives the
+    location and package of each node. Reports are fetched through
+    driver.batch_as_completed() and added as they arrive. A node whose
+    request failed or whose report is an error payload is left out and its
+    exception kept in errors.
+    """
+    labels = _node_labels(driver.servers())
+    if mbpkgids is None:
+        mbpkgids = list(labels)
+    fleet = FleetBandwidth()
+    for result in driver.batch_as_completed(
+            [('bandwidth_report', mbpkgid) for mbpkgid in mbpkgids],
+            max_workers=max_workers):
+        mbpkgid = result.args[0]
+        if not result.ok:
+            fleet.errors[mbpkgid] = result.exception
+            continue
+        location, package = labels.get(str(mbpkgid), (None, None))
+        try:
+            fleet.add(mbpkgid, result.result, location, package, month)
+        except NetActuateException as exc:
+            fleet.errors[mbpkgid] = exc
+    return fleet
+
+
+async def acollect(driver, mbpkgids=None, month=None, concurrency=None):
+    """collect() for a naapi.aioapi driver, reports go via fan_out()"""
+    labels = _node_labels(await driver.servers())
+    if mbpkgids is None:
+        mbpkgids = list(labels)
+    fleet = FleetBandwidth()
+    async for node in driver.fan_out(mbpkgids,
+                                     endpoints=('bandwidth_report',),
+                                     concurrency=concurrency):
+        if not node.ok:
+            fleet.errors[node.mbpkgid] = node.errors['bandwidth_report']
+            continue
+        location, package = labels.get(str(node.mbpkgid), (None, None))
+        try:
+            fleet.add(node.mbpkgid, node.results['bandwidth_report'],
+                      location, package, month)
+        except NetActuateException as exc:
+            fleet.errors[node.mbpkgid] = exc
+    return fleet
@@ -0,0 +1,257 @@
+"""BGP session index and change feed
+
+bgp_sessions() returns every session on every call, so a monitor that
+polls it and rescans the list does work proportional to the fleet on
+every loop. A BGPIndex keeps the sessions in memory, indexed by node,
+peer, group and state, together with a short content hash of each one.
+update() compares a new listing against those hashes and only touches the
+index entries of sessions that were added, removed or changed, returning
+them as SessionChange events.
+
+A BGPTracker polls a naapi.aioapi driver on an interval in one background
+task and hands every subscriber only the changes:
+
+    async with BGPTracker(conn, interval=5) as tracker:
+        async for change in tracker.changes():
+            if change.transition == ('Established', 'Idle'):
+                alert(change.new)
+"""
+import asyncio
+from .util import (ADDED, CHANGED, CLOSED, DEFAULT_MAX_QUEUE, REMOVED,
+                   decode, digest, field, offer)
+
+# Session keys tried in order for each index
+NODE_KEYS = ('mbpkgid', 'node_id')
+PEER_KEYS = ('provider_ip', 'peer_ip', 'neighbor')
+GROUP_KEYS = ('group_id', 'group_name')
+STATE_KEYS = ('state', 'status')
+
+INDEXES = {
+    'node': NODE_KEYS,
+    'peer': PEER_KEYS,
+    'group': GROUP_KEYS,
+    'state': STATE_KEYS,
+}
+
+# Fields that change on every poll without the session changing
+IGNORED = ('uptime', 'last_update', 'updated', 'ts_update')
+
+# pylint: disable=too-few-public-methods
+class SessionChange:
+    """One session that was added, removed or changed between two polls
+
+    old is the previous record (None when added), new the current one
+    (None when removed)
+    """
+    __slots__ = ('kind', 'session_id', 'old', 'new')
+
+    def __init__(self, kind, session_id, old=None, new=None):
+        self.kind = kind
+        self.session_id = session_id
+        self.old = old
+        self.new = new
+
+    @property
+    def transition(self):
+        """(old state, new state), either is None when there is none"""
+        return field(self.old, STATE_KEYS), field(self.new, STATE_KEYS)
+
+    def __repr__(self):
+        return "<SessionChange {0} {1} {2}>".format(
+            self.kind, self.session_id, self.transition)
+
+
+class BGPIndex:
+    """In-memory BGP sessions indexed by node, peer, group and state
+
+    Fields listed in ignore are left out of the content hash so that
+    counters alone do not count as a change
+    """
+    def __init__(self, ignore=IGNORED):
+        self.ignore = frozenset(ignore)
+        self.sessions = {}
+        self._hashes = {}
+        self._indexes = dict((name, {}) for name in INDEXES)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, session_id):
+        return str(session_id) in self.sessions
+
+    def _index(self, session_id, record, add):
+        for name, keys in INDEXES.items():
+            value = field(record, keys)
+            if value is None:
+                continue
+            index = self._indexes[name]
+            if add:
+                index.setdefault(value, set()).add(session_id)
+                continue
+            members = index.get(value)
+            if members is not None:
+                members.discard(session_id)
+                if not members:
+                    del index[value]
+
+    def update(self, records):
+        """Load a full bgp_sessions() listing, return its SessionChanges
+
+        records is a driver response or a list of session dicts. Only the
+        sessions that differ from the previous listing are re-indexed.
+        """
+        data = decode(records)
+        if not isinstance(data, list):
+            raise ValueError("not a session list: {0!r}".format(data)[:200])
+        changes = []
+        seen = set()
+        for record in data:
+            if not isinstance(record, dict) or 'id' not in record:
+                continue
+            session_id = str(record['id'])
+            seen.add(session_id)
+            content = digest(record, self.ignore)
+            if self._hashes.get(session_id) == content:
+                continue
+            old = self.sessions.get(session_id)
+            if old is not None:
+                self._index(session_id, old, add=False)
+            self.sessions[session_id] = record
+            self._hashes[session_id] = content
+            self._index(session_id, record, add=True)
+            changes.append(SessionChange(
+                ADDED if old is None else CHANGED, session_id, old, record))
+        for session_id in [key for key in self.sessions if key not in seen]:
+            old = self.sessions.pop(session_id)
+            del self._hashes[session_id]
+            self._index(session_id, old, add=False)
+            changes.append(SessionChange(REMOVED, session_id, old, None))
+        return changes
+
+    def get(self, session_id):
+        """Return the session with this id or None"""
+        return self.sessions.get(str(session_id))
+
+    def find(self, **filters):
+        """Return the sessions matching every filter, eg state='Idle'
+
+        Filters are index names: node, peer, group and state
+        """
+        ids = None
+        for name, value in filters.items():
+            if name not in INDEXES:
+                raise ValueError("Cannot filter on {0}".format(name))
+            members = self._indexes[name].get(str(value), set())
+            ids = set(members) if ids is None else ids & members
+        if ids is None:
+            ids = self.sessions
+        return [self.sessions[session_id] for session_id in sorted(ids)]
+
+    def by_node(self, mbpkgid):
+        """Return the sessions of a node"""
+        return self.find(node=mbpkgid)
+
+    def by_peer(self, peer):
+        """Return the sessions with this peer address"""
+        return self.find(peer=peer)
+
+    def by_group(self, group):
+        """Return the sessions in this BGP group"""
+        return self.find(group=group)
+
+    def by_state(self, state):
+        """Return the sessions in this state"""
+        return self.find(state=state)
+
+    def counts(self, index='state'):
+        """Return {value: number of sessions} for an index"""
+        return dict((value, len(members))
+                    for value, members in self._indexes[index].items())
+
+
+# pylint: disable=too-many-instance-attributes
+class BGPTracker:
+    """Poll bgp_sessions() on an interval and feed out only the changes
+
+    One background task polls for every subscriber. The first poll fills
+    the index silently unless initial is set, then each changes() iterator
+    gets the SessionChanges of every later poll. A failed poll is counted
+    in errors and skipped, it never reports sessions as removed.
+
+    Each subscriber holds up to max_queue unread changes (None for no
+    limit), beyond that its oldest are dropped and counted in dropped.
+    close() ends every changes() iterator.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, driver, interval=10.0, index=None, initial=False,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.driver = driver
+        self.interval = interval
+        self.index = index if index is not None else BGPIndex()
+        self.initial = initial
+        self.max_queue = max_queue
+        self.polls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_error = None
+        self._subscribers = set()
+        self._task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def poll(self):
+        """Fetch the sessions once, update the index, return the changes"""
+        first = self.polls == 0 and not self.index
+        changes = self.index.update(await self.driver.bgp_sessions())
+        self.polls += 1
+        if first and not self.initial:
+            return []
+        return changes
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                changes = await self.poll()
+            except asyncio.CancelledError:
+                raise
+            # pylint: disable=broad-except
+            except Exception as exc:
+                self.errors += 1
+                self.last_error = exc
+                changes = []
+            for change in changes:
+                for queue in list(self._subscribers):
+                    self.dropped += offer(queue, change)
+            await asyncio.sleep(self.interval)
+
+    async def changes(self):
+        """Async iterator over the SessionChanges of every poll"""
+        queue = asyncio.Queue(self.max_queue or 0)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        try:
+            while True:
+                change = await queue.get()
+                if change is CLOSED:
+                    return
+                yield change
+        finally:
+            self._subscribers.discard(queue)
+
+    async def close(self):
+        """Stop polling and end every changes() iterator"""
+        for queue in self._subscribers:
+            offer(queue, CLOSED)
+        self._subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
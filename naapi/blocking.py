@@ -0,0 +1,285 @@
+"""Blocking driver running the asyncio engine on a background loop thread
+
+A thread pool tops out at a few hundred calls in flight, each one holding
+a thread. BlockingNodeDriver keeps a naapi.aioapi driver on an event loop
+running in a dedicated thread and hands it every call with
+asyncio.run_coroutine_threadsafe(), so synchronous code gets asyncio
+concurrency over one connection pool without being rewritten. It has the
+method surface of naapi.api.NetActuateNodeDriver:
+
+    with BlockingNodeDriver(key, limit=1000) as conn:
+        conn.servers().json()
+        results = conn.batch([('status', mbpkgid) for mbpkgid in fleet])
+
+plus submit() and submit_batch(), which return concurrent.futures.Future
+objects right away:
+
+    futures = conn.submit_batch([('status', mbpkgid) for mbpkgid in fleet])
+
+Responses are the asyncio driver's naapi.response.JSONText, which has
+json(), ok and status_code. Callbacks such as bulk()'s progress run on the
+loop thread and must not call back into the driver.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import as_completed
+from .aioapi import NetActuateNodeDriver as AsyncNodeDriver
+from .api import BatchResult, _batch_call
+from .endpoints import ENDPOINTS
+
+# Records pulled from the loop per hop by the iter_ methods
+ITER_CHUNK = 256
+
+
+class LoopThread:
+    """An asyncio event loop running forever in a daemon thread
+
+    Several BlockingNodeDrivers may share one
+    """
+    def __init__(self, name='naapi-loop'):
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self.thread = threading.Thread(target=self._main, name=name,
+                                       daemon=True)
+        self.thread.start()
+        self._started.wait()
+
+    def _main(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    @property
+    def running(self):
+        """True until stop()"""
+        return self.thread.is_alive()
+
+    def in_loop(self):
+        """True when called from the loop thread itself"""
+        return threading.current_thread() is self.thread
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop, return a Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError(
+                "blocking call from the loop thread would deadlock")
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """Stop the loop and wait for its thread"""
+        if self.running:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+async def _next_chunk(agen, size):
+    """Return up to size items of an async generator, [] once it ends"""
+    items = []
+    async for item in agen:
+        items.append(item)
+        if len(items) >= size:
+            break
+    return items
+
+
+async def _semaphore(value):
+    # made on the loop, older Pythons bind semaphores to the current loop
+    return asyncio.Semaphore(value)
+
+
+async def _limited(semaphore, call):
+    async with semaphore:
+        return await call()
+
+
+def _delegate(name, doc):
+    def method(self, *args, **kwargs):
+        return self.call(name, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = doc
+    return method
+
+
+def _delegate_iter(name, doc):
+    def method(self, *args, **kwargs):
+        return self._iterate(getattr(self.driver, 'a' + name)(
+            *args, **kwargs), ITER_CHUNK)
+    method.__name__ = name
+    method.__doc__ = doc
+    return method
+
+
+class BlockingNodeDriver():
+    """Synchronous driver backed by naapi.aioapi on a loop thread
+
+    Keyword arguments are those of naapi.aioapi.NetActuateNodeDriver, its
+    limit is the number of requests in flight at once. loop is a LoopThread
+    to share with other drivers, by default the driver starts its own and
+    stops it on close().
+    """
+    name = 'NetActuate'
+    website = 'http://www.netactuate.com'
+
+    def __init__(self, key, loop=None, **kwargs):
+        self._owns_loop = loop is None
+        self.loop = LoopThread() if loop is None else loop
+        self.driver = self.loop.run(self._open(key, kwargs))
+
+    @staticmethod
+    async def _open(key, kwargs):
+        driver = AsyncNodeDriver(key, **kwargs)
+        await driver.__aenter__()
+        return driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        # plain attributes of the asyncio driver, eg typed, cache, limit
+        value = getattr(self.__dict__.get('driver'), name)
+        if callable(value):
+            raise AttributeError(name)
+        return value
+
+    def close(self):
+        """Close the asyncio driver and stop the loop if it is ours"""
+        if self.loop.running:
+            self.loop.run(self.driver.close())
+        if self._owns_loop:
+            self.loop.stop()
+
+    def call(self, method, *args, **kwargs):
+        """Call a method of the asyncio driver and wait for its result"""
+        return self.loop.run(getattr(self.driver, method)(*args, **kwargs))
+
+    def submit(self, method, *args, **kwargs):
+        """Start a call of the asyncio driver, return its Future"""
+        return self.loop.submit(_await(
+            getattr(self.driver, method)(*args, **kwargs)))
+
+    def submit_batch(self, calls, concurrency=None):
+        """Start many calls at once, return a Future per call in order
+
+        calls are as for batch(). With concurrency at most that many of
+        these calls run at a time, otherwise the connector limit alone
+        bounds them.
+        """
+        specs = [_batch_call(call) for call in calls]
+        for method, _, _ in specs:
+            if not callable(getattr(self.driver, method, None)):
+                raise ValueError("Unknown method {0}".format(method))
+        if concurrency is None:
+            return [self.submit(method, *args, **kwargs)
+                    for method, args, kwargs in specs]
+        semaphore = self.loop.run(_semaphore(concurrency))
+        return [self.loop.submit(_limited(semaphore, functools.partial(
+            getattr(self.driver, method), *args, **kwargs)))
+                for method, args, kwargs in specs]
+
+    def _batch(self, calls, max_workers):
+        """Return [(future, BatchResult)] for the calls"""
+        calls = list(calls)
+        futures = self.submit_batch(calls, max_workers)
+        return [(future, BatchResult(index, method, args, kwargs))
+                for index, (future, (method, args, kwargs)) in enumerate(
+                    zip(futures, (_batch_call(call) for call in calls)))]
+
+    @staticmethod
+    def _finish_batch(future, batch_result):
+        """Move the future's outcome onto its BatchResult"""
+        exception = future.exception()
+        if exception is None:
+            batch_result.result = future.result()
+        else:
+            batch_result.exception = exception
+        return batch_result
+
+    def batch(self, calls, max_workers=None):
+        """Run many driver calls on the loop, results in input order
+
+        As naapi.api.NetActuateNodeDriver.batch() with every call a task
+        instead of a thread, max_workers caps the calls in flight
+        """
+        return [self._finish_batch(future, batch_result)
+                for future, batch_result in self._batch(calls, max_workers)]
+
+    def batch_as_completed(self, calls, max_workers=None):
+        """Like batch() but yield each BatchResult as soon as it finishes"""
+        pairs = dict(self._batch(calls, max_workers))
+        try:
+            for future in as_completed(pairs):
+                yield self._finish_batch(future, pairs[future])
+        finally:
+            # the consumer stopped early, cancel what is left
+            for future in pairs:
+                future.cancel()
+
+    # pylint: disable=too-many-arguments
+    def bulk(self, operation, mbpkgids, max_workers=None, stagger=None,
+             progress=None, **kwargs):
+        """Run a lifecycle operation over many nodes, see the drivers' bulk
+
+        max_workers caps the calls in flight, progress runs on the loop
+        thread
+        """
+        return self.loop.run(self.driver.bulk(
+            operation, mbpkgids, concurrency=max_workers, stagger=stagger,
+            progress=progress, **kwargs))
+
+    def fan_out(self, mbpkgids, endpoints=None, concurrency=None):
+        """Yield an HVNodeResult per node as its endpoints finish
+
+        See naapi.aioapi.NetActuateNodeDriver.fan_out()
+        """
+        kwargs = {} if endpoints is None else {'endpoints': endpoints}
+        return self._iterate(self.driver.fan_out(
+            mbpkgids, concurrency=concurrency, **kwargs), 1)
+
+    def _iterate(self, agen, chunk):
+        """Drive an async generator on the loop from this thread"""
+        try:
+            while True:
+                items = self.loop.run(_next_chunk(agen, chunk))
+                if not items:
+                    return
+                for item in items:
+                    yield item
+        finally:
+            if self.loop.running:
+                self.loop.run(agen.aclose())
+
+
+def _install():
+    """Add a method per endpoint of ENDPOINTS and for locations()"""
+    for endpoint in ENDPOINTS:
+        if endpoint.stream:
+            name = 'iter_' + endpoint.name
+            method = _delegate_iter(name, endpoint.doc)
+        else:
+            name = endpoint.name
+            method = _delegate(name, endpoint.doc)
+        method.__qualname__ = 'BlockingNodeDriver.' + name
+        method.__signature__ = endpoint.signature
+        setattr(BlockingNodeDriver, name, method)
+    BlockingNodeDriver.locations = _delegate(
+        'locations', AsyncNodeDriver.locations.__doc__)
+
+
+_install()
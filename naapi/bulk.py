@@ -0,0 +1,102 @@
+"""Helpers for the drivers' bulk lifecycle operations
+
+Both drivers' bulk() run one power or lifecycle operation over many nodes
+with bounded concurrency. With a stagger, nodes in the same location are
+dispatched that many seconds apart while locations proceed in parallel, so
+a rolling reboot never takes a whole PoP down at once. Every node gets a
+BulkResult recording the response, the job id to wait on, or the error.
+"""
+from .exceptions import NetActuateException, API_ERROR
+from .util import decode
+
+# Driver methods bulk() may run, all take the mbpkgid first
+BULK_OPERATIONS = ('start', 'shutdown', 'reboot', 'delete', 'unlink',
+                   'cancel', 'rescue_stop')
+
+# Keys of an operation's response that may hold the job id
+JOB_ID_KEYS = ('id', 'job_id', 'jobid')
+
+LOCATION_KEYS = ('location_id', 'location')
+
+
+# pylint: disable=useless-object-inheritance, too-few-public-methods
+class BulkResult(object):
+    """Outcome of one node in a bulk operation"""
+    def __init__(self, mbpkgid, operation, location=None):
+        self.mbpkgid = mbpkgid
+        self.operation = operation
+        self.location = location
+        self.response = None
+        self.job_id = None
+        self.exception = None
+
+    @property
+    def ok(self):
+        """True when the call did not raise or return an API error"""
+        return self.exception is None
+
+    @property
+    def job(self):
+        """(mbpkgid, job_id) for naapi.jobs.JobWatcher, or None"""
+        if self.job_id is None:
+            return None
+        return self.mbpkgid, self.job_id
+
+    def set_response(self, response):
+        """Record the response and pull the job id out of it"""
+        self.response = response
+        try:
+            data = decode(response)
+        # pylint: disable=broad-except
+        except Exception:
+            return
+        if isinstance(data, dict):
+            if 'error' in data:
+                self.exception = NetActuateException(
+                    API_ERROR, data.get('msg', data['error']))
+                return
+            for key in JOB_ID_KEYS:
+                if data.get(key) is not None:
+                    self.job_id = data[key]
+                    return
+
+    def __repr__(self):
+        return "<BulkResult {0} {1} ok={2} job={3}>".format(
+            self.operation, self.mbpkgid, self.ok, self.job_id)
+
+
+def check_operation(operation):
+    """Raise ValueError for an operation bulk() does not run"""
+    if operation not in BULK_OPERATIONS:
+        raise ValueError("Unknown bulk operation {0}".format(operation))
+
+
+def server_locations(servers):
+    """Map mbpkgid to location from a servers() response"""
+    locations = {}
+    records = decode(servers)
+    if not isinstance(records, list):
+        return locations
+    for record in records:
+        for key in LOCATION_KEYS:
+            if record.get(key) is not None:
+                locations[str(record['mbpkgid'])] = record[key]
+                break
+    return locations
+
+
+def schedule(mbpkgids, locations, stagger):
+    """Return (delay, index, mbpkgid, location) for every node
+
+    Without a stagger every delay is 0, otherwise the nth node of a
+    location starts n * stagger seconds in. Sorted by delay.
+    """
+    seen = {}
+    plan = []
+    for index, mbpkgid in enumerate(mbpkgids):
+        location = locations.get(str(mbpkgid))
+        position = seen.get(location, 0)
+        seen[location] = position + 1
+        plan.append(((stagger or 0) * position, index, mbpkgid, location))
+    plan.sort(key=lambda item: (item[0], item[1]))
+    return plan
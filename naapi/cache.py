@@ -0,0 +1,143 @@
+"""TTL cache for the catalog endpoints of both drivers
+
+locations(), os_list() and plans() change rarely, so drivers created with a
+cache keep their responses for a per-endpoint TTL. Once an entry expires it
+is still served for stale_ttl seconds while the driver refreshes it in the
+background, so callers only wait on the network for a cold cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Default seconds an entry stays fresh, keyed by driver method name
+CATALOG_TTLS = {
+    'locations': 3600,
+    'os_list': 3600,
+    'plans': 3600,
+}
+
+# lookup() states
+FRESH = 'fresh'
+STALE = 'stale'
+MISS = 'miss'
+
+
+# pylint: disable=useless-object-inheritance
+class TTLCache(object):
+    """Thread safe LRU cache with per-endpoint TTLs
+
+    Keys are tuples starting with the endpoint name, eg ('plans', 'LAX').
+    ttls overrides CATALOG_TTLS per endpoint, stale_ttl is how long past
+    its TTL an entry may still be served while it is being refreshed.
+    """
+    def __init__(self, ttls=None, default_ttl=3600, stale_ttl=86400,
+                 maxsize=256):
+        self.ttls = dict(CATALOG_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl(self, key):
+        """Return the TTL for key's endpoint"""
+        return self.ttls.get(key[0], self.default_ttl)
+
+    def lookup(self, key):
+        """Return (value, state) for key
+
+        state is FRESH, STALE (value usable but due a refresh) or MISS
+        (value is None)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if now < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, FRESH
+                if now < expires + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    return value, STALE
+                del self._entries[key]
+            self.misses += 1
+            return None, MISS
+
+    def store(self, key, value):
+        """Cache value under key, evicting the least recently used entry"""
+        expires = time.monotonic() + self.ttl(key)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, endpoint=None, *args):
+        """Drop cached entries
+
+        With no arguments everything goes, with an endpoint name all of its
+        entries, and with extra args only that exact key
+        """
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+            elif args:
+                self._entries.pop((endpoint,) + args, None)
+            else:
+                for key in [k for k in self._entries if k[0] == endpoint]:
+                    del self._entries[key]
+
+    def start_refresh(self, key):
+        """Claim the background refresh of key, False if already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+            return True
+
+    def end_refresh(self, key):
+        """Release a refresh claimed with start_refresh()"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def stats(self):
+        """Return the cache counters as a dict"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'refreshes': self.refreshes,
+                'size': len(self._entries),
+            }
+
+
+def make_cache(cache):
+    """Turn a driver's cache argument into a TTLCache or None
+
+    True builds a default cache, a dict is taken as per-endpoint TTLs
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return TTLCache()
+    if isinstance(cache, dict):
+        return TTLCache(ttls=cache)
+    return cache
@@ -0,0 +1,441 @@
+"""Record API traffic to a cassette file and replay it offline
+
+RecordingTransport wraps another naapi.transports transport and writes
+every request/response pair it sees to a cassette. The API key is
+redacted from urls, request bodies and response bodies before anything
+is written. ReplayTransport serves a cassette back without any network,
+with latency drawn from a distribution, injected errors and timeouts, and
+a cap on concurrent requests, so fleet tools and naapi itself can be
+profiled offline and reproducibly:
+
+    with NetActuateNodeDriver(key, transport=RecordingTransport(
+            'fleet.cassette')) as conn:
+        conn.servers()
+    ...
+    replay = ReplayTransport('fleet.cassette', latency=lognormal(0.08),
+                             error_rate=0.01, seed=1)
+    conn = NetActuateNodeDriver('any', transport=replay)
+
+naapi.aiocassette has the same pair for the asyncio driver, cassettes are
+shared between the two.
+
+A cassette is one file: a magic line, every response body compressed on
+its own with zlib, then a compressed JSON index of the requests and the
+offset of each body. Replay memory maps the file and only decompresses a
+body when it is served, so large cassettes cost little memory.
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import weakref
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from requests.structures import CaseInsensitiveDict
+from .response import Response
+from .transports import StreamedResponse, make_transport
+
+MAGIC = b'NAAPI-CASSETTE 1\n'
+TRAILER = struct.Struct('<QQ8s')
+TRAILER_MAGIC = b'NAAPIEND'
+
+# Request parameters whose values never reach a cassette
+REDACT = ('key',)
+REDACTED = 'REDACTED'
+
+# Response headers kept in a cassette
+HEADERS = ('Content-Type', 'Retry-After')
+
+
+class CassetteMiss(LookupError):
+    """No recorded response matches a replayed request"""
+
+
+class ReplayError(IOError):
+    """A connection error injected by a replay transport"""
+
+
+class ReplayTimeout(ReplayError):
+    """A timeout injected by a replay transport"""
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def redact_query(query, redact=REDACT):
+    """Return the query string with the redacted parameters left out"""
+    return urlencode(sorted((name, value) for name, value in parse_qsl(
+        query, keep_blank_values=True) if name not in redact))
+
+
+def redact_body(body, redact=REDACT):
+    """Return a JSON or form request body without the redacted fields
+
+    The result is canonical (sorted keys) so equal requests match on
+    replay
+    """
+    if not body:
+        return b''
+    body = _text(body)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return redact_query(body, redact).encode()
+    if isinstance(data, dict):
+        data = dict((name, value) for name, value in data.items()
+                    if name not in redact)
+    return json.dumps(data, sort_keys=True).encode()
+
+
+def secrets(url, body=None, redact=REDACT):
+    """Return the values of the redacted parameters in a request"""
+    values = [value for name, value in parse_qsl(urlsplit(url).query)
+              if name in redact]
+    if body:
+        try:
+            data = json.loads(_text(body))
+        except ValueError:
+            data = dict(parse_qsl(_text(body)))
+        if isinstance(data, dict):
+            values.extend(str(data[name]) for name in redact if name in data)
+    return [value for value in values if value]
+
+
+def request_key(method, url, body=None, redact=REDACT):
+    """Return (method, path, query, body hash) identifying a request
+
+    The host is left out so a cassette replays against any API host
+    """
+    parts = urlsplit(url)
+    digest = hashlib.blake2b(redact_body(body, redact),
+                             digest_size=8).hexdigest() if body else ''
+    return (method.upper(), parts.path, redact_query(parts.query, redact),
+            digest)
+
+
+def _finish(cassette, entries, lock):
+    """Write the index of a cassette being recorded and close it"""
+    with lock:
+        if cassette.closed:
+            return
+        index = zlib.compress(json.dumps(entries).encode())
+        offset = cassette.tell()
+        cassette.write(index)
+        cassette.write(TRAILER.pack(offset, len(index), TRAILER_MAGIC))
+        cassette.close()
+
+
+class CassetteWriter:
+    """Appends entries to a cassette file, thread safe
+
+    close() writes the index, a cassette is unreadable until then. A
+    writer that is never closed finishes its cassette when it is garbage
+    collected or the interpreter exits.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self._lock = threading.Lock()
+        # pylint: disable=consider-using-with
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._finalizer = weakref.finalize(self, _finish, self._file,
+                                           self.entries, self._lock)
+
+    # pylint: disable=too-many-arguments
+    def add(self, key, status, headers, body, elapsed):
+        """Append one response with the request key it answered"""
+        compressed = zlib.compress(body)
+        kept = dict((name, headers[name]) for name in HEADERS
+                    if headers and headers.get(name) is not None)
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(compressed)
+            self.entries.append({
+                'method': key[0], 'path': key[1], 'query': key[2],
+                'body': key[3], 'status': status, 'headers': kept,
+                'offset': offset, 'length': len(compressed),
+                'elapsed': round(elapsed, 6)})
+
+    def close(self):
+        """Write the index and close the file"""
+        self._finalizer()
+
+
+class Cassette:
+    """A cassette file opened for replay, memory mapped
+
+    entries are the recorded requests in order, body(entry) decompresses
+    one response body
+    """
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) < len(MAGIC) + TRAILER.size:
+            raise ValueError(
+                "{0} was not closed after recording, close the recording "
+                "transport before replaying it".format(path))
+        with open(path, 'rb') as cassette:
+            self._map = mmap.mmap(cassette.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError("{0} is not a naapi cassette".format(path))
+        offset, length, end = TRAILER.unpack(self._map[-TRAILER.size:])
+        if end != TRAILER_MAGIC:
+            self._map.close()
+            raise ValueError(
+                "{0} was not closed after recording, close the recording "
+                "transport before replaying it".format(path))
+        self.entries = json.loads(zlib.decompress(
+            self._map[offset:offset + length]).decode())
+        self._exact = {}
+        self._paths = {}
+        for entry in self.entries:
+            self._exact.setdefault((entry['method'], entry['path'],
+                                    entry['query'], entry['body']),
+                                   []).append(entry)
+            self._paths.setdefault((entry['method'], entry['path']),
+                                   []).append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, key):
+        """Return the entries recorded for a request key
+
+        Entries for the same method and path are used when none matches
+        the query and body too
+        """
+        entries = self._exact.get(key) or self._paths.get(key[:2])
+        if not entries:
+            raise CassetteMiss("{0} {1} not in {2}".format(
+                key[0], key[1], self.path))
+        return entries
+
+    def body(self, entry):
+        """Return an entry's response body"""
+        start = entry['offset']
+        return zlib.decompress(self._map[start:start + entry['length']])
+
+    def close(self):
+        """Unmap the file"""
+        self._map.close()
+
+
+def constant(seconds):
+    """Latency of exactly seconds"""
+    return lambda rng, entry: seconds
+
+
+def uniform(low, high):
+    """Latency uniformly distributed between low and high seconds"""
+    return lambda rng, entry: rng.uniform(low, high)
+
+
+def lognormal(median, sigma=0.5):
+    """Long tailed latency around median seconds"""
+    mu = 0.0 if median <= 0 else math.log(median)
+    return lambda rng, entry: rng.lognormvariate(mu, sigma)
+
+
+def recorded(scale=1.0):
+    """The latency measured while recording, times scale"""
+    return lambda rng, entry: entry['elapsed'] * scale
+
+
+def make_latency(latency):
+    """Turn a latency argument into a function of (rng, entry)
+
+    None for no delay, a number of seconds, 'recorded', or a function
+    such as lognormal(0.05)
+    """
+    if latency is None:
+        return None
+    if latency == 'recorded':
+        return recorded()
+    if isinstance(latency, (int, float)):
+        return constant(latency)
+    return latency
+
+
+def _chunks(body):
+    def chunks(chunk_size):
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+    return chunks
+
+
+# pylint: disable=too-many-instance-attributes
+class Replayer:
+    """Picks the response, delay and fault of each replayed request
+
+    Both replay transports share this. Repeated requests cycle through
+    their recordings. The draws of a request depend only on seed, the
+    request and how many times it was made, never on thread or task
+    scheduling.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, cassette, latency=None, error_rate=0.0,
+                 error_statuses=(500, 502, 503), timeout_rate=0.0, seed=0,
+                 redact=REDACT):
+        self.cassette = cassette if isinstance(cassette, Cassette) \
+            else Cassette(cassette)
+        self.latency = make_latency(latency)
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.timeout_rate = timeout_rate
+        self.seed = seed
+        self.redact = redact
+        self.requests = 0
+        self.injected = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def plan(self, method, url, body=None):
+        """Return (entry, delay, fault) for a request
+
+        fault is None, 'timeout', or an HTTP status to answer with
+        """
+        key = request_key(method, url, body, self.redact)
+        entries = self.cassette.candidates(key)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+            self.requests += 1
+        entry = entries[count % len(entries)]
+        seed = hashlib.blake2b(repr((self.seed, key, count)).encode(),
+                               digest_size=8).digest()
+        rng = random.Random(seed)
+        delay = self.latency(rng, entry) if self.latency else 0.0
+        fault = None
+        roll = rng.random()
+        if roll < self.timeout_rate:
+            fault = 'timeout'
+        elif roll < self.timeout_rate + self.error_rate:
+            fault = rng.choice(self.error_statuses)
+        if fault is not None:
+            with self._lock:
+                self.injected += 1
+        return entry, max(delay, 0.0), fault
+
+    def response(self, entry, fault):
+        """Return (status, headers, body) to answer with"""
+        if fault is not None:
+            return fault, CaseInsensitiveDict(
+                {'Content-Type': 'application/json'}), json.dumps(
+                    {'error': True, 'msg': 'injected by replay'}).encode()
+        return (entry['status'], CaseInsensitiveDict(entry['headers']),
+                self.cassette.body(entry))
+
+
+class Recorder:
+    """Redacts and writes exchanges to a cassette, for both recorders"""
+    def __init__(self, path, redact=REDACT):
+        self.writer = CassetteWriter(path)
+        self.redact = redact
+
+    # pylint: disable=too-many-arguments
+    def record(self, method, url, body, status, headers, content, elapsed):
+        """Write one exchange with its secrets redacted"""
+        for secret in secrets(url, body, self.redact):
+            content = content.replace(secret.encode(), REDACTED.encode())
+        self.writer.add(request_key(method, url, body, self.redact), status,
+                        headers, content, elapsed)
+
+    def close(self):
+        """Finish the cassette"""
+        self.writer.close()
+
+
+class RecordingTransport:
+    """Records every exchange of another transport to a cassette
+
+    transport is as for the driver and defaults to requests. Streamed
+    GETs are read in full and handed to the driver from memory. close()
+    finishes the cassette.
+    """
+    def __init__(self, path, transport=None, redact=REDACT, **kwargs):
+        self.transport, self._owns_transport = make_transport(transport,
+                                                              **kwargs)
+        self.errors = self.transport.errors
+        self.timeouts = self.transport.timeouts
+        self.recorder = Recorder(path, redact)
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """Send one request through the wrapped transport and record it"""
+        start = time.perf_counter()
+        response = self.transport.request(method, url, body=body,
+                                          headers=headers, stream=stream)
+        content = response.content
+        elapsed = time.perf_counter() - start
+        status, response_headers = response.status_code, response.headers
+        if stream:
+            response.close()
+        self.recorder.record(method, url, body, status, response_headers,
+                             content, elapsed)
+        if stream:
+            return StreamedResponse(status, response_headers,
+                                    _chunks(content), lambda: None)
+        return response
+
+    def close(self):
+        """Finish the cassette and close the wrapped transport if ours"""
+        self.recorder.close()
+        if self._owns_transport:
+            self.transport.close()
+
+
+class ReplayTransport:
+    """Serves a cassette back to the naapi.api driver without a network
+
+    latency is None, seconds, 'recorded' or a function such as
+    lognormal(0.05). error_rate of the requests are answered with one of
+    error_statuses and timeout_rate raise ReplayTimeout. At most
+    concurrency requests are served at once when it is set.
+    """
+    errors = (ReplayError,)
+    timeouts = (ReplayTimeout,)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, cassette, latency=None, error_rate=0.0,
+                 error_statuses=(500, 502, 503), timeout_rate=0.0,
+                 concurrency=None, seed=0, redact=REDACT):
+        self._owns_cassette = not isinstance(cassette, Cassette)
+        self.replayer = Replayer(cassette, latency, error_rate,
+                                 error_statuses, timeout_rate, seed, redact)
+        self._slots = threading.BoundedSemaphore(concurrency) \
+            if concurrency else None
+
+    def _serve(self, method, url, body):
+        entry, delay, fault = self.replayer.plan(method, url, body)
+        if delay:
+            time.sleep(delay)
+        if fault == 'timeout':
+            raise ReplayTimeout("injected timeout for {0}".format(
+                urlsplit(url).path))
+        return self.replayer.response(entry, fault)
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """Answer one request from the cassette"""
+        if self._slots is None:
+            status, response_headers, content = self._serve(method, url,
+                                                            body)
+        else:
+            with self._slots:
+                status, response_headers, content = self._serve(
+                    method, url, body)
+        if stream:
+            return StreamedResponse(status, response_headers,
+                                    _chunks(content), lambda: None)
+        return Response(status, response_headers, content)
+
+    def close(self):
+        """Unmap the cassette if this transport opened it"""
+        if self._owns_cassette:
+            self.replayer.cassette.close()
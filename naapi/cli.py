@@ -0,0 +1,381 @@
+"""naapi command line tool
+
+Every endpoint of the drivers is a subcommand printing the decoded response
+as JSON, or as NDJSON with one record per line:
+
+    naapi servers
+    naapi -f ndjson bgp_sessions | jq .state
+    naapi reboot 1234 --force
+
+The key comes from --key or the NAAPI_KEY environment variable. Options
+such as --key and -f go before or after the command. Scripts
+and cron jobs start this many times a day, so startup is kept short: only
+the endpoint table is imported up front, naapi.api and its transport are
+imported when a request is actually sent. Catalog commands (locations,
+os_list and plans) are answered from an on-disk cache while it is fresh,
+without importing the driver at all.
+
+batch reads one command per line from stdin and runs them all in one
+process over one connection pool, printing an NDJSON line per command:
+
+    printf 'status 1234\\nstatus 5678\\n' | naapi batch -j 8
+
+--timings prints import, request and total times to stderr.
+"""
+import argparse
+import hashlib
+import os
+import shlex
+import sys
+import time
+from . import jsonlib
+from .cache import CATALOG_TTLS
+from .endpoints import ENDPOINTS
+from .util import HOST_ENV, decode
+
+_START = time.perf_counter()
+
+# Environment variables read for defaults
+KEY_ENV = 'NAAPI_KEY'
+CACHE_DIR_ENV = 'NAAPI_CACHE_DIR'
+
+# Commands implemented by the driver itself rather than ENDPOINTS
+EXTRA_COMMANDS = {'locations': "List the locations"}
+
+FORMATS = ('json', 'ndjson')
+
+# Options of naapi itself, everything else parsed is a command argument
+OPTIONS = ('key', 'host', 'api_version', 'transport', 'format', 'cache_dir',
+           'cache_ttl', 'no_cache', 'timings', 'jobs')
+
+
+def default_cache_dir():
+    """Return NAAPI_CACHE_DIR, or naapi under the user's cache directory"""
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'naapi')
+
+
+class DiskCache:
+    """Catalog responses kept as JSON files between runs
+
+    An entry is fresh for ttl seconds after it was written, ttl defaults to
+    naapi.cache.CATALOG_TTLS for the endpoint
+    """
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, key):
+        """Return the file holding key, a tuple of strings"""
+        name = hashlib.blake2b('\0'.join(key).encode(),
+                               digest_size=16).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def get(self, endpoint, key):
+        """Return the cached data for key or None when missing or stale"""
+        ttl = self.ttl if self.ttl is not None else \
+            CATALOG_TTLS.get(endpoint, 0)
+        path = self.path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime >= ttl:
+                return None
+            with open(path, 'rb') as cached:
+                return jsonlib.loads(cached.read())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, data):
+        """Store data for key, readers never see a partly written file"""
+        path = self.path(key)
+        partial = '{0}.{1}'.format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(partial, 'wb') as cached:
+                cached.write(jsonlib.dumpb(data))
+            os.replace(partial, path)
+        except OSError:
+            # a read-only or full cache directory only costs the next run
+            pass
+
+
+def _commands():
+    """Return {command: (endpoint or None, help)}"""
+    commands = dict((name, (None, doc))
+                    for name, doc in EXTRA_COMMANDS.items())
+    for endpoint in ENDPOINTS:
+        if not endpoint.stream:
+            commands[endpoint.name] = (
+                endpoint, (endpoint.doc or '').split('\n')[0])
+    return commands
+
+
+def _add_arguments(parser, endpoint):
+    """Add an endpoint's arguments to its subcommand parser"""
+    flags = set(spec.arg for spec in endpoint.params if spec.flag)
+    parameters = list(endpoint.signature.parameters.values())[1:]
+    for parameter in parameters:
+        name, default = parameter.name, parameter.default
+        if name in flags:
+            if default:
+                parser.add_argument('--no-' + name, dest=name,
+                                    action='store_false')
+            else:
+                parser.add_argument('--' + name, action='store_true')
+        elif name == endpoint.body:
+            # a dict of extra parameters, given as JSON
+            if default is parameter.empty:
+                parser.add_argument(name, type=jsonlib.loads)
+            else:
+                parser.add_argument('--' + name, type=jsonlib.loads,
+                                    default=default)
+        elif default is parameter.empty:
+            parser.add_argument(name)
+        else:
+            parser.add_argument(name, nargs='?', default=default)
+
+
+class BatchParser(argparse.ArgumentParser):
+    """Raises ValueError on a bad command instead of exiting"""
+    def error(self, message):
+        raise ValueError(message)
+
+
+def command_parser(commands, parser_class=argparse.ArgumentParser,
+                   parents=()):
+    """Return the parser of one command and its arguments
+
+    parents are added to every subcommand's parser
+    """
+    parser = parser_class(prog='naapi', add_help=False)
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+    for name, (endpoint, doc) in sorted(commands.items()):
+        subparser = subparsers.add_parser(name, help=doc, description=doc,
+                                          parents=list(parents))
+        if endpoint is not None:
+            _add_arguments(subparser, endpoint)
+    return parser
+
+
+def options_parser(defaults=True):
+    """Return a parser of the options of naapi itself
+
+    Without defaults an option that is not given is left out of the
+    result, so options after the command only replace those given there
+    """
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-k', '--key', default=default(
+        os.environ.get(KEY_ENV)), help='API key, defaults to $' + KEY_ENV)
+    parser.add_argument('--host', default=default(None),
+                        help='API host or url, defaults to $' + HOST_ENV)
+    parser.add_argument('--api-version', default=default(None))
+    parser.add_argument('--transport', default=default(None),
+                        help='requests (default), urllib3 or httpx')
+    parser.add_argument('-f', '--format', choices=FORMATS,
+                        default=default('json'))
+    parser.add_argument('--cache-dir', default=default(default_cache_dir()))
+    parser.add_argument('--cache-ttl', type=float, default=default(None),
+                        help='seconds catalog responses stay fresh')
+    parser.add_argument('--no-cache', action='store_true',
+                        default=default(False), help='always ask the API')
+    parser.add_argument('--timings', action='store_true',
+                        default=default(False),
+                        help='print import and request times to stderr')
+    return parser
+
+
+def main_parser(commands):
+    """Return the parser of the naapi command line"""
+    return argparse.ArgumentParser(
+        prog='naapi',
+        parents=[command_parser(commands,
+                                parents=[options_parser(False)]),
+                 options_parser()],
+        description=__doc__.split('\n')[0],
+        epilog="Run naapi batch to read commands from stdin.")
+
+
+def batch_parser():
+    """Return the parser of the options of naapi batch"""
+    parser = argparse.ArgumentParser(
+        prog='naapi batch', parents=[options_parser(False)],
+        description="Run one command per line of stdin in one process")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='commands run at once')
+    return parser
+
+
+def emit(data, output_format, out):
+    """Write decoded data to out as JSON or NDJSON"""
+    if output_format == 'ndjson' and isinstance(data, list):
+        for record in data:
+            out.write(jsonlib.dumps(record))
+            out.write('\n')
+        return
+    out.write(jsonlib.dumps(data))
+    out.write('\n')
+
+
+def is_error(data):
+    """True when the API answered with an error object"""
+    return isinstance(data, dict) and 'error' in data
+
+
+# pylint: disable=too-many-instance-attributes
+class Runner:
+    """Runs parsed commands, creating the driver on first use"""
+    def __init__(self, options):
+        self.options = options
+        self.cache = None if options.no_cache else DiskCache(
+            options.cache_dir, options.cache_ttl)
+        self.driver = None
+        self.import_time = 0.0
+        self.request_time = 0.0
+        self.cache_hits = 0
+        self.requests = 0
+
+    def get_driver(self):
+        """Import naapi.api and create the driver, once"""
+        if self.driver is None:
+            if not self.options.key:
+                raise ValueError(
+                    "No API key, pass --key or set {0}".format(KEY_ENV))
+            start = time.perf_counter()
+            # pylint: disable=import-outside-toplevel
+            from .api import NetActuateNodeDriver
+            self.import_time += time.perf_counter() - start
+            self.driver = NetActuateNodeDriver(
+                self.options.key, api_version=self.options.api_version,
+                host=self.options.host, transport=self.options.transport,
+                pool_maxsize=max(1, getattr(self.options, 'jobs', 1)))
+        return self.driver
+
+    def cache_key(self, command, arguments):
+        """Return the disk cache key of a catalog command"""
+        key = self.options.key or ''
+        return ('v1', self.options.host or os.environ.get(HOST_ENV, ''),
+                self.options.api_version or '',
+                hashlib.blake2b(key.encode(), digest_size=8).hexdigest(),
+                command) + tuple(str(value) for value in arguments.values())
+
+    def run(self, parsed):
+        """Run one parsed command, return its decoded response"""
+        arguments = dict(vars(parsed))
+        command = arguments.pop('command')
+        for name in OPTIONS:
+            arguments.pop(name, None)
+        cached = self.cache is not None and command in CATALOG_TTLS
+        if cached:
+            key = self.cache_key(command, arguments)
+            data = self.cache.get(command, key)
+            if data is not None:
+                self.cache_hits += 1
+                return data
+        driver = self.get_driver()
+        start = time.perf_counter()
+        data = decode(getattr(driver, command)(**arguments))
+        self.request_time += time.perf_counter() - start
+        self.requests += 1
+        if cached and not is_error(data):
+            self.cache.put(key, data)
+        return data
+
+    def close(self):
+        """Close the driver if one was created"""
+        if self.driver is not None:
+            self.driver.close()
+
+    def report(self, out):
+        """Write the timings to out, total counts from importing naapi.cli"""
+        out.write(
+            "naapi: driver import {0:.1f} ms, {1} requests {2:.1f} ms, "
+            "{3} cache hits, total {4:.1f} ms\n".format(
+                self.import_time * 1000, self.requests,
+                self.request_time * 1000, self.cache_hits,
+                (time.perf_counter() - _START) * 1000))
+
+
+def run_batch(runner, parser, lines, out, jobs=1):
+    """Run a command per line, write an NDJSON result line for each
+
+    Blank lines and # comments are skipped. Returns the number of failed
+    commands.
+    """
+    commands = [line.strip() for line in lines]
+    commands = [line for line in commands
+                if line and not line.startswith('#')]
+
+    def one(line):
+        try:
+            data = runner.run(parser.parse_args(shlex.split(line)))
+        # pylint: disable=broad-except
+        except Exception as exc:
+            return {'command': line, 'error': str(exc)}
+        if is_error(data):
+            return {'command': line, 'error': data}
+        return {'command': line, 'result': data}
+
+    if jobs > 1 and len(commands) > 1:
+        # pylint: disable=import-outside-toplevel
+        from concurrent.futures import ThreadPoolExecutor
+        runner.get_driver()
+        with ThreadPoolExecutor(jobs) as executor:
+            results = executor.map(one, commands)
+    else:
+        results = map(one, commands)
+    failed = 0
+    for result in results:
+        failed += 'error' in result
+        out.write(jsonlib.dumps(result))
+        out.write('\n')
+    return failed
+
+
+def main(argv=None):
+    """Entry point of the naapi console script"""
+    argv = sys.argv[1:] if argv is None else argv
+    commands = _commands()
+    batch = 'batch' in argv and not any(
+        arg in commands for arg in argv[:argv.index('batch')])
+    if batch:
+        # naapi [options] batch [-j N] [options]
+        index = argv.index('batch')
+        commands['batch'] = (None, "Run commands read from stdin")
+        options = main_parser(commands).parse_args(argv[:index + 1])
+        vars(options).update(
+            vars(batch_parser().parse_args(argv[index + 1:])))
+    else:
+        options = main_parser(commands).parse_args(argv)
+    runner = Runner(options)
+    status = 0
+    try:
+        if batch:
+            parser = command_parser(_commands(), BatchParser)
+            if run_batch(runner, parser, sys.stdin, sys.stdout,
+                         options.jobs):
+                status = 1
+        else:
+            data = runner.run(options)
+            emit(data, options.format, sys.stdout)
+            if is_error(data):
+                status = 1
+    # pylint: disable=broad-except
+    except Exception as exc:
+        sys.stderr.write("naapi: {0}\n".format(exc))
+        status = 1
+    finally:
+        runner.close()
+        if options.timings:
+            runner.report(sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""One declarative table of the API endpoints, shared by both drivers
+
+Every plain endpoint method of naapi.api.NetActuateNodeDriver and
+naapi.aioapi.NetActuateNodeDriver is generated from ENDPOINTS by
+install(), so the two drivers always hit the same URLs with the same
+parameters. Path templates are compiled once at import time into Routes
+that only quote and join the values at call time.
+
+An Endpoint declares the method's arguments, the path template they fill
+in and the request parameters built from them:
+
+    Endpoint('reboot', '/cloud/server/reboot/{mbpkgid}', method='POST',
+             args=('mbpkgid', ('force', False)), params=(flag('force'),))
+
+With alt, the path is used when its first field is given and alt (a
+template without it) otherwise, as for servers() and servers(mbpkgid).
+Methods with cache go through the driver's catalog cache and stream
+endpoints become iter_<name>() / aiter_<name>() methods yielding records.
+"""
+import inspect
+import re
+from urllib.parse import quote
+from .models import BGPSession, IP, Image, Job, Plan, Server, returns
+
+_FIELD = re.compile(r'\{(\w+)\}')
+
+
+# pylint: disable=too-few-public-methods
+class Route:
+    """A compiled path template such as /cloud/server/{mbpkgid}
+
+    path() quotes every value, so ids can never add segments or a query
+    """
+    __slots__ = ('template', 'fields', '_parts')
+
+    def __init__(self, template):
+        self.template = template
+        self._parts = _FIELD.split(template)
+        self.fields = tuple(self._parts[1::2])
+
+    def path(self, values):
+        """Fill the template in from values, a dict keyed by field"""
+        if not self.fields:
+            return self.template
+        parts = self._parts[:]
+        for index in range(1, len(parts), 2):
+            parts[index] = quote(str(values[parts[index]]), safe='')
+        return ''.join(parts)
+
+    def __repr__(self):
+        return "<Route {0}>".format(self.template)
+
+
+class Param:
+    """A request parameter named name taken from the argument arg
+
+    convert is applied to the value, a flag is sent as 1 when the
+    argument is true and left out otherwise
+    """
+    __slots__ = ('name', 'arg', 'convert', 'flag')
+
+    def __init__(self, name, arg=None, convert=None, is_flag=False):
+        self.name = name
+        self.arg = arg or name
+        self.convert = convert
+        self.flag = is_flag
+
+
+def param(name, arg=None, convert=None):
+    """Declare a parameter sent as the value of argument arg"""
+    return Param(name, arg, convert)
+
+
+def flag(name, arg=None):
+    """Declare a parameter sent as 1 when argument arg is true"""
+    return Param(name, arg, is_flag=True)
+
+
+def _signature(args):
+    parameters = [inspect.Parameter('self',
+                                    inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    for arg in args:
+        name, default = (arg, inspect.Parameter.empty) \
+            if isinstance(arg, str) else arg
+        parameters.append(inspect.Parameter(
+            name, inspect.Parameter.POSITIONAL_OR_KEYWORD, default=default))
+    return inspect.Signature(parameters)
+
+
+# pylint: disable=too-many-instance-attributes
+class Endpoint:
+    """One API endpoint and the driver method calling it
+
+    body names an argument holding a dict of extra parameters,
+    body_params are only sent along with it
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, path, method='GET', args=(), params=(),
+                 body=None, body_params=(), alt=None, model=None,
+                 cache=False, stream=False, doc=None):
+        self.name = name
+        self.route = Route(path)
+        self.alt = Route(alt) if alt is not None else None
+        self.method = method
+        self.params = tuple(params)
+        self.body = body
+        self.body_params = tuple(body_params)
+        self.model = model
+        self.cache = cache
+        self.stream = stream
+        self.doc = doc
+        self.signature = _signature(args)
+
+    def request(self, driver, args, kwargs):
+        """Return (path, data, cache key) for a call of the method"""
+        bound = self.signature.bind(driver, *args, **kwargs)
+        bound.apply_defaults()
+        values = bound.arguments
+        route = self.route
+        if self.alt is not None and not values[route.fields[0]]:
+            route = self.alt
+        data = {}
+        params = self.params
+        if self.body is not None and values[self.body] is not None:
+            params = params + self.body_params
+        for spec in params:
+            value = values[spec.arg]
+            if spec.flag:
+                if value:
+                    data[spec.name] = 1
+                continue
+            data[spec.name] = value if spec.convert is None \
+                else spec.convert(value)
+        if self.body is not None and values[self.body] is not None:
+            data.update(values[self.body])
+        key = (self.name,) + tuple(str(values[field])
+                                   for field in route.fields)
+        return route.path(values), data, key
+
+    def __repr__(self):
+        return "<Endpoint {0} {1} {2}>".format(self.name, self.method,
+                                               self.route.template)
+
+
+ENDPOINTS = (
+    Endpoint('os_list', '/cloud/images/', model=Image, cache=True,
+             doc="List the OS images available to build"),
+    Endpoint('plans', '/cloud/sizes/{location}', alt='/cloud/sizes/',
+             args=(('location', False),), model=Plan, cache=True,
+             doc="List the plans, only those in location when given"),
+    Endpoint('servers', '/cloud/server/{mbpkgid}', alt='/cloud/servers/',
+             args=(('mbpkgid', False),), model=Server,
+             doc="List every server, or the one with mbpkgid"),
+    Endpoint('packages', '/cloud/package/{mbpkgid}', alt='/cloud/packages',
+             args=(('mbpkgid', False),),
+             doc="List every package, or the one with mbpkgid"),
+    Endpoint('ipv4', '/cloud/ipv4/{mbpkgid}', args=('mbpkgid',), model=IP,
+             doc="List a node's IPv4 addresses"),
+    Endpoint('ipv6', '/cloud/ipv6/{mbpkgid}', args=('mbpkgid',), model=IP,
+             doc="List a node's IPv6 addresses"),
+    Endpoint('networkips', '/cloud/networkips/{mbpkgid}', args=('mbpkgid',),
+             model=IP, doc="List a node's network addresses"),
+    Endpoint('summary', '/cloud/serversummary/{mbpkgid}', args=('mbpkgid',),
+             doc="Return a node's summary"),
+    Endpoint('start', '/cloud/server/start/{mbpkgid}', method='POST',
+             args=('mbpkgid',), doc="Start a node"),
+    Endpoint('shutdown', '/cloud/server/shutdown/{mbpkgid}', method='POST',
+             args=('mbpkgid', ('force', False)), params=(flag('force'),),
+             doc="Shut a node down"),
+    Endpoint('reboot', '/cloud/server/reboot/{mbpkgid}', method='POST',
+             args=('mbpkgid', ('force', False)), params=(flag('force'),),
+             doc="Reboot a node"),
+    Endpoint('rescue', '/cloud/server/start_rescue/{mbpkgid}',
+             method='POST', args=('mbpkgid', 'password'),
+             params=(param('rescue_pass', 'password', str),),
+             doc="Boot a node into rescue mode with a root password"),
+    Endpoint('rescue_stop', '/cloud/server/stop_rescue/{mbpkgid}',
+             method='POST', args=('mbpkgid',),
+             doc="Bring a node back out of rescue mode"),
+    Endpoint('build', '/cloud/server/build/', method='POST',
+             args=('site', 'image', 'fqdn', 'passwd', 'mbpkgid'),
+             params=(param('fqdn'), param('mbpkgid'), param('image'),
+                     param('location', 'site'),
+                     param('password', 'passwd')),
+             doc="Build an image on an existing package"),
+    Endpoint('delete', '/cloud/server/delete/{mbpkgid}', method='POST',
+             args=('mbpkgid', ('extra_params', None)),
+             body='extra_params', body_params=(param('mbpkgid'),),
+             doc="Delete the vm\n\n"
+                 "extra_params, eg {'cancel_billing': False} as the Ansible "
+                 "role\nnode.py passes, are sent along with the mbpkgid"),
+    Endpoint('unlink', '/cloud/unlink/{mbpkgid}', method='POST',
+             args=('mbpkgid',), doc="Unlink a node from its package"),
+    Endpoint('status', '/cloud/status/{mbpkgid}', args=('mbpkgid',),
+             doc="Return a node's status"),
+    Endpoint('bandwidth_report', '/cloud/servermonthlybw/{mbpkgid}',
+             args=('mbpkgid',), doc="Return a node's monthly bandwidth"),
+    Endpoint('cancel', '/cloud/cancel/{mbpkgid}', method='POST',
+             args=('mbpkgid',), doc="Cancel a node's billing"),
+    Endpoint('buy', '/cloud/buy/{plan}', args=('plan',),
+             doc="Order a package of plan"),
+    Endpoint('buy_build', '/cloud/buy_build/', method='POST',
+             args=('params',), body='params',
+             doc="Order a package and build it in one call"),
+    Endpoint('get_job', '/cloud/serverjob/', args=('mbpkgid', 'job_id'),
+             params=(param('job_id'), param('mbpkgid')), model=Job,
+             doc="Gets all server jobs for this mbpkgid with the provided "
+                 "jobid\n\nTODO:   update get_job and get_jobs to be more "
+                 "explicit\n        This will require an api change"),
+    Endpoint('get_jobs', '/cloud/serverjobs/', args=('mbpkgid',),
+             params=(param('mbpkgid'),), model=Job,
+             doc="Gets all server jobs for this mbpkgid\n\nTODO:   update "
+                 "get_job and get_jobs to be more explicit\n        This "
+                 "will require an api change"),
+    Endpoint('bgp_sessions', '/cloud/bgpsession2/{session_id}',
+             alt='/cloud/bgpsessions2', args=(('session_id', False),),
+             model=BGPSession, doc="Retrieve BGP session information"),
+    Endpoint('bgp_summary', '/cloud/bgpsummary',
+             doc="Retrieve BGP session summary"),
+    Endpoint('bgp_create_sessions', '/cloud/bgpcreatesessions/{mbpkgid}',
+             method='POST',
+             args=('mbpkgid', 'group_id', ('ipv6', True),
+                   ('redundant', False)),
+             params=(param('group_id'), flag('ipv6'), flag('redundant')),
+             doc="Build BGP sessions for a node in a given BGP group"),
+    # streamed list endpoints, iter_<name>() and aiter_<name>()
+    Endpoint('servers', '/cloud/servers/', model=Server, stream=True,
+             doc="Yield the records of servers() one at a time"),
+    Endpoint('packages', '/cloud/packages', stream=True,
+             doc="Yield the records of packages() one at a time"),
+    Endpoint('jobs', '/cloud/serverjobs/', args=('mbpkgid',),
+             params=(param('mbpkgid'),), model=Job, stream=True,
+             doc="Yield the records of get_jobs() one at a time"),
+    Endpoint('bgp_sessions', '/cloud/bgpsessions2', model=BGPSession,
+             stream=True,
+             doc="Yield the records of bgp_sessions() one at a time"),
+)
+
+
+def _sync_method(endpoint):
+    if endpoint.stream:
+        def method(self, *args, **kwargs):
+            path, data, _ = endpoint.request(self, args, kwargs)
+            return self._iter(path, data=data or None)
+    elif endpoint.cache:
+        def method(self, *args, **kwargs):
+            path, data, key = endpoint.request(self, args, kwargs)
+            return self._cached(key, lambda: self.connection(
+                path, data=data, method=endpoint.method))
+    else:
+        def method(self, *args, **kwargs):
+            path, data, _ = endpoint.request(self, args, kwargs)
+            return self.connection(path, data=data, method=endpoint.method)
+    return method
+
+
+def _async_method(endpoint):
+    if endpoint.stream:
+        def method(self, *args, **kwargs):
+            path, data, _ = endpoint.request(self, args, kwargs)
+            return self._aiter(path, data=data or None)
+    elif endpoint.cache:
+        async def method(self, *args, **kwargs):
+            path, data, key = endpoint.request(self, args, kwargs)
+            return await self._cached(key, lambda: self.connection(
+                path, data=data, method=endpoint.method))
+    else:
+        async def method(self, *args, **kwargs):
+            path, data, _ = endpoint.request(self, args, kwargs)
+            return await self.connection(path, data=data,
+                                         method=endpoint.method)
+    return method
+
+
+def install(cls, asynchronous=False, endpoints=ENDPOINTS):
+    """Add a method per endpoint to the driver class cls
+
+    Methods cls defines itself are left alone
+    """
+    prefix = 'aiter_' if asynchronous else 'iter_'
+    build = _async_method if asynchronous else _sync_method
+    for endpoint in endpoints:
+        name = prefix + endpoint.name if endpoint.stream else endpoint.name
+        if name in cls.__dict__:
+            continue
+        method = build(endpoint)
+        method.__name__ = name
+        method.__qualname__ = '{0}.{1}'.format(cls.__name__, name)
+        method.__doc__ = endpoint.doc
+        method.__signature__ = endpoint.signature
+        if endpoint.model is not None:
+            method = returns(endpoint.model)(method)
+        setattr(cls, name, method)
+    return cls
@@ -0,0 +1,42 @@
+"""Exceptions shared by both drivers
+
+NetActuateException.code is one of the constants below for errors raised
+by the client itself, the HTTP status (if any) is kept in status.
+"""
+
+# Still throttled after all retries, or the client side rate limiter
+# could not hand out a token in time
+RATE_LIMITED = 'rate_limited'
+# The API kept answering with a retryable 5xx status
+SERVER_ERROR = 'server_error'
+# The connection failed or was reset before a response arrived
+CONNECTION_ERROR = 'connection_error'
+# No response within the configured timeout
+TIMEOUT = 'timeout'
+# The API answered with an error payload, eg {"error": ..., "msg": ...}
+API_ERROR = 'api_error'
+# Failed fast, the endpoint's circuit breaker is open
+CIRCUIT_OPEN = 'circuit_open'
+
+
+class NetActuateException(Exception):
+    """TODO"""
+    # pylint: disable=too-many-arguments
+    def __init__(self, code, message, status=None, attempts=1,
+                 retry_after=None):
+        self.code = code
+        self.message = message
+        self.status = status
+        self.attempts = attempts
+        self.retry_after = retry_after
+        self.args = (code, message)
+        super(NetActuateException, self).__init__(code, message)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return (
+            "<NetActuateException in {0} : {1}>"
+            .format(self.code, self.message)
+        )
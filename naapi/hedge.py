@@ -0,0 +1,428 @@
+"""Hedged GETs and circuit breaking for both drivers
+
+A few slow calls dominate the runtime of a large fan-out. A HedgePolicy
+learns a latency percentile per endpoint from recent calls; once a GET
+has been waiting longer than that, a duplicate is sent and whichever
+answers first is used. Only GETs are hedged, and at most budget of an
+endpoint's requests, so a slow API is not flooded with duplicates.
+
+A CircuitBreaker counts consecutive failures (5xx statuses, connection
+errors and timeouts) per endpoint. After failures in a row the circuit
+opens and calls fail at once with a NetActuateException coded
+CIRCUIT_OPEN, after reset_timeout a trial call is let through and its
+outcome closes or reopens the circuit.
+
+    conn = NetActuateNodeDriver(key, hedge=True, breaker=True)
+    ...
+    print(conn.hedge.stats())
+    print(conn.breaker.prometheus_text())
+
+Both are safe to share between drivers, threads and asyncio tasks.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                TimeoutError as FutureTimeout, wait)
+from .exceptions import (NetActuateException, CIRCUIT_OPEN,
+                         CONNECTION_ERROR, SERVER_ERROR, TIMEOUT)
+
+# Circuit states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# NetActuateException codes a circuit breaker counts as failures
+FAILURE_CODES = (CONNECTION_ERROR, SERVER_ERROR, TIMEOUT)
+
+# Threads the sync driver waits for hedged calls on, at the least
+DEFAULT_HEDGE_WORKERS = 64
+
+
+def percentile(samples, fraction):
+    """Return the fraction (0 to 1) percentile of samples"""
+    ordered = sorted(samples)
+    index = max(0, int(math.ceil(fraction * len(ordered))) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _close(response):
+    close = getattr(response, 'close', None)
+    if close is not None:
+        close()
+
+
+# pylint: disable=too-many-instance-attributes
+class HedgePolicy:
+    """When to send a duplicate of a slow GET, and counts of how it went
+
+    The hedge delay of an endpoint is the percentile (0 to 100) of its
+    last window latencies, kept between min_delay and max_delay. Nothing is
+    hedged before min_samples calls were seen. At most budget (a fraction)
+    of an endpoint's requests are hedged. The sync driver waits for hedged
+    calls on a pool of up to max_workers threads, a call still queued for a
+    thread when its delay runs out is given the delay again once it starts
+    instead of being hedged. Failed calls count towards the latencies too.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, percentile=95, window=256, min_samples=20,
+                 min_delay=0.01, max_delay=None, budget=0.1,
+                 max_workers=DEFAULT_HEDGE_WORKERS):
+        self.fraction = percentile / 100.0
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.max_workers = max_workers
+        self.requests = {}
+        self.hedged = {}
+        self.won = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def delay(self, endpoint):
+        """Seconds to wait before hedging a call, None for no hedge"""
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            samples = self._samples.get(endpoint)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            if self.hedged.get(endpoint, 0) >= \
+                    self.budget * self.requests[endpoint]:
+                return None
+            samples = list(samples)
+        delay = max(percentile(samples, self.fraction), self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def observe(self, endpoint, seconds):
+        """Record the latency of a completed or failed call"""
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(
+                    maxlen=self.window)
+            samples.append(seconds)
+
+    def _count(self, counter, endpoint):
+        with self._lock:
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    def _executor_for_sync(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='naapi-hedge')
+            return self._executor
+
+    def _timed(self, endpoint, fetch, started=None):
+        if started is not None:
+            started.set()
+        start = time.monotonic()
+        try:
+            return fetch()
+        finally:
+            self.observe(endpoint, time.monotonic() - start)
+
+    def call(self, endpoint, fetch):
+        """Call fetch(), hedging it with a second fetch() when slow"""
+        delay = self.delay(endpoint)
+        if delay is None:
+            return self._timed(endpoint, fetch)
+        executor = self._executor_for_sync()
+        started = threading.Event()
+        primary = executor.submit(self._timed, endpoint, fetch, started)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not started.is_set():
+            # queued behind other calls, a hedge would only queue too
+            started.wait()
+            try:
+                return primary.result(timeout=delay)
+            except FutureTimeout:
+                pass
+        self._count(self.hedged, endpoint)
+        backup = executor.submit(self._timed, endpoint, fetch)
+        pending = [primary, backup]
+        while True:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (primary, backup):
+                if future in done and future.exception() is None:
+                    loser = backup if future is primary else primary
+                    # the slower response is dropped when it arrives
+                    loser.add_done_callback(
+                        lambda late: late.exception() is None and
+                        _close(late.result()))
+                    if future is backup:
+                        self._count(self.won, endpoint)
+                    return future.result()
+            pending = [future for future in pending if future not in done]
+            if not pending:
+                raise primary.exception()
+
+    async def _atimed(self, endpoint, fetch):
+        start = time.monotonic()
+        try:
+            return await fetch()
+        finally:
+            self.observe(endpoint, time.monotonic() - start)
+
+    async def acall(self, endpoint, fetch):
+        """Await fetch(), hedging it with a second fetch() when slow"""
+        delay = self.delay(endpoint)
+        if delay is None:
+            return await self._atimed(endpoint, fetch)
+        primary = asyncio.ensure_future(self._atimed(endpoint, fetch))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            self._count(self.hedged, endpoint)
+            backup = asyncio.ensure_future(self._atimed(endpoint, fetch))
+            tasks.append(backup)
+            pending = list(tasks)
+            while True:
+                done, _ = await asyncio.wait(pending,
+                                             return_when=FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and task.exception() is None:
+                        if task is backup:
+                            self._count(self.won, endpoint)
+                        return task.result()
+                pending = [task for task in pending if task not in done]
+                if not pending:
+                    raise primary.exception()
+        finally:
+            # the loser, or both when the caller was cancelled
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        """Return {endpoint: {'requests', 'hedged', 'won'}}"""
+        with self._lock:
+            return dict((endpoint, {
+                'requests': requests,
+                'hedged': self.hedged.get(endpoint, 0),
+                'won': self.won.get(endpoint, 0)})
+                for endpoint, requests in self.requests.items())
+
+    def prometheus_text(self, prefix='naapi'):
+        """Render the hedge counters in the Prometheus text format"""
+        lines = []
+        stats = self.stats()
+        for name, help_text in (('hedged', 'Duplicate GETs sent'),
+                                ('won', 'Duplicate GETs answering first')):
+            lines.append('# HELP {0}_hedge_{1}_total {2}'.format(
+                prefix, name, help_text))
+            lines.append('# TYPE {0}_hedge_{1}_total counter'.format(
+                prefix, name))
+            for endpoint, counts in sorted(stats.items()):
+                lines.append('{0}_hedge_{1}_total{{endpoint="{2}"}} '
+                             '{3}'.format(prefix, name, endpoint,
+                                          counts[name]))
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        """Stop the sync driver's hedging threads"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+# pylint: disable=too-few-public-methods
+class _Circuit:
+    __slots__ = ('state', 'failures', 'opened_at', 'trials')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trials = 0
+
+
+class CircuitBreaker:
+    """Fails calls to an endpoint fast while it keeps failing
+
+    The circuit of an endpoint opens after failures consecutive failed
+    calls. While open, calls raise NetActuateException(CIRCUIT_OPEN) with
+    retry_after set. reset_timeout seconds after opening, up to
+    half_open_calls trial calls go through, the first success closes the
+    circuit and a failure opens it again. A trial that is cancelled gives
+    its slot back, and trials that do not report within reset_timeout are
+    given up on so new ones can go through.
+    """
+    def __init__(self, failures=5, reset_timeout=30.0, half_open_calls=1):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.opened = {}
+        self.rejected = {}
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def state(self, endpoint):
+        """Return the endpoint's circuit state"""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            return CLOSED if circuit is None else circuit.state
+
+    def allow(self, endpoint):
+        """Raise NetActuateException if the endpoint's circuit is open"""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit.state == CLOSED:
+                return
+            now = time.monotonic()
+            if circuit.state == HALF_OPEN and \
+                    circuit.trials >= self.half_open_calls and \
+                    now - circuit.opened_at >= self.reset_timeout:
+                # no trial reported back in time, the circuit is open again
+                circuit.state = OPEN
+            if circuit.state == OPEN and \
+                    now - circuit.opened_at >= self.reset_timeout:
+                circuit.state = HALF_OPEN
+                circuit.trials = 0
+                circuit.opened_at = now
+            if circuit.state == HALF_OPEN and \
+                    circuit.trials < self.half_open_calls:
+                circuit.trials += 1
+                return
+            waited = now - circuit.opened_at
+            self.rejected[endpoint] = self.rejected.get(endpoint, 0) + 1
+        raise NetActuateException(
+            CIRCUIT_OPEN, "circuit open for {0}".format(endpoint),
+            retry_after=max(0.0, self.reset_timeout - waited))
+
+    def record(self, endpoint, ok):
+        """Record the outcome of a call that was allowed"""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                if ok:
+                    return
+                circuit = self._circuits[endpoint] = _Circuit()
+            if ok:
+                circuit.state = CLOSED
+                circuit.failures = 0
+                return
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or (
+                    circuit.state == CLOSED and
+                    circuit.failures >= self.failures):
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+                self.opened[endpoint] = self.opened.get(endpoint, 0) + 1
+
+    def release(self, endpoint):
+        """Give back the trial slot of an allowed call that never finished"""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is not None and circuit.state == HALF_OPEN and \
+                    circuit.trials > 0:
+                circuit.trials -= 1
+
+    @staticmethod
+    def failed(response=None, exc=None):
+        """True when a call's response or exception counts as a failure"""
+        if exc is not None:
+            return isinstance(exc, NetActuateException) and \
+                exc.code in FAILURE_CODES
+        return getattr(response, 'status_code', 200) >= 500
+
+    def call(self, endpoint, fetch):
+        """Call fetch() through the endpoint's circuit"""
+        self.allow(endpoint)
+        try:
+            response = fetch()
+        except Exception as exc:
+            self.record(endpoint, not self.failed(exc=exc))
+            raise
+        except BaseException:
+            self.release(endpoint)
+            raise
+        self.record(endpoint, not self.failed(response))
+        return response
+
+    async def acall(self, endpoint, fetch):
+        """Await fetch() through the endpoint's circuit"""
+        self.allow(endpoint)
+        try:
+            response = await fetch()
+        except Exception as exc:
+            self.record(endpoint, not self.failed(exc=exc))
+            raise
+        except BaseException:
+            # cancelled, eg by wait_for() or a closing fan_out()
+            self.release(endpoint)
+            raise
+        self.record(endpoint, not self.failed(response))
+        return response
+
+    def stats(self):
+        """Return {endpoint: {'state', 'opened', 'rejected'}}"""
+        with self._lock:
+            endpoints = set(self._circuits) | set(self.rejected)
+            return dict((endpoint, {
+                'state': self._circuits[endpoint].state
+                         if endpoint in self._circuits else CLOSED,
+                'opened': self.opened.get(endpoint, 0),
+                'rejected': self.rejected.get(endpoint, 0)})
+                for endpoint in endpoints)
+
+    def prometheus_text(self, prefix='naapi'):
+        """Render the breaker counters in the Prometheus text format"""
+        lines = []
+        stats = self.stats()
+        for name, help_text in (('opened', 'Times a circuit opened'),
+                                ('rejected', 'Calls failed fast')):
+            lines.append('# HELP {0}_circuit_{1}_total {2}'.format(
+                prefix, name, help_text))
+            lines.append('# TYPE {0}_circuit_{1}_total counter'.format(
+                prefix, name))
+            for endpoint, counts in sorted(stats.items()):
+                lines.append('{0}_circuit_{1}_total{{endpoint="{2}"}} '
+                             '{3}'.format(prefix, name, endpoint,
+                                          counts[name]))
+        return '\n'.join(lines) + '\n'
+
+
+def make_hedge(hedge, pool_maxsize=None):
+    """Turn a driver's hedge argument into a HedgePolicy or None
+
+    True uses HedgePolicy(), a number is the percentile to hedge at. With
+    pool_maxsize a new policy gets at least twice that many threads, so a
+    full connection pool of primaries leaves room for their hedges.
+    """
+    if hedge is None or hedge is False:
+        return None
+    kwargs = {}
+    if pool_maxsize:
+        kwargs['max_workers'] = max(DEFAULT_HEDGE_WORKERS, 2 * pool_maxsize)
+    if hedge is True:
+        return HedgePolicy(**kwargs)
+    if isinstance(hedge, (int, float)):
+        return HedgePolicy(percentile=hedge, **kwargs)
+    return hedge
+
+
+def make_breaker(breaker):
+    """Turn a driver's breaker argument into a CircuitBreaker or None
+
+    True uses CircuitBreaker(), an int is the failures that open it
+    """
+    if breaker is None or breaker is False:
+        return None
+    if breaker is True:
+        return CircuitBreaker()
+    if isinstance(breaker, int):
+        return CircuitBreaker(failures=breaker)
+    return breaker
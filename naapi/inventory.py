@@ -0,0 +1,289 @@
+"""Local SQLite mirror of the server inventory
+
+An Inventory is filled from a driver's servers(), packages() and summary()
+calls and answers lookups by mbpkgid, fqdn, location and state from indexed
+columns. Each record is stored with a content hash so a refresh only
+re-fetches summary() for nodes whose server record changed, and a process
+started against an existing file can query it without touching the API.
+
+    inv = Inventory('/var/tmp/naapi-inventory.db')
+    inv.refresh(conn)              # sync driver
+    await inv.arefresh(aio_conn)   # asyncio driver
+    inv.by_location('LAX')
+"""
+import sqlite3
+import threading
+import time
+from . import jsonlib
+from .exceptions import API_ERROR, NetActuateException
+from .util import decode, digest, field
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS nodes (
+        mbpkgid TEXT PRIMARY KEY,
+        fqdn TEXT,
+        location TEXT,
+        state TEXT,
+        package_status TEXT,
+        server_hash TEXT,
+        package_hash TEXT,
+        server TEXT,
+        package TEXT,
+        summary TEXT,
+        updated REAL)''',
+    'CREATE INDEX IF NOT EXISTS nodes_fqdn ON nodes (fqdn)',
+    'CREATE INDEX IF NOT EXISTS nodes_location ON nodes (location)',
+    'CREATE INDEX IF NOT EXISTS nodes_state ON nodes (state)',
+    '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT)''',
+)
+
+# Record keys tried in order for each indexed column
+FQDN_KEYS = ('fqdn', 'domu_fqdn', 'hostname')
+LOCATION_KEYS = ('location', 'location_id', 'city')
+STATE_KEYS = ('state', 'status')
+PACKAGE_STATUS_KEYS = ('package_status', 'status')
+
+# Columns find() may filter on
+INDEXED = ('mbpkgid', 'fqdn', 'location', 'state', 'package_status')
+
+COLUMNS = ('mbpkgid, fqdn, location, state, package_status, '
+           'server, package, summary, updated')
+
+
+def _hash(record):
+    """Content hash of a record as stored in the server_hash column"""
+    return digest(record).hex()
+
+
+def _by_mbpkgid(response, name):
+    """Index a servers() or packages() listing by mbpkgid
+
+    Raises NetActuateException for an error status or payload, taking one
+    for an empty account would remove every node from the mirror
+    """
+    records = decode(response)
+    if not getattr(response, 'ok', True) or not isinstance(records, list):
+        raise NetActuateException(
+            API_ERROR, "{0}() did not return a list: {1!r}".format(
+                name, records)[:200],
+            status=getattr(response, 'status_code', None))
+    return dict((str(record['mbpkgid']), record)
+                for record in records if 'mbpkgid' in record)
+
+
+def _summary(response):
+    """Decoded summary() record, None when the call failed"""
+    if not getattr(response, 'ok', True):
+        return None
+    record = decode(response)
+    return record if isinstance(record, dict) else None
+
+
+# pylint: disable=useless-object-inheritance
+class Inventory(object):
+    """Indexed local copy of an account's nodes
+
+    path is the SQLite file, the default keeps the mirror in memory.
+    Lookups return dicts with the indexed columns plus the raw server,
+    package and summary records.
+    """
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM nodes')[0][0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the database file"""
+        self._db.close()
+
+    @property
+    def last_refresh(self):
+        """Unix time of the last completed refresh or None"""
+        rows = self._query("SELECT value FROM meta WHERE key = 'refreshed'")
+        return float(rows[0][0]) if rows else None
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _node(row):
+        node = dict((key, row[key]) for key in INDEXED)
+        node['updated'] = row['updated']
+        for key in ('server', 'package', 'summary'):
+            node[key] = None if row[key] is None else jsonlib.loads(row[key])
+        return node
+
+    def get(self, mbpkgid):
+        """Return the node with this mbpkgid or None"""
+        nodes = self.find(mbpkgid=mbpkgid)
+        return nodes[0] if nodes else None
+
+    def by_fqdn(self, fqdn):
+        """Return the nodes with this fqdn"""
+        return self.find(fqdn=fqdn)
+
+    def by_location(self, location):
+        """Return the nodes in this location"""
+        return self.find(location=location)
+
+    def by_state(self, state):
+        """Return the nodes in this state"""
+        return self.find(state=state)
+
+    def find(self, **filters):
+        """Return the nodes matching all filters on indexed columns"""
+        for key in filters:
+            if key not in INDEXED:
+                raise ValueError("Cannot filter on {0}".format(key))
+        sql = 'SELECT {0} FROM nodes'.format(COLUMNS)
+        if filters:
+            sql += ' WHERE ' + ' AND '.join(
+                '{0} = ?'.format(key) for key in sorted(filters))
+        params = [str(filters[key]) for key in sorted(filters)]
+        return [self._node(row)
+                for row in self._query(sql + ' ORDER BY mbpkgid', params)]
+
+    def all(self):
+        """Return every node"""
+        return self.find()
+
+    def _hashes(self):
+        return dict((row[0], (row[1], row[2])) for row in self._query(
+            'SELECT mbpkgid, server_hash, package_hash FROM nodes'))
+
+    def _plan(self, servers, packages):
+        """Work out which nodes a refresh has to touch
+
+        Returns (upserts, stale, removed): upserts maps mbpkgid to its
+        (server, package) records for every new or changed node, stale
+        lists the mbpkgids whose summary needs fetching
+        """
+        known = self._hashes()
+        upserts = {}
+        stale = []
+        for mbpkgid in set(servers) | set(packages):
+            server = servers.get(mbpkgid)
+            package = packages.get(mbpkgid)
+            old_server, old_package = known.get(mbpkgid, (None, None))
+            server_changed = mbpkgid not in known or \
+                old_server != _hash(server)
+            if server_changed or old_package != _hash(package):
+                upserts[mbpkgid] = (server, package)
+            if server is not None and server_changed:
+                stale.append(mbpkgid)
+        removed = [mbpkgid for mbpkgid in known
+                   if mbpkgid not in servers and mbpkgid not in packages]
+        return upserts, stale, removed
+
+    # pylint: disable=too-many-arguments
+    def _apply(self, upserts, stale, summaries, removed):
+        """Write a refresh to the database in one transaction
+
+        summaries maps mbpkgid to its new summary (None keeps the old one),
+        a stale node whose summary could not be fetched keeps a NULL
+        server_hash so the next refresh tries it again
+        """
+        stale = set(stale)
+        now = time.time()
+        with self._lock, self._db:
+            for mbpkgid, (server, package) in upserts.items():
+                server_hash = _hash(server)
+                if mbpkgid in stale and mbpkgid not in summaries:
+                    server_hash = None
+                self._db.execute(
+                    '''INSERT INTO nodes (mbpkgid, fqdn, location, state,
+                        package_status, server_hash, package_hash, server,
+                        package, updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (mbpkgid) DO UPDATE SET
+                        fqdn = excluded.fqdn,
+                        location = excluded.location,
+                        state = excluded.state,
+                        package_status = excluded.package_status,
+                        server_hash = excluded.server_hash,
+                        package_hash = excluded.package_hash,
+                        server = excluded.server,
+                        package = excluded.package,
+                        updated = excluded.updated''',
+                    (mbpkgid,
+                     field(server, FQDN_KEYS) or field(package, FQDN_KEYS),
+                     field(server, LOCATION_KEYS),
+                     field(server, STATE_KEYS),
+                     field(package, PACKAGE_STATUS_KEYS),
+                     server_hash, _hash(package),
+                     None if server is None else jsonlib.dumps(server),
+                     None if package is None else jsonlib.dumps(package),
+                     now))
+            for mbpkgid, summary in summaries.items():
+                if summary is None:
+                    continue
+                self._db.execute(
+                    'UPDATE nodes SET summary = ? WHERE mbpkgid = ?',
+                    (jsonlib.dumps(summary), mbpkgid))
+            self._db.executemany('DELETE FROM nodes WHERE mbpkgid = ?',
+                                 [(mbpkgid,) for mbpkgid in removed])
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES ('refreshed', ?)", (repr(now),))
+        return {
+            'changed': len(upserts),
+            'summaries': len([s for s in summaries.values()
+                              if s is not None]),
+            'removed': len(removed),
+            'total': len(self),
+        }
+
+    def refresh(self, driver, summaries=True):
+        """Bring the mirror up to date using a naapi.api driver
+
+        Only nodes whose server record changed have summary() fetched,
+        through driver.batch() so they are fetched in parallel. Returns
+        counts of changed, summarized and removed nodes. A failed servers()
+        or packages() raises NetActuateException and leaves the mirror as
+        it was, a failed summary() is retried by the next refresh.
+        """
+        servers = _by_mbpkgid(driver.servers(), 'servers')
+        packages = _by_mbpkgid(driver.packages(), 'packages')
+        upserts, stale, removed = self._plan(servers, packages)
+        fetched = {}
+        if summaries and stale:
+            for result in driver.batch([('summary', mbpkgid)
+                                        for mbpkgid in stale]):
+                summary = _summary(result.result) if result.ok else None
+                if summary is not None:
+                    fetched[result.args[0]] = summary
+        elif not summaries:
+            fetched = dict((mbpkgid, None) for mbpkgid in stale)
+        return self._apply(upserts, stale, fetched, removed)
+
+    async def arefresh(self, driver, summaries=True):
+        """refresh() for a naapi.aioapi driver, summaries go via fan_out()"""
+        servers = _by_mbpkgid(await driver.servers(), 'servers')
+        packages = _by_mbpkgid(await driver.packages(), 'packages')
+        upserts, stale, removed = self._plan(servers, packages)
+        fetched = {}
+        if summaries and stale:
+            async for node in driver.fan_out(stale, endpoints=('summary',)):
+                summary = _summary(node.results['summary']) \
+                    if node.ok else None
+                if summary is not None:
+                    fetched[node.mbpkgid] = summary
+        elif not summaries:
+            fetched = dict((mbpkgid, None) for mbpkgid in stale)
+        return self._apply(upserts, stale, fetched, removed)
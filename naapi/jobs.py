@@ -0,0 +1,311 @@
+"""Watch many server jobs from one scheduler
+
+Polling /cloud/serverjob once per job and per loop does not scale to bulk
+builds. A JobWatcher tracks any number of (mbpkgid, job_id) pairs for a
+naapi.aioapi driver in a single background task. Each job has its own poll
+interval that backs off while the job makes no progress, and when several
+jobs on one node are due together they are read with one get_jobs() call.
+
+    async with JobWatcher(conn) as watcher:
+        job = await watcher.wait_for((mbpkgid, job_id))
+        jobs = await watcher.wait_all(pairs, timeout=1800)
+"""
+import asyncio
+import random
+import time
+from .exceptions import (NetActuateException, API_ERROR, CIRCUIT_OPEN,
+                         CONNECTION_ERROR, RATE_LIMITED, SERVER_ERROR,
+                         TIMEOUT)
+from .util import decode
+
+# serverjob status values
+JOB_SUCCESS = 5
+JOB_FAILURE = 6
+JOB_DONE = (JOB_SUCCESS, JOB_FAILURE)
+
+# NetActuateException codes a job is polled again after
+TRANSIENT_CODES = (RATE_LIMITED, SERVER_ERROR, CONNECTION_ERROR, TIMEOUT,
+                   CIRCUIT_OPEN)
+
+# Failed polls in a row a job survives by default
+DEFAULT_MAX_ERRORS = 5
+
+
+def job_key(job):
+    """Normalize a job to an (mbpkgid, job_id) tuple
+
+    Accepts a tuple or an HVJobStatus
+    """
+    if hasattr(job, 'node_id'):
+        return str(job.node_id), str(job.job_result['id'])
+    mbpkgid, job_id = job
+    return str(mbpkgid), str(job_id)
+
+
+def transient(exc):
+    """True for a poll error worth polling again after"""
+    if isinstance(exc, NetActuateException):
+        return exc.code in TRANSIENT_CODES
+    # anything else the transports raise is a network problem
+    return True
+
+
+def _job_record(record, key):
+    """Check a decoded serverjob answer, raise NetActuateException if bad"""
+    if isinstance(record, dict) and 'error' in record:
+        raise NetActuateException(API_ERROR, "job {0}/{1}: {2}".format(
+            key[0], key[1], record.get('msg', record['error'])))
+    if not isinstance(record, dict) or 'status' not in record:
+        raise NetActuateException(API_ERROR, "job {0}/{1}: no status in "
+                                  "{2!r}".format(key[0], key[1],
+                                                 record)[:200])
+    return record
+
+
+# pylint: disable=too-few-public-methods
+class _Watch:
+    """Scheduling state of one watched job"""
+    def __init__(self, future, interval):
+        self.future = future
+        self.interval = interval
+        self.due = time.monotonic()
+        self.status = None
+        self.errors = 0
+
+
+# pylint: disable=too-many-instance-attributes
+class JobWatcher:
+    """Poll many jobs with adaptive per-job backoff
+
+    A job starts polled every min_interval seconds, each poll without a
+    status change multiplies its interval by backoff up to max_interval.
+    At most concurrency requests are in flight, and a node with at least
+    group_threshold due jobs is read with get_jobs() instead of get_job().
+    A request failing with a transient error (rate limit, 5xx, connection
+    error, timeout) is polled again up to max_errors times in a row, any
+    other error, an API error payload or a record without a status raises
+    in the job's waiters.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, driver, min_interval=2.0, max_interval=30.0,
+                 backoff=1.5, concurrency=20, group_threshold=2,
+                 max_errors=DEFAULT_MAX_ERRORS):
+        self.driver = driver
+        self.max_errors = max_errors
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.group_threshold = group_threshold
+        self.polls = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._watches = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._watches)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def watch(self, job):
+        """Start tracking job and return a future for its final record
+
+        The future resolves with the serverjob record once its status is
+        success (5) or failure (6)
+        """
+        key = job_key(job)
+        watch = self._watches.get(key)
+        if watch is None:
+            future = asyncio.get_running_loop().create_future()
+            watch = _Watch(future, self.min_interval)
+            self._watches[key] = watch
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+            self._task.add_done_callback(self._stopped)
+        return watch.future
+
+    async def wait_for(self, job, timeout=None):
+        """Wait until job succeeds or fails and return its record"""
+        return await asyncio.wait_for(
+            asyncio.shield(self.watch(job)), timeout)
+
+    async def wait_all(self, jobs, timeout=None):
+        """Wait for every job, returns {(mbpkgid, job_id): record}
+
+        Raises asyncio.TimeoutError if they are not all done in time, the
+        unfinished jobs stay watched
+        """
+        keys = [job_key(job) for job in jobs]
+        futures = [self.watch(key) for key in keys]
+        _, pending = await asyncio.wait(futures, timeout=timeout)
+        if pending:
+            raise asyncio.TimeoutError(
+                "{0} of {1} jobs still running".format(
+                    len(pending), len(keys)))
+        for future in futures:
+            # mark every failure retrieved, the first one is raised below
+            future.exception()
+        return dict((key, future.result())
+                    for key, future in zip(keys, futures))
+
+    async def close(self):
+        """Stop polling and cancel the waiters of unfinished jobs"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for watch in self._watches.values():
+            watch.future.cancel()
+        self._watches.clear()
+
+    def _fail(self, keys, exc):
+        """Stop watching keys and raise exc in their waiters"""
+        for key in keys:
+            watch = self._watches.pop(key, None)
+            if watch is not None and not watch.future.done():
+                watch.future.set_exception(exc)
+
+    def _stopped(self, task):
+        """Fail every waiter left if the scheduler died with an error"""
+        if task.cancelled() or task.exception() is None:
+            return
+        self._fail(list(self._watches), task.exception())
+
+    async def _run(self):
+        """Scheduler loop, sleeps until the next job is due"""
+        while self._watches:
+            now = time.monotonic()
+            nodes = set(key[0] for key, watch in self._watches.items()
+                        if watch.due <= now)
+            if nodes:
+                # jobs on the same node that are nearly due ride along so
+                # the node can be read with a single get_jobs()
+                soon = now + self.min_interval
+                await self._poll([
+                    key for key, watch in self._watches.items()
+                    if key[0] in nodes and watch.due <= soon])
+                continue
+            self._wakeup.clear()
+            wait = min(watch.due for watch in self._watches.values()) - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, due):
+        """Poll every due job, grouping them by node"""
+        by_node = {}
+        for mbpkgid, job_id in due:
+            by_node.setdefault(mbpkgid, []).append(job_id)
+        calls = []
+        for mbpkgid, job_ids in by_node.items():
+            if len(job_ids) >= self.group_threshold:
+                calls.append(self._poll_node(mbpkgid, job_ids))
+            else:
+                calls.extend(self._poll_job(mbpkgid, job_id)
+                             for job_id in job_ids)
+        await asyncio.gather(*calls)
+
+    async def _poll_job(self, mbpkgid, job_id):
+        key = (mbpkgid, job_id)
+        async with self._semaphore:
+            self.polls += 1
+            try:
+                record = decode(await self.driver.get_job(mbpkgid, job_id))
+            # pylint: disable=broad-except
+            except Exception as exc:
+                self._error([key], exc)
+                return
+        try:
+            self._update(key, _job_record(record, key))
+        # pylint: disable=broad-except
+        except Exception as exc:
+            self._fail([key], exc)
+
+    async def _poll_node(self, mbpkgid, job_ids):
+        keys = [(mbpkgid, job_id) for job_id in job_ids]
+        async with self._semaphore:
+            self.polls += 1
+            try:
+                records = decode(await self.driver.get_jobs(mbpkgid))
+            # pylint: disable=broad-except
+            except Exception as exc:
+                self._error(keys, exc)
+                return
+        try:
+            if isinstance(records, dict) and 'error' in records:
+                _job_record(records, (mbpkgid, '*'))
+            if isinstance(records, dict):
+                records = records.get('data', list(records.values()))
+            by_id = {}
+            for record in records or []:
+                if isinstance(record, dict) and 'id' in record:
+                    by_id[str(record['id'])] = record
+        # pylint: disable=broad-except
+        except Exception as exc:
+            self._fail(keys, exc)
+            return
+        for key in keys:
+            record = by_id.get(key[1])
+            if record is None:
+                # not listed (yet), counts as a failed poll of the job
+                self._error([key], NetActuateException(
+                    SERVER_ERROR, "job {0}/{1} not in get_jobs()".format(
+                        *key)))
+                continue
+            try:
+                self._update(key, _job_record(record, key))
+            # pylint: disable=broad-except
+            except Exception as exc:
+                self._fail([key], exc)
+
+    def _error(self, keys, exc):
+        """A poll of keys failed, poll again or give up on them
+
+        Transient errors are retried up to max_errors times in a row,
+        anything else fails the waiters at once
+        """
+        for key in keys:
+            watch = self._watches.get(key)
+            if watch is None:
+                continue
+            watch.errors += 1
+            if not transient(exc) or watch.errors > self.max_errors:
+                self._fail([key], exc)
+            else:
+                self._schedule(watch, watch.status)
+
+    def _update(self, key, record):
+        """Resolve a finished job or schedule its next poll"""
+        watch = self._watches.get(key)
+        if watch is None:
+            return
+        watch.errors = 0
+        status = int(record['status'])
+        if status in JOB_DONE:
+            del self._watches[key]
+            if not watch.future.done():
+                watch.future.set_result(record)
+            return
+        self._schedule(watch, status)
+
+    def _schedule(self, watch, status):
+        """Set the next poll of a job that is still running"""
+        if status is not None and status != watch.status:
+            # the job moved on, look again soon
+            watch.interval = self.min_interval
+        else:
+            watch.interval = min(watch.interval * self.backoff,
+                                 self.max_interval)
+        watch.status = status
+        # jitter keeps jobs started together from polling in lockstep
+        watch.due = time.monotonic() + watch.interval * random.uniform(
+            0.9, 1.1)
@@ -0,0 +1,62 @@
+"""Pluggable JSON backend
+
+Decoding responses is the main CPU cost of large sweeps, so naapi decodes
+and encodes JSON through this module. It uses orjson when it is installed
+and the standard library json module otherwise, use() switches backends.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ('orjson', 'json')
+
+backend = None
+_loads = None
+_dumps = None
+
+
+def _orjson_dumps(obj, sort_keys=False):
+    option = orjson.OPT_SORT_KEYS if sort_keys else 0
+    return orjson.dumps(obj, option=option)
+
+
+def _json_dumps(obj, sort_keys=False):
+    return json.dumps(obj, sort_keys=sort_keys).encode()
+
+
+def use(name=None):
+    """Select the backend by name, None picks the fastest available"""
+    # pylint: disable=global-statement
+    global backend, _loads, _dumps
+    if name is None:
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        _loads, _dumps = orjson.loads, _orjson_dumps
+    elif name == 'json':
+        _loads, _dumps = json.loads, _json_dumps
+    else:
+        raise ValueError("Unknown JSON backend {0}".format(name))
+    backend = name
+
+
+def loads(data):
+    """Decode JSON text or bytes"""
+    return _loads(data)
+
+
+def dumps(obj, sort_keys=False):
+    """Encode obj as JSON text"""
+    return _dumps(obj, sort_keys).decode()
+
+
+def dumpb(obj, sort_keys=False):
+    """Encode obj as UTF-8 JSON bytes"""
+    return _dumps(obj, sort_keys)
+
+
+use()
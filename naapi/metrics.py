@@ -0,0 +1,270 @@
+"""Per-request instrumentation for both drivers
+
+A driver created with instrument=True (or an Instrumentation) reports
+every request it sends. Pre-request hooks get a RequestInfo with the
+endpoint template and method, post-request hooks get it completed with the
+status, latency, body size and retry count. Endpoints are always reported
+as templates such as /cloud/server/{mbpkgid}, never as the requested URL,
+so neither ids nor the API key end up in labels.
+
+The built-in Metrics hook keeps a latency histogram per endpoint and
+renders them in the Prometheus text exposition format:
+
+    conn = NetActuateNodeDriver(API_KEY, instrument=True)
+    ...
+    print(conn.instrument.metrics.prometheus_text())
+"""
+import re
+import threading
+import time
+from .endpoints import ENDPOINTS
+
+
+def _routes():
+    """Every template in naapi.endpoints.ENDPOINTS plus /cloud/locations/
+
+    Literal templates sort before those with fields, so /cloud/server/build/
+    is not taken for /cloud/server/{mbpkgid}
+    """
+    routes = ['/cloud/locations/']
+    for endpoint in ENDPOINTS:
+        for route in (endpoint.route, endpoint.alt):
+            if route is not None and route.template not in routes:
+                routes.append(route.template)
+    return tuple(sorted(routes, key=lambda route: route.count('{')))
+
+
+# Endpoint templates used by the drivers, most specific first
+ROUTES = _routes()
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+def _compile(template):
+    pattern = re.sub(r'\\\{\w+\\\}', '[^/]+', re.escape(template.rstrip('/')))
+    return re.compile('^{0}/?$'.format(pattern))
+
+
+_ROUTE_PATTERNS = [(_compile(route), route) for route in ROUTES]
+
+
+def endpoint_template(path):
+    """Return the route template for a request path
+
+    Unknown paths have every numeric segment replaced by {id}
+    """
+    path = path.split('?', 1)[0]
+    for pattern, route in _ROUTE_PATTERNS:
+        if pattern.match(path):
+            return route
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+def body_size(headers, body=None):
+    """Size in bytes of a response body
+
+    Content-Length is used when body is None (streamed responses) or text
+    """
+    if isinstance(body, bytes):
+        return len(body)
+    length = headers.get('Content-Length') if headers else None
+    if length is not None and length.isdigit():
+        return int(length)
+    if body is None:
+        return 0
+    return len(body.encode('utf-8'))
+
+
+# pylint: disable=too-many-instance-attributes, too-few-public-methods
+class RequestInfo:
+    """What the hooks are told about one request
+
+    status is None and error set for a request that raised, error being
+    the NetActuateException code or the exception class name
+    """
+    __slots__ = ('endpoint', 'method', 'status', 'latency', 'bytes',
+                 'retries', 'error', 'started')
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.status = None
+        self.latency = None
+        self.bytes = 0
+        self.retries = 0
+        self.error = None
+        self.started = time.monotonic()
+
+    def __repr__(self):
+        return "<RequestInfo {0} {1} {2} {3:.3f}s>".format(
+            self.method, self.endpoint, self.status, self.latency or 0)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram, Prometheus style"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add one latency in seconds"""
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+    def cumulative(self):
+        """Return [(upper bound, count at or below it)] including +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, fraction):
+        """Estimate a latency quantile, the upper bound of its bucket"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return None
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Metrics:
+    """Post-request hook aggregating per-endpoint metrics"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.latency = {}
+        self.requests = {}
+        self.bytes = {}
+        self.retries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, info):
+        key = (info.endpoint, info.method)
+        outcome = info.status if info.error is None else info.error
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = LatencyHistogram(self.buckets)
+            histogram.observe(info.latency)
+            count_key = key + (str(outcome),)
+            self.requests[count_key] = self.requests.get(count_key, 0) + 1
+            self.bytes[key] = self.bytes.get(key, 0) + info.bytes
+            self.retries[key] = self.retries.get(key, 0) + info.retries
+
+    def prometheus_text(self, prefix='naapi'):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP {0}_requests_total API requests by endpoint '
+                         'and status'.format(prefix))
+            lines.append('# TYPE {0}_requests_total counter'.format(prefix))
+            for (endpoint, method, status), value in sorted(
+                    self.requests.items()):
+                lines.append(
+                    '{0}_requests_total{{endpoint="{1}",method="{2}",'
+                    'status="{3}"}} {4}'.format(
+                        prefix, _label(endpoint), method, _label(status),
+                        value))
+            for name, values, help_text in (
+                    ('response_bytes_total', self.bytes,
+                     'Response body bytes received'),
+                    ('retries_total', self.retries, 'Requests retried')):
+                lines.append('# HELP {0}_{1} {2}'.format(
+                    prefix, name, help_text))
+                lines.append('# TYPE {0}_{1} counter'.format(prefix, name))
+                for (endpoint, method), value in sorted(values.items()):
+                    lines.append(
+                        '{0}_{1}{{endpoint="{2}",method="{3}"}} {4}'.format(
+                            prefix, name, _label(endpoint), method, value))
+            lines.append('# HELP {0}_request_duration_seconds API request '
+                         'latency'.format(prefix))
+            lines.append('# TYPE {0}_request_duration_seconds '
+                         'histogram'.format(prefix))
+            for (endpoint, method), histogram in sorted(
+                    self.latency.items()):
+                labels = 'endpoint="{0}",method="{1}"'.format(
+                    _label(endpoint), method)
+                for bound, total in histogram.cumulative():
+                    lines.append(
+                        '{0}_request_duration_seconds_bucket{{{1},'
+                        'le="{2}"}} {3}'.format(
+                            prefix, labels,
+                            '+Inf' if bound == float('inf') else repr(bound),
+                            total))
+                lines.append('{0}_request_duration_seconds_sum{{{1}}} '
+                             '{2}'.format(prefix, labels, histogram.sum))
+                lines.append('{0}_request_duration_seconds_count{{{1}}} '
+                             '{2}'.format(prefix, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumentation:
+    """Runs the pre and post request hooks for a driver
+
+    metrics is the built-in Metrics hook, already registered. A hook that
+    raises is ignored so instrumentation can never fail a request.
+    """
+    def __init__(self, metrics=True):
+        self.pre_hooks = []
+        self.post_hooks = []
+        self.metrics = Metrics() if metrics is True else metrics or None
+        if self.metrics is not None:
+            self.post_hooks.append(self.metrics)
+
+    def add_hook(self, pre=None, post=None):
+        """Register pre(info) and/or post(info) callables"""
+        if pre is not None:
+            self.pre_hooks.append(pre)
+        if post is not None:
+            self.post_hooks.append(post)
+
+    @staticmethod
+    def _call(hooks, info):
+        for hook in hooks:
+            try:
+                hook(info)
+            # pylint: disable=broad-except
+            except Exception:
+                pass
+
+    def start(self, path, method):
+        """Begin reporting a request to path, returns its RequestInfo"""
+        info = RequestInfo(endpoint_template(path), method)
+        self._call(self.pre_hooks, info)
+        return info
+
+    # pylint: disable=too-many-arguments
+    def finish(self, info, status=None, nbytes=0, retries=0, error=None):
+        """Complete info and run the post hooks"""
+        info.latency = time.monotonic() - info.started
+        info.status = status
+        info.bytes = nbytes or 0
+        info.retries = retries
+        info.error = error
+        self._call(self.post_hooks, info)
+        return info
+
+
+def make_instrumentation(instrument):
+    """Turn a driver's instrument argument into an Instrumentation or None"""
+    if instrument is None or instrument is False:
+        return None
+    if instrument is True:
+        return Instrumentation()
+    return instrument
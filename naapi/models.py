@@ -0,0 +1,225 @@
+"""Compact typed records for API responses
+
+Drivers created with typed=True return these instead of raw responses.
+Every record class uses __slots__, so a record costs a fixed handful of
+pointers instead of a dict, and repeated strings such as statuses and
+location names are interned so the whole fleet shares one copy of each.
+Keys a class does not know about are kept in its extra dict.
+
+List responses come back as a RecordList which keeps the parsed dicts and
+turns each into a record the first time it is accessed.
+"""
+import functools
+import inspect
+import sys
+from collections.abc import Sequence
+from .util import decode
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """Base for the typed records
+
+    fields lists the JSON keys stored in slots, interned the ones whose
+    string values are shared between records
+    """
+    __slots__ = ('extra',)
+    fields = ()
+    interned = ()
+
+    def __init__(self, **kwargs):
+        for field in self.fields:
+            value = kwargs.pop(field, None)
+            if field in self.interned:
+                value = _intern(value)
+            setattr(self, field, value)
+        self.extra = kwargs or None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from one parsed JSON object"""
+        return cls(**data)
+
+    def get(self, key, default=None):
+        """dict style access by JSON key, default for an unset field"""
+        if key in self.fields:
+            value = getattr(self, key)
+            return default if value is None else value
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in self.fields:
+            return getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def to_dict(self):
+        """Return the record as a plain dict with its JSON keys"""
+        data = dict((field, getattr(self, field)) for field in self.fields
+                    if getattr(self, field) is not None)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash((type(self), self.key()))
+
+    def key(self):
+        """Value identifying this record, its first field"""
+        return getattr(self, self.fields[0])
+
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, self.key())
+
+
+class Server(Record):
+    """A record of servers()"""
+    __slots__ = ('mbpkgid', 'fqdn', 'status', 'state', 'location_id',
+                 'location', 'plan_id', 'plan', 'os_id', 'os', 'ip',
+                 'installed')
+    fields = __slots__
+    interned = ('status', 'state', 'location', 'plan', 'os')
+
+
+class Location(Record):
+    """A record of locations()"""
+    __slots__ = ('id', 'name', 'country', 'continent')
+    fields = __slots__
+    interned = ('name', 'country', 'continent')
+
+
+class Plan(Record):
+    """A record of plans()"""
+    __slots__ = ('plan_id', 'plan', 'ram', 'disk', 'transfer', 'price')
+    fields = __slots__
+    interned = ('plan',)
+
+
+class Image(Record):
+    """A record of os_list()"""
+    __slots__ = ('id', 'os', 'type', 'size')
+    fields = __slots__
+    interned = ('os', 'type')
+
+
+class Job(Record):
+    """A record of get_job() and get_jobs()"""
+    __slots__ = ('id', 'mbpkgid', 'status', 'command', 'ts_insert')
+    fields = __slots__
+    interned = ('command',)
+
+
+class IP(Record):
+    """A record of ipv4(), ipv6() and networkips()"""
+    __slots__ = ('id', 'ip', 'netmask', 'gateway', 'broadcast', 'reverse',
+                 'primary', 'type')
+    fields = __slots__
+    interned = ('netmask', 'gateway', 'type')
+
+
+class BGPSession(Record):
+    """A record of bgp_sessions()"""
+    __slots__ = ('id', 'mbpkgid', 'group_id', 'group_name', 'customer_ip',
+                 'provider_ip', 'customer_asn', 'provider_asn', 'state',
+                 'description')
+    fields = __slots__
+    interned = ('group_name', 'provider_ip', 'state', 'description')
+
+
+class RecordList(Sequence):
+    """List of records built from parsed dicts on first access"""
+    __slots__ = ('model', '_items')
+
+    def __init__(self, model, items):
+        self.model = model
+        self._items = items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self._items[index]
+        if isinstance(item, dict):
+            item = self._items[index] = self.model.from_dict(item)
+        return item
+
+    def to_list(self):
+        """Return the records as a list of plain dicts"""
+        return [item if isinstance(item, dict) else item.to_dict()
+                for item in self._items]
+
+    def __repr__(self):
+        return "<RecordList of {0} {1}>".format(len(self),
+                                                self.model.__name__)
+
+
+def build(model, response):
+    """Turn any driver response into model records
+
+    A list becomes a RecordList, an object a single record, and an object
+    of objects keyed by id a RecordList of its values. Error payloads are
+    returned as the parsed dict.
+    """
+    data = decode(response)
+    if isinstance(data, list):
+        return RecordList(model, data)
+    if not isinstance(data, dict) or 'error' in data:
+        return data
+    if data and not any(field in data for field in model.fields) and \
+            all(isinstance(value, dict) for value in data.values()):
+        return RecordList(model, list(data.values()))
+    return model.from_dict(data)
+
+
+async def _amap(model, items):
+    async for item in items:
+        yield model.from_dict(item)
+
+
+def returns(model):
+    """Decorate a driver method to return model records in typed mode
+
+    Works for plain and coroutine methods and for methods returning a
+    generator or async generator of parsed records. The driver's typed
+    attribute switches it on.
+    """
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                result = await func(self, *args, **kwargs)
+                if not self.typed:
+                    return result
+                return build(model, result)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            result = func(self, *args, **kwargs)
+            if not self.typed:
+                return result
+            if inspect.isgenerator(result):
+                return (model.from_dict(item) for item in result)
+            if inspect.isasyncgen(result):
+                return _amap(model, result)
+            return build(model, result)
+        return wrapper
+    return decorate
@@ -0,0 +1,248 @@
+"""Staged provisioning pipeline for the asyncio driver
+
+Bringing up a PoP takes four steps per node: order or build it, wait for
+the build job, read its addresses and create its BGP sessions. A
+ProvisionPipeline runs every node through these stages on its own, each
+stage with a separate concurrency limit, so a node whose build finished
+reads its IPs straight away instead of waiting for the rest of the batch.
+Failures and retries are handled per node and per stage, and stats()
+reports the throughput and latency of each stage.
+
+    specs = [{'fqdn': 'pop1-a.example.com', 'plan': 'VR1x1x25',
+              'location': 'LAX', 'image': 5, 'bgp_group': 17}, ...]
+    async with NetActuateNodeDriver(API_KEY) as conn:
+        nodes = await ProvisionPipeline(conn).run(specs)
+"""
+import asyncio
+import time
+from .exceptions import NetActuateException, API_ERROR
+from .jobs import JOB_FAILURE, JobWatcher
+from .util import decode
+
+STAGES = ('build', 'wait', 'addresses', 'bgp')
+
+# Calls in flight per stage
+STAGE_CONCURRENCY = {
+    'build': 10,
+    'wait': 1000,
+    'addresses': 20,
+    'bgp': 10,
+}
+
+# Retries per stage, build is never retried by default as a failed
+# buy_build may still have ordered the node
+STAGE_RETRIES = {
+    'build': 0,
+    'wait': 0,
+    'addresses': 3,
+    'bgp': 2,
+}
+
+# Spec keys that are pipeline options and not buy_build parameters
+PIPELINE_KEYS = ('bgp_group', 'bgp_ipv6', 'bgp_redundant')
+
+
+def _checked(response):
+    """Decode a response, raising for an API error payload"""
+    data = decode(response)
+    if isinstance(data, dict) and 'error' in data:
+        raise NetActuateException(API_ERROR, data.get('msg', data['error']))
+    return data
+
+
+# pylint: disable=too-many-instance-attributes, too-few-public-methods
+class NodeProvision:
+    """Progress of one node through the pipeline
+
+    stage is the last stage reached, error the exception that stopped the
+    node there, or None once it is ready
+    """
+    def __init__(self, index, spec):
+        self.index = index
+        self.spec = spec
+        self.mbpkgid = spec.get('mbpkgid')
+        self.job_id = None
+        self.job = None
+        self.ipv4 = None
+        self.ipv6 = None
+        self.bgp = None
+        self.stage = None
+        self.error = None
+        self.timings = {}
+        self.attempts = {}
+
+    @property
+    def ok(self):
+        """True when the node went through every stage"""
+        return self.error is None and self.stage == STAGES[-1]
+
+    def __repr__(self):
+        return "<NodeProvision {0} {1} stage={2} ok={3}>".format(
+            self.spec.get('fqdn'), self.mbpkgid, self.stage, self.ok)
+
+
+class StageStats:
+    """Counters and latencies of one stage"""
+    def __init__(self, name):
+        self.name = name
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = []
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, started, ended, ok):
+        """Account for one node leaving the stage"""
+        if self.first_start is None or started < self.first_start:
+            self.first_start = started
+        if self.last_end is None or ended > self.last_end:
+            self.last_end = ended
+        self.latencies.append(ended - started)
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    def as_dict(self):
+        """Summary with throughput in nodes/s and latencies in seconds"""
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        elapsed = (self.last_end - self.first_start) if count else 0
+
+        def percentile(pct):
+            if not count:
+                return None
+            return latencies[min(count - 1, int(pct / 100.0 * count))]
+
+        return {
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'retries': self.retries,
+            'throughput': self.succeeded / elapsed if elapsed else None,
+            'latency_avg': sum(latencies) / count if count else None,
+            'latency_p50': percentile(50),
+            'latency_p95': percentile(95),
+            'latency_max': latencies[-1] if count else None,
+        }
+
+
+class ProvisionPipeline:
+    """Provision nodes from buy_build/build to ready with BGP
+
+    Each spec is a dict of buy_build() parameters, or build() ones
+    (location, image, fqdn, password) plus the mbpkgid of an existing
+    package. bgp_group, with the optional bgp_ipv6 and bgp_redundant,
+    asks for BGP sessions once the node is up. concurrency and retries
+    override STAGE_CONCURRENCY and STAGE_RETRIES per stage.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, driver, concurrency=None, retries=None,
+                 job_timeout=3600, retry_backoff=2.0, watcher=None):
+        self.driver = driver
+        self.concurrency = dict(STAGE_CONCURRENCY)
+        self.concurrency.update(concurrency or {})
+        self.retries = dict(STAGE_RETRIES)
+        self.retries.update(retries or {})
+        self.job_timeout = job_timeout
+        self.retry_backoff = retry_backoff
+        self.watcher = watcher
+        self._stats = dict((stage, StageStats(stage)) for stage in STAGES)
+
+    def stats(self):
+        """Per-stage throughput and latency"""
+        return dict((stage, self._stats[stage].as_dict())
+                    for stage in STAGES)
+
+    async def run(self, specs):
+        """Provision every spec, return a NodeProvision per spec in order"""
+        nodes = [None] * len(specs)
+        async for node in self.stream(specs):
+            nodes[node.index] = node
+        return nodes
+
+    async def stream(self, specs):
+        """Yield each NodeProvision as soon as it is ready or has failed"""
+        semaphores = dict((stage, asyncio.Semaphore(self.concurrency[stage]))
+                          for stage in STAGES)
+        watcher = self.watcher or JobWatcher(self.driver)
+        tasks = [asyncio.ensure_future(
+            self._provision(NodeProvision(index, dict(spec)), semaphores,
+                            watcher))
+                 for index, spec in enumerate(specs)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.watcher is None:
+                await watcher.close()
+
+    async def _provision(self, node, semaphores, watcher):
+        for stage in STAGES:
+            node.stage = stage
+            stats = self._stats[stage]
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                node.attempts[stage] = attempt + 1
+                try:
+                    async with semaphores[stage]:
+                        await self._run_stage(stage, node, watcher)
+                    break
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    if attempt >= self.retries[stage]:
+                        node.error = exc
+                        break
+                    stats.retries += 1
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+                    attempt += 1
+            ended = time.monotonic()
+            node.timings[stage] = ended - started
+            stats.record(started, ended, node.error is None)
+            if node.error is not None:
+                break
+        return node
+
+    async def _run_stage(self, stage, node, watcher):
+        await getattr(self, '_' + stage)(node, watcher)
+
+    async def _build(self, node, _):
+        spec = node.spec
+        if node.mbpkgid is not None:
+            data = _checked(await self.driver.build(
+                spec['location'], spec['image'], spec['fqdn'],
+                spec['password'], node.mbpkgid))
+        else:
+            params = dict((key, value) for key, value in spec.items()
+                          if key not in PIPELINE_KEYS)
+            data = _checked(await self.driver.buy_build(params))
+        if isinstance(data, dict):
+            node.mbpkgid = data.get('mbpkgid', node.mbpkgid)
+            node.job_id = data.get('job_id', data.get('id'))
+        if node.mbpkgid is None or node.job_id is None:
+            raise NetActuateException(
+                API_ERROR, "no mbpkgid and job id in build response")
+
+    async def _wait(self, node, watcher):
+        node.job = await watcher.wait_for((node.mbpkgid, node.job_id),
+                                          timeout=self.job_timeout)
+        if int(node.job['status']) == JOB_FAILURE:
+            raise NetActuateException(
+                API_ERROR, "build job {0} failed".format(node.job_id))
+
+    async def _addresses(self, node, _):
+        ipv4, ipv6 = await asyncio.gather(self.driver.ipv4(node.mbpkgid),
+                                          self.driver.ipv6(node.mbpkgid))
+        node.ipv4 = _checked(ipv4)
+        node.ipv6 = _checked(ipv6)
+
+    async def _bgp(self, node, _):
+        group = node.spec.get('bgp_group')
+        if group is None:
+            return
+        node.bgp = _checked(await self.driver.bgp_create_sessions(
+            node.mbpkgid, group, ipv6=node.spec.get('bgp_ipv6', True),
+            redundant=node.spec.get('bgp_redundant', False)))
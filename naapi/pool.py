@@ -0,0 +1,189 @@
+"""Many API keys behind one connection pool
+
+A ClientPool holds one naapi.api driver per account. They all send through
+a single shared transport, so connections to the API are pooled across
+accounts, while each account keeps its own rate limit and a concurrency
+budget bounding how many of its calls are in flight. call() and merge()
+run one query on every account at once:
+
+    pool = ClientPool({'acme': ACME_KEY, 'globex': GLOBEX_KEY},
+                      rate_limit=5, concurrency=4)
+    result = pool.merge('servers')
+    for server in result.records:
+        print(server['account'], server['fqdn'])
+
+naapi.aiopool.AsyncClientPool is the same for the asyncio driver.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .api import NetActuateNodeDriver
+from .ratelimit import TokenBucket
+from .transports import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT,
+                         make_transport)
+from .util import decode
+
+# Key added to every merged record naming its account
+ACCOUNT_KEY = 'account'
+
+# In-flight calls per account by default
+DEFAULT_CONCURRENCY = 4
+
+
+def account_keys(keys):
+    """Normalize keys to {account name: API key}
+
+    A list is named account0, account1, ... so keys never end up in names
+    """
+    if isinstance(keys, dict):
+        return dict(keys)
+    return dict(('account{0}'.format(index), key)
+                for index, key in enumerate(keys))
+
+
+def tag(data, account, key=ACCOUNT_KEY):
+    """Return the records of a decoded response tagged with their account
+
+    A list gives one record per element, an object a single record,
+    everything else nothing
+    """
+    if isinstance(data, dict):
+        return [dict(data, **{key: account})]
+    if isinstance(data, list):
+        return [dict(record, **{key: account}) for record in data
+                if isinstance(record, dict)]
+    return []
+
+
+def account_rate_limit(rate_limit):
+    """rate_limit for one account's driver
+
+    A TokenBucket handed to a pool only gives the rate, burst and max_wait,
+    every account gets a new bucket of its own so budgets are never shared
+    """
+    if isinstance(rate_limit, TokenBucket):
+        return TokenBucket(rate_limit.rate, rate_limit.burst,
+                           rate_limit.max_wait)
+    return rate_limit
+
+
+# pylint: disable=too-few-public-methods
+class PoolResult:
+    """Outcome of one query across the accounts of a pool
+
+    results maps account to its response, errors account to the exception
+    it raised or the API error it returned, records holds every record
+    tagged with its account
+    """
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.records = []
+
+    @property
+    def ok(self):
+        """True when no account failed"""
+        return not self.errors
+
+    def add(self, account, response, tag_key=ACCOUNT_KEY):
+        """Record one account's response and merge its records"""
+        self.results[account] = response
+        try:
+            data = decode(response)
+        # pylint: disable=broad-except
+        except Exception as exc:
+            self.errors[account] = exc
+            return
+        if isinstance(data, dict) and 'error' in data:
+            self.errors[account] = data
+            return
+        self.records.extend(tag(data, account, tag_key))
+
+    def __repr__(self):
+        return "<PoolResult accounts={0} records={1} errors={2}>".format(
+            len(self.results), len(self.records), sorted(self.errors))
+
+
+class ClientPool:
+    """One naapi.api driver per account over a shared transport
+
+    keys is {account: API key} or a list of keys. rate_limit (requests per
+    second, or a TokenBucket used as a template) and concurrency apply to
+    each account on its own. transport is
+    as for the driver and is shared by every account, other keyword
+    arguments are passed to each driver.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, keys, rate_limit=None,
+                 concurrency=DEFAULT_CONCURRENCY, transport=None,
+                 max_workers=None, **driver_kwargs):
+        keys = account_keys(keys)
+        self.concurrency = concurrency
+        self.max_workers = max_workers or max(1, concurrency * len(keys))
+        # one connection pool sized for every account's budget at once
+        self.transport, self._owns_transport = make_transport(
+            transport, timeout=(
+                driver_kwargs.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+                driver_kwargs.get('read_timeout', DEFAULT_READ_TIMEOUT)),
+            pool_maxsize=self.max_workers)
+        self.drivers = dict(
+            (account, NetActuateNodeDriver(
+                key, rate_limit=account_rate_limit(rate_limit),
+                transport=self.transport, **driver_kwargs))
+            for account, key in keys.items())
+        self._budgets = dict((account, threading.BoundedSemaphore(
+            concurrency)) for account in keys)
+
+    def __len__(self):
+        return len(self.drivers)
+
+    def __getitem__(self, account):
+        return self.drivers[account]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close every driver and the shared transport"""
+        for driver in self.drivers.values():
+            driver.close()
+        if self._owns_transport:
+            self.transport.close()
+
+    def run(self, account, method, *args, **kwargs):
+        """Call a driver method for one account within its budget"""
+        with self._budgets[account]:
+            return getattr(self.drivers[account], method)(*args, **kwargs)
+
+    def call(self, method, *args, accounts=None, **kwargs):
+        """Call a driver method on every account at once
+
+        Returns {account: response}, an account whose call raised maps to
+        the exception
+        """
+        accounts = list(self.drivers if accounts is None else accounts)
+
+        def one(account):
+            try:
+                return self.run(account, method, *args, **kwargs)
+            # pylint: disable=broad-except
+            except Exception as exc:
+                return exc
+
+        workers = min(self.max_workers, len(accounts)) or 1
+        with ThreadPoolExecutor(workers) as executor:
+            return dict(zip(accounts, executor.map(one, accounts)))
+
+    def merge(self, method, *args, accounts=None, **kwargs):
+        """call() and merge every account's records into one PoolResult"""
+        result = PoolResult()
+        for account, response in self.call(method, *args,
+                                           accounts=accounts,
+                                           **kwargs).items():
+            if isinstance(response, Exception):
+                result.errors[account] = response
+            else:
+                result.add(account, response)
+        return result
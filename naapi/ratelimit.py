@@ -0,0 +1,156 @@
+"""Client side rate limiting and retry policy for both drivers
+
+A TokenBucket keeps a driver (or several drivers sharing one bucket) under
+the API's request rate. It is safe to share between threads and asyncio
+tasks: tokens are reserved under a lock and the caller then sleeps for its
+turn with time.sleep() or asyncio.sleep().
+
+A RetryPolicy decides which failed requests are tried again and how long
+to wait in between, using exponential backoff with full jitter and the
+server's Retry-After header when it sends one.
+"""
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from .exceptions import NetActuateException, RATE_LIMITED, SERVER_ERROR
+
+# Statuses worth retrying, the request was not processed
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+# pylint: disable=useless-object-inheritance
+class TokenBucket(object):
+    """Token bucket allowing rate requests per second with bursts of burst
+
+    max_wait bounds how long acquire() blocks, a caller that would have to
+    wait longer gets a NetActuateException with code RATE_LIMITED instead
+    """
+    def __init__(self, rate, burst=None, max_wait=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.max_wait = max_wait
+        self.waited = 0.0
+        self.throttled = 0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token and return how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if self.max_wait is not None and wait > self.max_wait:
+                self.throttled += 1
+                raise NetActuateException(
+                    RATE_LIMITED,
+                    "rate limiter wait of {0:.2f}s exceeds {1}s".format(
+                        wait, self.max_wait),
+                    retry_after=wait)
+            # going negative reserves a slot in the queue for this caller
+            self._tokens -= 1
+            self.waited += wait
+            return wait
+
+    def acquire(self):
+        """Block the calling thread until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """Wait in the running loop until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def make_limiter(rate_limit):
+    """Turn a driver's rate_limit argument into a TokenBucket or None"""
+    if rate_limit is None or rate_limit is False:
+        return None
+    if isinstance(rate_limit, TokenBucket):
+        return rate_limit
+    return TokenBucket(rate_limit)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header value, or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy(object):
+    """Which requests to retry and how long to back off
+
+    GETs are retried on statuses and on connection errors or timeouts.
+    Other methods are only retried on 429, where the API did not act on
+    the request. The nth retry waits a random time up to
+    backoff * 2 ** n capped at max_backoff, or Retry-After if the server
+    asked for longer (capped at max_retry_after).
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0,
+                 statuses=RETRY_STATUSES, max_retry_after=120.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = tuple(statuses)
+        self.max_retry_after = max_retry_after
+
+    def retry_status(self, method, status, attempt):
+        """True if a response with status should be tried again"""
+        if attempt >= self.retries or status not in self.statuses:
+            return False
+        return method == 'GET' or status == 429
+
+    def retry_error(self, method, attempt):
+        """True if a connection error or timeout should be tried again"""
+        return attempt < self.retries and method == 'GET'
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to sleep before retry number attempt (from 0)"""
+        wait = random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, self.max_retry_after))
+        return wait
+
+
+def make_retry(retry):
+    """Turn a driver's retry argument into a RetryPolicy or None
+
+    True (the default) uses RetryPolicy(), an int is the retry count and
+    0, like False, turns retrying off
+    """
+    if retry is None or retry is False:
+        return None
+    if retry is True:
+        return RetryPolicy()
+    if isinstance(retry, int):
+        return RetryPolicy(retries=retry) if retry > 0 else None
+    return retry
+
+
+def retries_exhausted(status, body, attempts, retry_after=None):
+    """Exception for a response still failing after its retries"""
+    code = RATE_LIMITED if status == 429 else SERVER_ERROR
+    return NetActuateException(
+        code, body, status=status, attempts=attempts,
+        retry_after=retry_after)
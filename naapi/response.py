@@ -0,0 +1,139 @@
+"""Response objects that decode their JSON body once
+
+json() parses the body on first use with the naapi.jsonlib backend and
+caches the result, every later call (and every caller sharing a coalesced
+or cached response) gets the same parsed value. A response built from an
+already parsed value only encodes its body if someone asks for it.
+
+Response is what the naapi.api driver returns, it keeps the attributes of
+requests.Response callers use. The asyncio driver returns JSONText, a str
+holding the body so existing json.loads() callers keep working, that also
+has a cached json().
+"""
+from . import jsonlib
+from .exceptions import NetActuateException
+
+_MISSING = object()
+
+
+# pylint: disable=useless-object-inheritance
+class Response(object):
+    """HTTP response with a decode-once json()
+
+    raw is the underlying transport response, attributes Response does not
+    have itself are looked up on it
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, status_code=200, headers=None, content=None,
+                 url=None, raw=None, parsed=_MISSING):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+        self.url = url
+        self.raw = raw
+        self._content = content
+        self._parsed = parsed
+
+    @classmethod
+    def from_requests(cls, response):
+        """Wrap a requests.Response"""
+        return cls(response.status_code, response.headers, response.content,
+                   url=response.url, raw=response)
+
+    @classmethod
+    def from_value(cls, value, status_code=200):
+        """Response whose body is an already parsed value"""
+        return cls(status_code, {'Content-Type': 'application/json'},
+                   parsed=value)
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('raw')
+        if raw is None:
+            raise AttributeError(name)
+        return getattr(raw, name)
+
+    @property
+    def content(self):
+        """Body bytes, encoded on demand for responses built from a value"""
+        if self._content is None:
+            self._content = jsonlib.dumpb(self._parsed)
+        return self._content
+
+    @property
+    def text(self):
+        """Body as text"""
+        return self.content.decode('utf-8')
+
+    @property
+    def ok(self):
+        """True for a status below 400"""
+        return self.status_code < 400
+
+    def json(self):
+        """Parsed body, decoded on the first call only"""
+        if self._parsed is _MISSING:
+            self._parsed = jsonlib.loads(self.content)
+        return self._parsed
+
+    def set_json(self, value):
+        """Replace the body with value, dropping the encoded body"""
+        self._parsed = value
+        self._content = None
+
+    def close(self):
+        """Release the underlying transport response, if any"""
+        close = getattr(self.__dict__.get('raw'), 'close', None)
+        if close is not None:
+            close()
+
+    def raise_for_status(self):
+        """Raise NetActuateException for an HTTP error status"""
+        if not self.ok:
+            raise NetActuateException(self.status_code, self.content,
+                                      status=self.status_code)
+
+    def __repr__(self):
+        return "<Response [{0}]>".format(self.status_code)
+
+
+class JSONText(str):
+    """Response body text with a decode-once json()"""
+    def __new__(cls, body, status_code=200, headers=None):
+        text = super(JSONText, cls).__new__(cls, body)
+        text.status_code = status_code
+        text.headers = headers if headers is not None else {}
+        return text
+
+    @classmethod
+    def from_value(cls, value, status_code=200):
+        """Text of an already parsed value, json() does not re-parse it
+
+        A str has to hold its text, so the value is encoded here once,
+        json() hands back the value itself
+        """
+        text = cls(jsonlib.dumps(value), status_code,
+                   {'Content-Type': 'application/json'})
+        text.__dict__['_parsed'] = value
+        return text
+
+    @classmethod
+    def from_body(cls, body, status_code, headers):
+        """Wrap a response body"""
+        return cls(body, status_code, headers)
+
+    @property
+    def text(self):
+        """Body as a plain str"""
+        return str.__str__(self)
+
+    @property
+    def ok(self):
+        """True for a status below 400"""
+        return self.status_code < 400
+
+    def json(self):
+        """Parsed body, decoded on the first call only"""
+        if '_parsed' not in self.__dict__:
+            # some backends only take exact str, hand them a plain copy
+            self.__dict__['_parsed'] = jsonlib.loads(str.__str__(self))
+        return self.__dict__['_parsed']
+
@@ -0,0 +1,84 @@
+"""Coalesce concurrent identical requests into one
+
+When many callers ask for the same GET at the same moment only the first
+one goes to the API, the others wait for it and get the same result (or the
+same exception). Nothing is cached, a call made after the shared request
+finished starts a new one. SingleFlight is for threads and the naapi.api
+driver, AsyncSingleFlight for tasks and the naapi.aioapi driver.
+"""
+import asyncio
+import threading
+
+
+# pylint: disable=too-few-public-methods
+class _Call(object):
+    """One in-flight call and its outcome"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# pylint: disable=useless-object-inheritance
+class SingleFlight(object):
+    """Thread safe request coalescing
+
+    calls counts every do(), shared the ones answered by another caller's
+    request
+    """
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return func(), or the result of a running func() for key"""
+        with self._lock:
+            self.calls += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """asyncio request coalescing
+
+    The shared request runs in its own task so a waiter being cancelled
+    does not cancel it for the others
+    """
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+
+    async def do(self, key, func):
+        """Return await func(), or the result of a running one for key"""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(
+                lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,125 @@
+"""Incremental parsing of JSON list responses
+
+The list endpoints return one JSON array. Instead of reading the whole body
+and decoding it into one big list, the drivers' iter_* / aiter_* methods
+feed the body to a JSONArrayParser chunk by chunk as it arrives and yield
+each element as soon as it is complete, so memory stays bounded by the
+size of one record rather than the whole response.
+"""
+import codecs
+import json
+from .exceptions import NetActuateException, API_ERROR
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',]'
+
+# Size of the chunks read from the socket
+CHUNK_SIZE = 65536
+
+
+# pylint: disable=useless-object-inheritance
+class JSONArrayParser(object):
+    """Feed it a JSON array in pieces, get the elements back as they close
+
+    Elements are decoded with json.JSONDecoder.raw_decode, only the text of
+    the element still being received is buffered. A top level object is
+    buffered whole and returned as a single element by close().
+    """
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._top = None
+        self._closed = False
+
+    def feed(self, chunk):
+        """Add a chunk of bytes or text, return the completed elements"""
+        if isinstance(chunk, bytes):
+            chunk = self._text.decode(chunk)
+        self._buf += chunk
+        if self._top is None:
+            self._buf = self._buf.lstrip(WHITESPACE)
+            if not self._buf:
+                return []
+            self._top = self._buf[0]
+            if self._top == '[':
+                self._buf = self._buf[1:]
+        if self._top != '[':
+            return []
+        return self._items(final=False)
+
+    def close(self):
+        """Signal the end of the body, return the remaining elements"""
+        self._buf += self._text.decode(b'', final=True)
+        if self._top is None:
+            raise ValueError("empty JSON document")
+        if self._top != '[':
+            return [json.loads(self._buf)]
+        items = self._items(final=True)
+        if not self._closed or self._buf.strip(WHITESPACE):
+            raise ValueError("truncated JSON array")
+        return items
+
+    def _items(self, final):
+        items = []
+        buf = self._buf
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            char = buf[pos]
+            if char in WHITESPACE or char == ',':
+                pos += 1
+                continue
+            if self._closed:
+                raise ValueError("data after the end of the JSON array")
+            if char == ']':
+                self._closed = True
+                pos += 1
+                continue
+            try:
+                item, item_end = self._decoder.raw_decode(buf, pos)
+            except ValueError:
+                if final:
+                    raise
+                # element not complete yet, wait for more data
+                break
+            if buf[item_end - 1] not in '}]"':
+                # a number or literal may continue in the next chunk, it
+                # is only complete once a delimiter follows it
+                if item_end == end and not final:
+                    break
+                if item_end < end and buf[item_end] not in DELIMITERS:
+                    if final:
+                        raise ValueError("invalid JSON array element")
+                    break
+            items.append(item)
+            pos = item_end
+        self._buf = buf[pos:]
+        return items
+
+
+def _check(item):
+    """Raise for an API error payload in place of the array"""
+    if isinstance(item, dict) and 'error' in item:
+        raise NetActuateException(API_ERROR, item.get('msg', item['error']))
+    return item
+
+
+def iter_items(chunks):
+    """Yield the elements of a JSON array read from an iterable of chunks"""
+    parser = JSONArrayParser()
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.close():
+        yield _check(item)
+
+
+async def aiter_items(chunks):
+    """Async version of iter_items() over an async iterable of chunks"""
+    parser = JSONArrayParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.close():
+        yield _check(item)
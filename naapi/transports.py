@@ -0,0 +1,217 @@
+"""HTTP transports for the naapi.api driver
+
+A transport sends one request and hands back a naapi.response.Response,
+or for a streamed GET a response whose body is still unread, with
+status_code, headers, iter_content(chunk_size), content and close().
+Everything else (urls, retries, rate limiting, coalescing,
+instrumentation) is done by naapi.api.connection() the same way for all
+of them, so switching transports never changes what the driver does.
+
+    requests  a keep-alive requests.Session, the default
+    urllib3   a bare urllib3 PoolManager, less overhead per request
+    httpx     an httpx.Client, over HTTP/2 when h2 is installed
+              (pip install naapi[httpx])
+
+errors lists the exceptions a transport raises when no response arrived,
+timeouts the ones of them that mean a timeout.
+"""
+import requests as rq
+import urllib3
+from requests.adapters import HTTPAdapter
+from .response import Response
+
+# Connection pool defaults
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+
+def new_session(pool_connections=DEFAULT_POOL_CONNECTIONS,
+                pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+    """Build a keep-alive requests.Session with a sized connection pool
+
+    pool_connections is the number of hosts to keep pools for and
+    pool_maxsize the number of connections kept per host. With pool_block
+    set, threads wait for a free connection instead of opening extra ones
+    that are thrown away after use.
+    """
+    session = rq.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# pylint: disable=too-few-public-methods
+class StreamedResponse:
+    """A response with its body unread, for transports other than requests
+
+    chunks(chunk_size) iterates over the body, release() gives the
+    connection back
+    """
+    def __init__(self, status_code, headers, chunks, release):
+        self.status_code = status_code
+        self.headers = headers
+        self._chunks = chunks
+        self._release = release
+        self._content = None
+
+    def iter_content(self, chunk_size):
+        """Iterate over the body in chunks of up to chunk_size bytes"""
+        return self._chunks(chunk_size)
+
+    @property
+    def content(self):
+        """Read the rest of the body"""
+        if self._content is None:
+            self._content = b''.join(self._chunks(65536))
+        return self._content
+
+    def close(self):
+        """Release the connection"""
+        self._release()
+
+
+class RequestsTransport:
+    """Sends requests through a requests.Session
+
+    With no session one is made with new_session() and closed by close(),
+    a session handed in is left open for its owner
+    """
+    errors = (rq.RequestException,)
+    timeouts = (rq.Timeout,)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, session=None, timeout=None,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+        self._owns_session = session is None
+        if session is None:
+            session = new_session(pool_connections=pool_connections,
+                                  pool_maxsize=pool_maxsize,
+                                  pool_block=pool_block)
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """Send one request"""
+        response = self.session.request(method, url, data=body,
+                                        headers=headers,
+                                        timeout=self.timeout, stream=stream)
+        if stream:
+            return response
+        return Response.from_requests(response)
+
+    def close(self):
+        """Close the session if this transport made it"""
+        if self._owns_session:
+            self.session.close()
+
+
+class Urllib3Transport:
+    """Sends requests through a urllib3.PoolManager
+
+    urllib3's own retries are off, the driver's RetryPolicy decides
+    """
+    errors = (urllib3.exceptions.HTTPError,)
+    timeouts = (urllib3.exceptions.TimeoutError,)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, timeout=None,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False):
+        if isinstance(timeout, tuple):
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        self.pool = urllib3.PoolManager(num_pools=pool_connections,
+                                        maxsize=pool_maxsize,
+                                        block=pool_block, retries=False,
+                                        timeout=timeout)
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """Send one request"""
+        response = self.pool.request(method, url, body=body,
+                                     headers=headers,
+                                     preload_content=not stream)
+        if stream:
+            return StreamedResponse(response.status, response.headers,
+                                    response.stream, response.release_conn)
+        return Response(response.status, response.headers, response.data,
+                        raw=response)
+
+    def close(self):
+        """Close every pooled connection"""
+        self.pool.clear()
+
+
+class HttpxTransport:
+    """Sends requests through an httpx.Client
+
+    http2 needs the h2 package, it is used when installed unless
+    http2=False
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, timeout=None,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                 http2=None):
+        # pylint: disable=import-outside-toplevel
+        import httpx
+        if http2 is None:
+            try:
+                # pylint: disable=unused-import
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+        del pool_connections, pool_block
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(None, connect=timeout[0],
+                                    read=timeout[1])
+        self.errors = (httpx.TransportError,)
+        self.timeouts = (httpx.TimeoutException,)
+        self.client = httpx.Client(
+            http2=http2, timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_maxsize,
+                                max_keepalive_connections=pool_maxsize))
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """Send one request"""
+        request = self.client.build_request(method, url, content=body,
+                                            headers=headers)
+        response = self.client.send(request, stream=stream)
+        if stream:
+            return StreamedResponse(response.status_code, response.headers,
+                                    response.iter_bytes, response.close)
+        return Response(response.status_code, response.headers,
+                        response.content, raw=response)
+
+    def close(self):
+        """Close the client and its connections"""
+        self.client.close()
+
+
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'urllib3': Urllib3Transport,
+    'httpx': HttpxTransport,
+}
+
+
+def make_transport(transport, session=None, timeout=None, **pool):
+    """Turn a driver's transport argument into (transport, owned)
+
+    transport is a name from TRANSPORTS, None for requests, or a transport
+    instance which stays its owner's to close. pool holds the
+    pool_connections, pool_maxsize and pool_block settings.
+    """
+    if transport is None or transport == 'requests':
+        return RequestsTransport(session=session, timeout=timeout,
+                                 **pool), True
+    if isinstance(transport, str):
+        if transport not in TRANSPORTS:
+            raise ValueError("Unknown transport {0}".format(transport))
+        return TRANSPORTS[transport](timeout=timeout, **pool), True
+    return transport, False
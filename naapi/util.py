@@ -0,0 +1,86 @@
+"""Small helpers shared by the naapi modules"""
+import hashlib
+import os
+from . import jsonlib
+
+# Overrides the API host of every driver that is not given host=
+HOST_ENV = 'NAAPI_API_HOST'
+
+# Kinds of change between two snapshots of a set of records
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# Events a subscriber queue holds before the oldest are dropped
+DEFAULT_MAX_QUEUE = 1000
+
+# Put on every subscriber queue on close, ends the subscriber's iterator
+CLOSED = object()
+
+
+def api_root(hosts, api_version, host=None):
+    """Return the root url requests are sent to
+
+    host, or the NAAPI_API_HOST environment variable, replaces the host
+    looked up in hosts for api_version. It is a host[:port] reached over
+    https or a full url such as http://127.0.0.1:8080 for a local server.
+    """
+    if host is None:
+        host = os.environ.get(HOST_ENV) or hosts.get(api_version,
+                                                     hosts['v1'])
+    if '://' in host:
+        return host.rstrip('/')
+    return 'https://{0}'.format(host)
+
+
+def decode(response):
+    """Return the parsed JSON body of a response from either driver
+
+    Sync responses have a json() method, the asyncio driver returns the
+    body text, typed mode naapi.models records are turned back into dicts
+    and anything else is taken as already decoded
+    """
+    if hasattr(response, 'to_dict'):
+        return response.to_dict()
+    if hasattr(response, 'to_list'):
+        return response.to_list()
+    if hasattr(response, 'json'):
+        return response.json()
+    if isinstance(response, (str, bytes)):
+        return jsonlib.loads(response)
+    return response
+
+
+def digest(record, ignore=()):
+    """Short content hash of a JSON record, leaving out the keys in ignore
+
+    Records with the same content hash the same whatever their key order
+    """
+    if ignore:
+        record = dict((key, value) for key, value in record.items()
+                      if key not in ignore)
+    return hashlib.blake2b(jsonlib.dumpb(record, sort_keys=True),
+                           digest_size=8).digest()
+
+
+def offer(queue, item):
+    """Put item on an asyncio.Queue, dropping the oldest item if full
+
+    A slow subscriber loses its oldest events instead of holding every
+    event since it last read. Returns True when an item was dropped.
+    """
+    dropped = queue.full()
+    if dropped:
+        queue.get_nowait()
+    queue.put_nowait(item)
+    return dropped
+
+
+def field(record, keys):
+    """First of keys with a value in record, as text, or None"""
+    if not record:
+        return None
+    for key in keys:
+        if record.get(key) not in (None, ''):
+            return str(record[key])
+    return None
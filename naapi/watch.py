@@ -0,0 +1,226 @@
+"""Fleet watcher emitting only what changed between polls
+
+Rebuilding all orchestration state from servers() every loop costs the
+same whether one node changed or none did. A FleetWatcher polls servers()
+(and optionally status() of every node) with a naapi.aioapi driver, keeps
+the previous snapshot keyed by mbpkgid with a content hash per node and
+emits an added, removed or changed FleetEvent only for the nodes that
+differ. The poll interval tightens to min_interval while the fleet is
+changing and relaxes towards max_interval while it is idle.
+
+    async with FleetWatcher(conn, status=True) as watcher:
+        async for event in watcher.events():
+            handle(event.kind, event.mbpkgid, event.new)
+
+or with a callback:
+
+    watcher.on_change(handle_event)
+    await watcher.start()
+"""
+import asyncio
+from .util import (ADDED, CHANGED, CLOSED, DEFAULT_MAX_QUEUE, REMOVED,
+                   decode, digest, offer)
+
+
+# pylint: disable=too-few-public-methods
+class FleetEvent:
+    """One node that was added, removed or changed between two polls
+
+    old and new are the node's snapshots, {'server': servers() record} plus
+    'status' when statuses are watched. old is None when added, new when
+    removed.
+    """
+    __slots__ = ('kind', 'mbpkgid', 'old', 'new')
+
+    def __init__(self, kind, mbpkgid, old=None, new=None):
+        self.kind = kind
+        self.mbpkgid = mbpkgid
+        self.old = old
+        self.new = new
+
+    def __repr__(self):
+        return "<FleetEvent {0} {1}>".format(self.kind, self.mbpkgid)
+
+
+class Snapshot:
+    """Records keyed by id with a content hash each
+
+    diff() replaces the snapshot with a new set of records and returns the
+    FleetEvents between the two. Keys in ignore are left out of the hash,
+    in a record and in the dicts it holds such as its server record.
+    """
+    def __init__(self, ignore=()):
+        self.ignore = frozenset(ignore)
+        self.records = {}
+        self._hashes = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _content(self, record):
+        """record without the ignored keys, in nested dicts as well"""
+        if not self.ignore:
+            return record
+        return dict((key, self._content(value)
+                     if isinstance(value, dict) else value)
+                    for key, value in record.items()
+                    if key not in self.ignore)
+
+    def diff(self, records):
+        """Take records, {id: record}, as the new snapshot"""
+        events = []
+        hashes = {}
+        for key, record in records.items():
+            content = hashes[key] = digest(self._content(record))
+            old_content = self._hashes.get(key)
+            if old_content is None:
+                events.append(FleetEvent(ADDED, key, None, record))
+            elif old_content != content:
+                events.append(FleetEvent(CHANGED, key, self.records[key],
+                                         record))
+        for key in self.records:
+            if key not in records:
+                events.append(FleetEvent(REMOVED, key, self.records[key],
+                                         None))
+        self.records = dict(records)
+        self._hashes = hashes
+        return events
+
+
+# pylint: disable=too-many-instance-attributes
+class FleetWatcher:
+    """Poll the fleet with an adaptive interval, emit only the changes
+
+    After a poll that found changes the next one comes min_interval
+    seconds later, each quiet poll multiplies the interval by backoff up
+    to max_interval. With status, status() of every node is fetched
+    through fan_out() and is part of its snapshot. The first poll fills
+    the snapshot silently unless initial is set. A failed poll is counted
+    in errors and skipped, it never reports nodes as removed. ignore lists
+    keys, such as an uptime counter, whose changes are not reported.
+
+    Each events() subscriber holds up to max_queue unread events (None
+    for no limit), beyond that its oldest are dropped and counted in
+    dropped. close() ends every events() iterator.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, driver, min_interval=5.0, max_interval=60.0,
+                 backoff=1.5, status=False, initial=False, ignore=(),
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.driver = driver
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.status = status
+        self.initial = initial
+        self.snapshot = Snapshot(ignore)
+        self.interval = min_interval
+        self.max_queue = max_queue
+        self.polls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_error = None
+        self._callbacks = []
+        self._subscribers = set()
+        self._task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _fetch(self):
+        """Return the current fleet as {mbpkgid: snapshot record}"""
+        servers = decode(await self.driver.servers())
+        if not isinstance(servers, list):
+            raise ValueError(
+                "not a server list: {0!r}".format(servers)[:200])
+        fleet = dict((str(record['mbpkgid']), {'server': record})
+                     for record in servers if 'mbpkgid' in record)
+        if self.status and fleet:
+            async for node in self.driver.fan_out(list(fleet),
+                                                  endpoints=('status',)):
+                if not node.ok:
+                    raise node.errors['status']
+                fleet[str(node.mbpkgid)]['status'] = decode(
+                    node.results['status'])
+        return fleet
+
+    async def poll(self):
+        """Poll once, update the snapshot and interval, return the events"""
+        first = self.polls == 0 and not self.snapshot
+        events = self.snapshot.diff(await self._fetch())
+        self.polls += 1
+        if events and not first:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff,
+                                self.max_interval)
+        if first and not self.initial:
+            return []
+        return events
+
+    def on_change(self, callback):
+        """Call callback(event) for every event, it may be a coroutine"""
+        self._callbacks.append(callback)
+
+    async def start(self):
+        """Start polling in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _emit(self, event):
+        for queue in list(self._subscribers):
+            self.dropped += offer(queue, event)
+        for callback in self._callbacks:
+            try:
+                called = callback(event)
+                if asyncio.iscoroutine(called):
+                    await called
+            # pylint: disable=broad-except
+            except Exception:
+                # a failing consumer must not stop the watcher
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                events = await self.poll()
+            except asyncio.CancelledError:
+                raise
+            # pylint: disable=broad-except
+            except Exception as exc:
+                self.errors += 1
+                self.last_error = exc
+                events = []
+            for event in events:
+                await self._emit(event)
+            await asyncio.sleep(self.interval)
+
+    async def events(self):
+        """Async iterator over the FleetEvents of every poll"""
+        queue = asyncio.Queue(self.max_queue or 0)
+        self._subscribers.add(queue)
+        await self.start()
+        try:
+            while True:
+                event = await queue.get()
+                if event is CLOSED:
+                    return
+                yield event
+        finally:
+            self._subscribers.discard(queue)
+
+    async def close(self):
+        """Stop polling and end every events() iterator"""
+        for queue in self._subscribers:
+            offer(queue, CLOSED)
+        self._subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -26,4 +26,12 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules',
     ],
     install_requires=['requests>=2.21.0',],
+    entry_points={
+        'console_scripts': ['naapi=naapi.cli:main'],
+    },
+    extras_require={
+        'fast': ['orjson'],
+        'httpx': ['httpx[http2]'],
+        'numpy': ['numpy'],
+    },
 )
@@ -0,0 +1,37 @@
+"""Fixtures running the drivers against benchmarks/mock_server.py"""
+import re
+import pytest
+from benchmarks.mock_server import MockServer
+
+
+class Outage:
+    """Makes the mock answer matching paths with an error while active"""
+    def __init__(self, api, pattern, status=404):
+        self.active = True
+        self.status = status
+        self.hits = 0
+        self._pattern = re.compile(pattern)
+        self._route = api.route
+
+        def route(path, params):
+            if self._pattern.match(path):
+                self.hits += 1
+                if self.active:
+                    return self.status, b'{"error": 1, "msg": "outage"}'
+            return self._route(path, params)
+        api.route = route
+
+
+@pytest.fixture
+def server():
+    """A small mock fleet served on a local port"""
+    with MockServer(servers=20) as mock:
+        yield mock
+
+
+@pytest.fixture
+def outage(server):
+    """outage(pattern, status=404) starts failing the matching paths"""
+    def start(pattern, status=404):
+        return Outage(server.api, pattern, status)
+    return start
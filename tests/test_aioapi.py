@@ -0,0 +1,98 @@
+"""naapi.aioapi against the mock server"""
+import asyncio
+import json
+import aiohttp
+import pytest
+from benchmarks.mock_server import MockServer
+from naapi.aioapi import NetActuateNodeDriver
+from naapi.aiotransports import AiohttpTransport
+from naapi.exceptions import NetActuateException, TIMEOUT
+
+
+def test_cache_skips_errors(server, outage):
+    failing = outage(r'^/cloud/sizes')
+
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url,
+                                        cache=True) as conn:
+            first = await conn.plans()
+            failing.active = False
+            second = await conn.plans()
+            third = await conn.plans()
+            return first, second, third, conn.cache
+
+    first, second, third, cache = asyncio.run(run())
+    assert first.status_code == 404
+    assert second.ok and third.ok
+    assert second.json() == third.json()
+    # the 404 was not stored, the good answer was
+    assert failing.hits == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_coalesced_locations():
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url,
+                                        coalesce=True) as conn:
+            return await asyncio.gather(
+                *[conn.locations() for _ in range(30)])
+
+    with MockServer(servers=20, latency=0.05) as server:
+        responses = asyncio.run(run())
+    first = responses[0].json()
+    assert len(first) == 8
+    assert first[0]['country'] == 'US'
+    assert all(response.json() == first for response in responses)
+
+
+def test_locations_still_loads_as_text(server):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            return await conn.locations()
+
+    locations = asyncio.run(run())
+    assert json.loads(locations) == locations.json()
+
+
+def test_one_shared_session(server):
+    async def run():
+        conn = NetActuateNodeDriver('key', host=server.url, limit=7)
+        async with conn:
+            session = conn.get_session()
+            await asyncio.gather(*[conn.servers() for _ in range(10)])
+            assert conn.get_session() is session
+            assert session.connector.limit == 7
+        assert session.closed
+        # used again after close, the driver opens a new session
+        assert (await conn.servers()).ok
+        assert conn.get_session() is not session
+        await conn.close()
+
+    asyncio.run(run())
+
+
+def test_session_handed_in_stays_open(server):
+    async def run():
+        session = aiohttp.ClientSession()
+        transport = AiohttpTransport(session=lambda: session)
+        async with NetActuateNodeDriver('key', host=server.url,
+                                        transport=transport) as conn:
+            assert conn.get_session() is session
+            assert (await conn.servers()).ok
+        assert not session.closed
+        await session.close()
+
+    asyncio.run(run())
+
+
+def test_read_timeout():
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url,
+                                        read_timeout=0.1,
+                                        retry=False) as conn:
+            with pytest.raises(NetActuateException) as raised:
+                await conn.servers()
+            return raised.value
+
+    with MockServer(servers=1, latency=0.5) as server:
+        assert asyncio.run(run()).code == TIMEOUT
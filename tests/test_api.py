@@ -0,0 +1,65 @@
+"""naapi.api against the mock server"""
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from benchmarks.mock_server import MockServer
+from naapi.api import NetActuateNodeDriver
+from naapi.exceptions import NetActuateException, TIMEOUT
+
+
+def test_coalesced_locations():
+    with MockServer(servers=20, latency=0.05) as server, \
+            NetActuateNodeDriver('key', host=server.url,
+                                 coalesce=True) as conn:
+        with ThreadPoolExecutor(30) as pool:
+            responses = list(pool.map(lambda _: conn.locations(), range(30)))
+    assert all(response.ok for response in responses)
+    first = responses[0].json()
+    assert len(first) == 8
+    assert first[0]['country'] == 'US'
+    assert all(response.json() == first for response in responses)
+
+
+def test_requests_share_one_connection(server):
+    with NetActuateNodeDriver('key', host=server.url,
+                              pool_maxsize=4) as conn:
+        for _ in range(5):
+            assert conn.servers().ok
+        pools = conn.session.get_adapter(server.url).poolmanager.pools
+        (pool,) = [pools[key] for key in pools.keys()]
+    assert pool.pool.maxsize == 4
+    assert pool.num_connections == 1
+    assert pool.num_requests == 5
+
+
+def test_read_timeout():
+    with MockServer(servers=1, latency=0.5) as server, \
+            NetActuateNodeDriver('key', host=server.url, read_timeout=0.1,
+                                 retry=False) as conn:
+        with pytest.raises(NetActuateException) as raised:
+            conn.servers()
+    assert raised.value.code == TIMEOUT
+    # never let the url, and so the key, into the message
+    assert 'key' not in str(raised.value)
+
+
+class Session(requests.Session):
+    """A session counting how often it is closed"""
+    closed = 0
+
+    def close(self):
+        self.closed += 1
+        super().close()
+
+
+def test_session_handed_in_stays_open(server):
+    session = Session()
+    with NetActuateNodeDriver('key', host=server.url,
+                              session=session) as conn:
+        assert conn.session is session
+        assert conn.servers().ok
+    assert session.closed == 0
+    with NetActuateNodeDriver('key', host=server.url) as own:
+        assert own.servers().ok
+    # the driver's own session is closed along with its connections
+    assert not own.session.get_adapter(server.url).poolmanager.pools.keys()
@@ -0,0 +1,125 @@
+"""naapi.bandwidth on both the NumPy and the array.array columns"""
+import asyncio
+import io
+import json
+import pytest
+from naapi import aioapi, bandwidth
+from naapi.api import NetActuateNodeDriver
+from naapi.exceptions import NetActuateException
+
+MONTH = '2026-01'
+
+
+def expected_rx(mbpkgid):
+    # the mock reports day * 1000 * scale for days 1 to 30
+    return 465 * 1000 * (mbpkgid % 7 + 1)
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def columns(request, monkeypatch):
+    """Run a test once with NumPy and once without"""
+    if request.param == 'array':
+        monkeypatch.setattr(bandwidth, 'numpy', None)
+    elif bandwidth.numpy is None:
+        pytest.skip("NumPy is not installed")
+    return request.param
+
+
+def test_month_totals():
+    report = [{'month': '2026-01-03', 'rx': '10', 'tx': 20},
+              {'date': '2026-02-01', 'in': 1, 'out': 2},
+              {'rx': 5}]
+    assert bandwidth.month_totals(report, month='2026-03') == {
+        '2026-01': [10.0, 20.0], '2026-02': [1.0, 2.0],
+        '2026-03': [5.0, 0.0]}
+
+
+def test_month_totals_error_payload():
+    with pytest.raises(NetActuateException):
+        bandwidth.month_totals({'error': 1, 'msg': 'no such package'})
+
+
+def test_collect(server, columns):
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        fleet = bandwidth.collect(conn, month=MONTH)
+    assert len(fleet) == 20
+    assert not fleet.errors
+    rx = dict(zip(fleet.column('mbpkgid'), fleet.column('rx')))
+    assert rx[100003] == expected_rx(100003)
+    assert list(fleet.total) == [rx + tx for rx, tx
+                                 in zip(fleet.rx, fleet.tx)]
+
+
+def test_error_payload_recorded(server, outage, columns):
+    outage(r'^/cloud/servermonthlybw/100003$')
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        fleet = bandwidth.collect(conn, month=MONTH)
+    assert len(fleet) == 19
+    assert 100003 not in list(fleet.column('mbpkgid'))
+    assert isinstance(fleet.errors['100003'], NetActuateException)
+
+
+def test_acollect_error_payload_recorded(server, outage, columns):
+    outage(r'^/cloud/servermonthlybw/100005$')
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver('key',
+                                               host=server.url) as conn:
+            return await bandwidth.acollect(conn, month=MONTH)
+
+    fleet = asyncio.run(run())
+    assert len(fleet) == 19
+    assert isinstance(fleet.errors['100005'], NetActuateException)
+
+
+def build(reports):
+    fleet = bandwidth.FleetBandwidth()
+    for mbpkgid, location, report in reports:
+        fleet.add(mbpkgid, report, location, 'small', MONTH)
+    return fleet
+
+
+def test_rollup_and_top(columns):
+    fleet = build([
+        (1, 'LAX', [{'rx': 10, 'tx': 0}]),
+        (2, 'LAX', [{'rx': 5, 'tx': 5}, {'month': '2025-12', 'rx': 1}]),
+        (3, 'AMS', [{'rx': 30, 'tx': 0}]),
+    ])
+    rollup = fleet.rollup('location')
+    assert list(rollup.column('location')) == ['AMS', 'LAX']
+    assert list(rollup.column('nodes')) == [1, 2]
+    assert list(rollup.column('total')) == [30.0, 21.0]
+    by_month = fleet.rollup(('location', 'month'))
+    assert sorted(zip(by_month.column('location'),
+                      by_month.column('month'),
+                      by_month.column('total'))) == [
+        ('AMS', MONTH, 30.0), ('LAX', '2025-12', 1.0),
+        ('LAX', MONTH, 20.0)]
+    top = fleet.top(2)
+    assert list(top.column('mbpkgid')) == [3, 2]
+    assert list(top.column('total')) == [30.0, 11.0]
+    assert list(fleet.top(5, month='2025-12').column('mbpkgid')) == [2]
+    with pytest.raises(ValueError):
+        fleet.rollup('node')
+
+
+def test_percentiles(columns):
+    fleet = build([(index, 'LAX', [{'rx': index}])
+                   for index in range(1, 6)])
+    assert fleet.percentiles((0, 50, 100), measure='rx') == {
+        0: 1.0, 50: 3.0, 100: 5.0}
+    assert bandwidth.FleetBandwidth().percentiles((50,)) == {50: None}
+
+
+def test_writers(columns):
+    fleet = build([(1, 'LAX', [{'rx': 1, 'tx': 2}])])
+    text = io.StringIO()
+    fleet.write_csv(text)
+    assert text.getvalue().splitlines() == [
+        'mbpkgid,location,package,month,rx,tx,total',
+        '1,LAX,small,{0},1.0,2.0,3.0'.format(MONTH)]
+    text = io.StringIO()
+    fleet.rollup().write_ndjson(text)
+    assert [json.loads(line) for line in text.getvalue().splitlines()] == [
+        {'location': 'LAX', 'nodes': 1, 'rx': 1.0, 'tx': 2.0, 'total': 3.0}]
+
@@ -0,0 +1,77 @@
+"""NetActuateNodeDriver.batch() against the mock server"""
+import threading
+import time
+import pytest
+from naapi.api import NetActuateNodeDriver
+
+MBPKGIDS = list(range(100000, 100020))
+
+
+@pytest.fixture
+def conn(server):
+    with NetActuateNodeDriver('key', host=server.url,
+                              pool_maxsize=4) as driver:
+        yield driver
+
+
+def test_results_in_input_order(conn):
+    results = conn.batch(
+        [('servers', mbpkgid) for mbpkgid in MBPKGIDS] +
+        ['locations', ('plans', (), {'location': 'LAX'})])
+    assert [result.index for result in results] == list(range(22))
+    assert [result.result.json()['mbpkgid']
+            for result in results[:20]] == MBPKGIDS
+    assert all(result.ok for result in results)
+    assert results[20].method == 'locations'
+    assert results[21].kwargs == {'location': 'LAX'}
+
+
+def test_failed_call_does_not_stop_the_batch(conn):
+    def broken(mbpkgid):
+        raise ValueError(mbpkgid)
+    conn.broken = broken
+    results = conn.batch([('status', 100000), ('broken', 1),
+                          ('status', 100001)])
+    assert [result.ok for result in results] == [True, False, True]
+    assert isinstance(results[1].exception, ValueError)
+    assert 'ok=False' in repr(results[1])
+
+
+def test_unknown_method(conn):
+    with pytest.raises(ValueError):
+        conn.batch([('status', 1), ('nope', 1)])
+
+
+def test_workers_default_to_pool_size(conn):
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow(mbpkgid):
+        with lock:
+            active.append(mbpkgid)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.remove(mbpkgid)
+        return mbpkgid
+    conn.slow = slow
+    results = conn.batch([('slow', mbpkgid) for mbpkgid in MBPKGIDS])
+    assert [result.result for result in results] == MBPKGIDS
+    assert max(peak) == 4
+
+
+def test_as_completed_stops_early(conn):
+    started = []
+
+    def slow(mbpkgid):
+        started.append(mbpkgid)
+        time.sleep(0.02)
+        return mbpkgid
+    conn.slow = slow
+    for result in conn.batch_as_completed(
+            [('slow', mbpkgid) for mbpkgid in MBPKGIDS], max_workers=2):
+        assert result.ok
+        break
+    # calls not yet started when the consumer stopped were dropped
+    assert len(started) < len(MBPKGIDS)
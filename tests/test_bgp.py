@@ -0,0 +1,66 @@
+"""naapi.bgp against the mock server"""
+import asyncio
+import pytest
+from naapi.api import NetActuateNodeDriver
+from naapi.bgp import ADDED, CHANGED, REMOVED, BGPIndex, BGPTracker
+
+
+def test_update_reports_changes(server):
+    index = BGPIndex()
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        sessions = conn.bgp_sessions().json()
+    assert set(change.kind for change in index.update(sessions)) == {ADDED}
+    assert len(index.by_state('Established')) == 20
+    down = dict(sessions[0], state='Idle')
+    changes = index.update([down] + sessions[2:])
+    assert sorted(change.kind for change in changes) == [CHANGED, REMOVED]
+    changed = [change for change in changes if change.kind == CHANGED][0]
+    assert changed.transition == ('Established', 'Idle')
+    assert index.by_state('Idle')[0]['id'] == down['id']
+
+
+class Sessions:
+    """A driver answering bgp_sessions() from a list that tests change"""
+    def __init__(self, count):
+        self.sessions = [{'id': index, 'mbpkgid': index, 'state':
+                          'Established'} for index in range(1, count + 1)]
+
+    async def bgp_sessions(self):
+        return [dict(session) for session in self.sessions]
+
+
+def test_tracker_close_ends_iterators():
+    driver = Sessions(3)
+
+    async def consume(tracker):
+        return [change.session_id
+                async for change in tracker.changes()]
+
+    async def run():
+        tracker = BGPTracker(driver, interval=0.01)
+        consumers = [asyncio.ensure_future(consume(tracker))
+                     for _ in range(2)]
+        await asyncio.sleep(0.05)
+        driver.sessions[0]['state'] = 'Idle'
+        await asyncio.sleep(0.05)
+        await tracker.close()
+        return await asyncio.wait_for(asyncio.gather(*consumers), 1)
+
+    # the first poll only fills the index
+    assert asyncio.run(run()) == [['1'], ['1']]
+
+
+def test_tracker_drops_oldest_changes():
+    async def run():
+        tracker = BGPTracker(Sessions(5), interval=10, initial=True,
+                             max_queue=2)
+        changes = tracker.changes()
+        # all five changes arrive before the subscriber reads again
+        first = await changes.__anext__()
+        second = await changes.__anext__()
+        await tracker.close()
+        with pytest.raises(StopAsyncIteration):
+            await changes.__anext__()
+        return first.session_id, second.session_id, tracker.dropped
+
+    assert asyncio.run(run()) == ('4', '5', 3)
@@ -0,0 +1,92 @@
+"""naapi.blocking against the mock server"""
+import threading
+import pytest
+from naapi.blocking import BlockingNodeDriver, LoopThread
+
+MBPKGIDS = list(range(100000, 100020))
+
+
+@pytest.fixture
+def conn(server):
+    with BlockingNodeDriver('key', host=server.url, limit=8) as driver:
+        yield driver
+
+
+def test_endpoint_methods(conn):
+    servers = conn.servers()
+    assert servers.ok
+    assert len(servers.json()) == 20
+    assert conn.servers(100004).json()['mbpkgid'] == 100004
+    assert conn.locations().json()[0]['country'] == 'US'
+    assert conn.limit == 8
+    records = list(conn.iter_servers())
+    assert [record['mbpkgid'] for record in records] == MBPKGIDS
+
+
+def test_batch_runs_on_one_loop(conn):
+    threads = set()
+
+    async def where(mbpkgid):
+        threads.add(threading.current_thread().name)
+        return mbpkgid
+    conn.driver.where = where
+    results = conn.batch([('where', mbpkgid) for mbpkgid in MBPKGIDS] +
+                         [('status', 100001)], max_workers=4)
+    assert [result.result for result in results[:20]] == MBPKGIDS
+    assert results[20].ok
+    assert threads == {'naapi-loop'}
+    finished = sorted(result.index for result in conn.batch_as_completed(
+        [('status', mbpkgid) for mbpkgid in MBPKGIDS]))
+    assert finished == list(range(20))
+
+
+def test_errors_and_unknown_methods(conn):
+    async def broken(mbpkgid):
+        raise ValueError(mbpkgid)
+    conn.driver.broken = broken
+    results = conn.batch([('broken', 1), ('status', 100001)])
+    assert isinstance(results[0].exception, ValueError)
+    assert results[1].ok
+    with pytest.raises(ValueError):
+        conn.call('broken', 2)
+    with pytest.raises(ValueError):
+        conn.submit_batch([('nope', 1)])
+    with pytest.raises(AttributeError):
+        conn.nope  # pylint: disable=pointless-statement
+
+
+def test_submit_returns_futures(conn):
+    futures = conn.submit_batch([('status', mbpkgid)
+                                 for mbpkgid in MBPKGIDS], concurrency=3)
+    assert all(future.result(5).ok for future in futures)
+    assert conn.submit('servers', 100002).result(5).ok
+
+
+def test_fan_out_and_bulk(conn):
+    nodes = list(conn.fan_out(MBPKGIDS[:5], endpoints=('status',)))
+    assert sorted(node.mbpkgid for node in nodes) == MBPKGIDS[:5]
+    results = conn.bulk('reboot', MBPKGIDS[:5], max_workers=2)
+    assert all(result.ok and result.job_id for result in results)
+
+
+def test_call_from_the_loop_thread_raises(conn):
+    errors = []
+
+    def progress(result, done, total):
+        try:
+            conn.status(result.mbpkgid)
+        except RuntimeError as exc:
+            errors.append(exc)
+    conn.bulk('start', MBPKGIDS[:2], progress=progress)
+    assert len(errors) == 2
+
+
+def test_shared_loop(server):
+    loop = LoopThread()
+    with BlockingNodeDriver('key', host=server.url, loop=loop) as first, \
+            BlockingNodeDriver('key', host=server.url, loop=loop) as second:
+        assert first.status(100001).ok and second.status(100002).ok
+    # the drivers leave a loop handed in running
+    assert loop.running
+    loop.stop()
+    assert not loop.running
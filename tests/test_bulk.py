@@ -0,0 +1,83 @@
+"""Both drivers' bulk() against the mock server"""
+import asyncio
+import time
+import pytest
+from naapi import aioapi
+from naapi.api import NetActuateNodeDriver
+from naapi.bulk import schedule
+from naapi.exceptions import NetActuateException, API_ERROR
+
+MBPKGIDS = list(range(100000, 100020))
+
+
+def test_sync_bulk(server):
+    progress = []
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        results = conn.bulk(
+            'reboot', MBPKGIDS + [999], force=True,
+            progress=lambda result, done, total: progress.append(
+                (done, total)))
+    assert [result.mbpkgid for result in results] == MBPKGIDS + [999]
+    assert all(result.ok for result in results[:20])
+    assert len(set(result.job_id for result in results[:20])) == 20
+    assert results[0].job == (100000, results[0].job_id)
+    # the unknown node answers with an error payload
+    assert not results[20].ok
+    assert isinstance(results[20].exception, NetActuateException)
+    assert results[20].exception.code == API_ERROR
+    assert results[20].job is None
+    assert sorted(progress) == [(done, 21) for done in range(1, 22)]
+
+
+def test_unknown_operation(server):
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        with pytest.raises(ValueError):
+            conn.bulk('build', MBPKGIDS)
+
+
+def test_schedule_staggers_each_location():
+    locations = {'1': 'LAX', '2': 'LAX', '3': 'AMS', '4': 'LAX'}
+    assert schedule([1, 2, 3, 4], locations, 10) == [
+        (0, 0, 1, 'LAX'), (0, 2, 3, 'AMS'), (10, 1, 2, 'LAX'),
+        (20, 3, 4, 'LAX')]
+    assert [item[0] for item in schedule([1, 2], locations, None)] == [0, 0]
+
+
+def test_sync_stagger(server):
+    by_location = {}
+    for record in server.api.servers:
+        by_location.setdefault(record['location_id'], []).append(
+            record['mbpkgid'])
+    location, same = max(by_location.items(),
+                         key=lambda item: len(item[1]))
+    same = same[:3]
+    assert len(same) == 3
+    start = time.monotonic()
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        results = conn.bulk('start', same, stagger=0.05)
+    assert all(result.ok for result in results)
+    assert results[0].location == location
+    assert time.monotonic() - start >= 0.1
+
+
+def test_async_bulk_then_wait(server):
+    progress = []
+
+    async def report(result, done, total):
+        progress.append(done)
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver('key',
+                                               host=server.url) as conn:
+            results = await conn.bulk('shutdown', MBPKGIDS, concurrency=4,
+                                      progress=report)
+            async with conn.job_watcher(min_interval=0.01) as watcher:
+                jobs = await watcher.wait_all(
+                    [result.job for result in results], timeout=5)
+            return results, jobs
+
+    results, jobs = asyncio.run(run())
+    assert all(result.ok for result in results)
+    assert sorted(progress) == list(range(1, 21))
+    assert len(jobs) == 20
+    assert all(job['status'] == 5 for job in jobs.values())
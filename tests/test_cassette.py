@@ -0,0 +1,146 @@
+"""naapi.cassette and naapi.aiocassette against the mock server"""
+import asyncio
+import gc
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from naapi import aioapi
+from naapi.aiocassette import AsyncRecordingTransport, AsyncReplayTransport
+from naapi.api import NetActuateNodeDriver
+from naapi.cassette import (REDACTED, Cassette, CassetteWriter,
+                            RecordingTransport, ReplayTransport, constant)
+
+SECRET = 'sekrit-api-key'
+NODES = [100000 + index for index in range(20)]
+
+
+@pytest.fixture
+def echo(server):
+    """/cloud/echo answers with the request parameters, key included"""
+    server.api.routes.insert(0, (re.compile(r'^/cloud/echo$'),
+                                 lambda params: params))
+    return server
+
+
+def record(path, url):
+    recorder = RecordingTransport(str(path))
+    with NetActuateNodeDriver(SECRET, host=url, transport=recorder) as conn:
+        live = {'servers': conn.servers().json(),
+                'summaries': [conn.summary(mbpkgid).json()
+                              for mbpkgid in NODES],
+                'locations': conn.locations().json()}
+    recorder.close()
+    return live
+
+
+def test_record_then_replay(server, tmp_path):
+    path = tmp_path / 'fleet.cassette'
+    live = record(path, server.url)
+    replay = ReplayTransport(str(path))
+    with NetActuateNodeDriver('other-key', transport=replay) as conn:
+        assert conn.servers().json() == live['servers']
+        assert [conn.summary(mbpkgid).json()
+                for mbpkgid in NODES] == live['summaries']
+        assert conn.locations().json() == live['locations']
+
+
+def test_async_replay_of_a_sync_recording(server, tmp_path):
+    path = tmp_path / 'fleet.cassette'
+    live = record(path, server.url)
+
+    async def run():
+        replay = AsyncReplayTransport(str(path))
+        async with aioapi.NetActuateNodeDriver('other-key',
+                                               transport=replay) as conn:
+            return (await conn.servers()).json()
+
+    assert asyncio.run(run()) == live['servers']
+
+
+def test_key_is_redacted(echo, tmp_path):
+    path = tmp_path / 'echo.cassette'
+    recorder = RecordingTransport(str(path))
+    response = recorder.request(
+        'POST', echo.url + '/cloud/echo?key=' + SECRET,
+        body=json.dumps({'key': SECRET, 'fqdn': 'a.example.com'}))
+    assert SECRET in response.text
+    recorder.close()
+    raw = path.read_bytes()
+    cassette = Cassette(str(path))
+    body = cassette.body(cassette.entries[0])
+    cassette.close()
+    assert SECRET.encode() not in raw
+    assert SECRET.encode() not in body
+    assert json.loads(body)['key'] == REDACTED
+    assert 'key' not in cassette.entries[0]['query']
+
+
+def test_async_recording_redacts(echo, tmp_path):
+    path = tmp_path / 'echo.cassette'
+
+    async def run():
+        recorder = AsyncRecordingTransport(str(path))
+        await recorder.request('GET', echo.url + '/cloud/echo?key=' + SECRET)
+        await recorder.close()
+
+    asyncio.run(run())
+    assert SECRET.encode() not in path.read_bytes()
+
+
+def outcomes(path, seed):
+    replay = ReplayTransport(str(path), latency=constant(0.001),
+                             error_rate=0.3, timeout_rate=0.1, seed=seed,
+                             concurrency=8)
+    with NetActuateNodeDriver('key', transport=replay, retry=False) as conn:
+        def one(mbpkgid):
+            try:
+                return conn.summary(mbpkgid).status_code
+            # pylint: disable=broad-except
+            except Exception as exc:
+                return type(exc).__name__
+        with ThreadPoolExecutor(8) as pool:
+            return dict(zip(NODES, pool.map(one, NODES)))
+
+
+def aoutcomes(path, seed):
+    async def run():
+        replay = AsyncReplayTransport(str(path), latency=constant(0.001),
+                                      error_rate=0.3, timeout_rate=0.1,
+                                      seed=seed, concurrency=8)
+        async with aioapi.NetActuateNodeDriver('key', transport=replay,
+                                               retry=False) as conn:
+            async def one(mbpkgid):
+                try:
+                    return (await conn.summary(mbpkgid)).status_code
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    return type(exc).__name__
+            results = await asyncio.gather(*[one(mbpkgid)
+                                             for mbpkgid in NODES])
+            return dict(zip(NODES, results))
+    return asyncio.run(run())
+
+
+def test_replay_is_deterministic(server, tmp_path):
+    path = tmp_path / 'fleet.cassette'
+    record(path, server.url)
+    first = outcomes(path, seed=7)
+    assert first == outcomes(path, seed=7)
+    assert first == aoutcomes(path, seed=7)
+    assert set(first.values()) != {200}
+    assert first != outcomes(path, seed=8)
+
+
+def test_unclosed_cassette(tmp_path):
+    path = tmp_path / 'open.cassette'
+    writer = CassetteWriter(str(path))
+    writer.add(('GET', '/cloud/servers/', '', ''), 200, {}, b'[]', 0.01)
+    with pytest.raises(ValueError, match='not closed'):
+        Cassette(str(path))
+    # a writer that was forgotten finishes its cassette when collected
+    del writer
+    gc.collect()
+    cassette = Cassette(str(path))
+    assert cassette.body(cassette.entries[0]) == b'[]'
+    cassette.close()
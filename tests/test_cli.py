@@ -0,0 +1,91 @@
+"""The naapi command line against the mock server"""
+import io
+import json
+import pytest
+from naapi import cli
+
+
+@pytest.fixture
+def run(server, tmp_path, monkeypatch, capsys):
+    """run(*argv) runs naapi, returns (status, stdout lines)"""
+    monkeypatch.setenv(cli.CACHE_DIR_ENV, str(tmp_path))
+    monkeypatch.delenv(cli.KEY_ENV, raising=False)
+
+    def main(*argv, stdin=''):
+        monkeypatch.setattr('sys.stdin', io.StringIO(stdin))
+        status = cli.main(['--host', server.url] + list(argv))
+        return status, capsys.readouterr().out.splitlines()
+    return main
+
+
+def test_options_before_or_after_command(run):
+    status, before = run('-k', 'key', '-f', 'ndjson', 'servers')
+    assert status == 0
+    assert len(before) == 20
+    status, after = run('servers', '-k', 'key', '-f', 'ndjson')
+    assert status == 0
+    assert after == before
+
+
+def test_option_after_command_wins():
+    options = cli.main_parser(cli._commands()).parse_args(
+        ['-f', 'json', '-k', 'one', 'status', '7', '-k', 'two'])
+    assert options.key == 'two'
+    assert options.format == 'json'
+    assert options.mbpkgid == '7'
+
+
+def test_command_arguments(run):
+    status, lines = run('-k', 'key', 'servers', '100004')
+    assert status == 0
+    assert json.loads(lines[0])['mbpkgid'] == 100004
+    status, lines = run('-k', 'key', 'reboot', '100004', '--force')
+    assert status == 0
+    assert json.loads(lines[0])['params'] == ['force', 'key']
+
+
+def test_missing_key(run):
+    status, lines = run('servers')
+    assert status == 1
+    assert not lines
+
+
+def test_error_answer_fails(run, outage):
+    outage(r'^/cloud/status/')
+    status, lines = run('-k', 'key', 'status', '100001')
+    assert status == 1
+    assert json.loads(lines[0])['error'] == 1
+
+
+def test_catalog_disk_cache(run, server, outage):
+    status, first = run('-k', 'key', 'locations')
+    assert status == 0
+    # served from disk while the API is down
+    failing = outage(r'^/cloud/locations')
+    status, second = run('locations', '-k', 'key')
+    assert status == 0
+    assert second == first
+    assert failing.hits == 0
+    status, _ = run('-k', 'key', '--no-cache', 'locations')
+    assert status == 1
+    assert failing.hits == 1
+
+
+def test_disk_cache_expires(tmp_path):
+    cache = cli.DiskCache(str(tmp_path), ttl=0)
+    cache.put(('a',), {'b': 1})
+    assert cache.get('locations', ('a',)) is None
+    cache = cli.DiskCache(str(tmp_path), ttl=60)
+    assert cache.get('locations', ('a',)) == {'b': 1}
+    assert cache.get('locations', ('missing',)) is None
+
+
+def test_batch(run):
+    status, lines = run('batch', '-j', '4', '-k', 'key', stdin=(
+        'status 100001\n# comment\n\nstatus 100002\nnosuchcommand\n'))
+    assert status == 1
+    results = [json.loads(line) for line in lines]
+    assert [result['command'] for result in results] == [
+        'status 100001', 'status 100002', 'nosuchcommand']
+    assert 'status' in results[0]['result']
+    assert 'error' in results[2]
@@ -0,0 +1,86 @@
+"""The request bodies naapi.endpoints makes each driver send"""
+import asyncio
+import json
+from urllib.parse import parse_qs, urlsplit
+from naapi import aioapi
+from naapi.aiotransports import AiohttpTransport
+from naapi.api import NetActuateNodeDriver
+from naapi.endpoints import ENDPOINTS
+from naapi.transports import RequestsTransport
+
+
+class Recording(RequestsTransport):
+    """A requests transport keeping every request it sends"""
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        self.sent.append((method, urlsplit(url).path, body, headers))
+        return super().request(method, url, body, headers, stream)
+
+
+class AsyncRecording(AiohttpTransport):
+    """An aiohttp transport keeping every request it sends"""
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def request(self, method, url, body=None, headers=None,
+                      stream=False):
+        self.sent.append((method, urlsplit(url).path, body, headers))
+        return await super().request(method, url, body, headers, stream)
+
+
+def test_sync_posts_json(server):
+    transport = Recording()
+    with NetActuateNodeDriver('key', host=server.url,
+                              transport=transport) as conn:
+        assert conn.reboot(100001, force=True).ok
+        conn.delete(100002)
+        conn.delete(100003, {'cancel_billing': False})
+    transport.close()
+    (_, path, body, headers), delete, delete_extra = transport.sent
+    assert path == '/cloud/server/reboot/100001'
+    assert headers['Content-Type'] == 'application/json'
+    assert json.loads(body) == {'force': 1}
+    # a bare delete sends an empty body, the mbpkgid only goes along
+    # with extra_params
+    assert delete[1] == '/cloud/server/delete/100002'
+    assert json.loads(delete[2]) == {}
+    assert delete_extra[1] == '/cloud/server/delete/100003'
+    assert json.loads(delete_extra[2]) == {'cancel_billing': False,
+                                           'mbpkgid': 100003}
+
+
+def test_async_posts_form(server):
+    transport = AsyncRecording()
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver(
+                'key', host=server.url, transport=transport) as conn:
+            await conn.reboot(100001, force=True)
+            await conn.delete(100002)
+            await conn.delete(100003, {'cancel_billing': 0})
+        await transport.close()
+
+    asyncio.run(run())
+    (_, path, body, headers), delete, delete_extra = transport.sent
+    assert path == '/cloud/server/reboot/100001'
+    assert headers['Content-Type'] == 'application/x-www-form-urlencoded'
+    assert parse_qs(body.decode()) == {'force': ['1']}
+    assert delete[1] == '/cloud/server/delete/100002'
+    assert delete[2] == b''
+    assert delete_extra[1] == '/cloud/server/delete/100003'
+    assert parse_qs(delete_extra[2].decode()) == {
+        'cancel_billing': ['0'], 'mbpkgid': ['100003']}
+
+
+def test_path_values_are_quoted():
+    servers = [endpoint for endpoint in ENDPOINTS
+               if endpoint.name == 'servers' and not endpoint.stream][0]
+    path, data, key = servers.request(None, ('1/../2?x',), {})
+    assert path == '/cloud/server/1%2F..%2F2%3Fx'
+    assert data == {}
+    assert key == ('servers', '1/../2?x')
+    assert servers.request(None, (), {})[0] == '/cloud/servers/'
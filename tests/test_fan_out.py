@@ -0,0 +1,76 @@
+"""NetActuateNodeDriver.fan_out() against the mock server"""
+import asyncio
+import pytest
+from naapi.aioapi import NetActuateNodeDriver
+from naapi.util import decode
+
+MBPKGIDS = list(range(100000, 100020))
+
+
+def test_every_node_once(server):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            return [node async for node in conn.fan_out(
+                MBPKGIDS, endpoints=('status', 'ipv4'))]
+
+    nodes = asyncio.run(run())
+    assert sorted(node.mbpkgid for node in nodes) == MBPKGIDS
+    assert all(node.ok for node in nodes)
+    assert all(sorted(node.results) == ['ipv4', 'status'] for node in nodes)
+    assert 'status' in decode(nodes[0].results['status'])
+
+
+def test_concurrency_bound_and_errors(server):
+    active = []
+    peak = []
+
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            status = conn.status
+
+            async def counted(mbpkgid):
+                active.append(mbpkgid)
+                peak.append(len(active))
+                try:
+                    if mbpkgid == 100003:
+                        raise ValueError('broken node')
+                    return await status(mbpkgid)
+                finally:
+                    active.remove(mbpkgid)
+
+            # the instance attribute shadows the generated method
+            conn.status = counted
+            return [node async for node in conn.fan_out(
+                MBPKGIDS, endpoints=('status',), concurrency=3)]
+
+    nodes = asyncio.run(run())
+    assert max(peak) == 3
+    failed = [node for node in nodes if not node.ok]
+    assert [node.mbpkgid for node in failed] == [100003]
+    assert isinstance(failed[0].errors['status'], ValueError)
+    assert len(nodes) == 20
+
+
+def test_unknown_endpoint(server):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            with pytest.raises(ValueError):
+                async for _ in conn.fan_out(MBPKGIDS, endpoints=('nope',)):
+                    pass
+
+    asyncio.run(run())
+
+
+def test_stopping_early_cancels_the_rest(server):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            nodes = conn.fan_out(MBPKGIDS, endpoints=('status',),
+                                 concurrency=2)
+            async for _ in nodes:
+                break
+            await nodes.aclose()
+            await asyncio.sleep(0.05)
+            return [task for task in asyncio.all_tasks()
+                    if task is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,93 @@
+"""naapi.hedge"""
+import asyncio
+import time
+import pytest
+from naapi.exceptions import NetActuateException
+from naapi.hedge import (CLOSED, DEFAULT_HEDGE_WORKERS, HALF_OPEN, OPEN,
+                         CircuitBreaker, HedgePolicy, make_hedge)
+
+
+def test_queued_primary_is_not_hedged():
+    policy = HedgePolicy(min_samples=1, min_delay=0.01, budget=1.0,
+                         max_workers=1)
+    policy.observe('/cloud/servers/', 0.01)
+    # the only thread is busy, the primary waits past its delay
+    policy._executor_for_sync().submit(time.sleep, 0.1)
+    assert policy.call('/cloud/servers/', lambda: 'ok') == 'ok'
+    assert policy.stats()['/cloud/servers/']['hedged'] == 0
+    policy.close()
+
+
+def test_slow_primary_is_hedged():
+    policy = HedgePolicy(min_samples=1, min_delay=0.01, budget=1.0)
+    policy.observe('/cloud/servers/', 0.01)
+    calls = []
+
+    def fetch():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            return 'slow'
+        return 'fast'
+
+    assert policy.call('/cloud/servers/', fetch) == 'fast'
+    assert policy.stats()['/cloud/servers/']['won'] == 1
+    policy.close()
+
+
+def test_failures_are_timed():
+    policy = HedgePolicy()
+
+    def fail():
+        raise ValueError('boom')
+
+    async def afail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        policy.call('/cloud/servers/', fail)
+    with pytest.raises(ValueError):
+        asyncio.run(policy.acall('/cloud/servers/', afail))
+    assert len(policy._samples['/cloud/servers/']) == 2
+
+
+def test_workers_follow_pool_size():
+    assert make_hedge(True).max_workers == DEFAULT_HEDGE_WORKERS
+    assert make_hedge(True, pool_maxsize=100).max_workers == 200
+    assert make_hedge(99, pool_maxsize=10).max_workers == \
+        DEFAULT_HEDGE_WORKERS
+
+
+def test_cancelled_trial_gives_its_slot_back():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.05)
+    breaker.record('/cloud/servers/', False)
+    assert breaker.state('/cloud/servers/') == OPEN
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def fast():
+        return 'ok'
+
+    async def run():
+        await asyncio.sleep(0.06)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(breaker.acall('/cloud/servers/', slow),
+                                   0.01)
+        return await breaker.acall('/cloud/servers/', fast)
+
+    assert asyncio.run(run()) == 'ok'
+    assert breaker.state('/cloud/servers/') == CLOSED
+
+
+def test_silent_trial_is_given_up_on():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.05)
+    breaker.record('/cloud/servers/', False)
+    time.sleep(0.06)
+    # a trial that never reports back
+    breaker.allow('/cloud/servers/')
+    with pytest.raises(NetActuateException):
+        breaker.allow('/cloud/servers/')
+    time.sleep(0.06)
+    breaker.allow('/cloud/servers/')
+    assert breaker.state('/cloud/servers/') == HALF_OPEN
@@ -0,0 +1,49 @@
+"""naapi.inventory against the mock server"""
+import asyncio
+import pytest
+from naapi import aioapi
+from naapi.api import NetActuateNodeDriver
+from naapi.exceptions import NetActuateException
+from naapi.inventory import Inventory
+
+
+@pytest.fixture
+def conn(server):
+    with NetActuateNodeDriver('key', host=server.url) as driver:
+        yield driver
+
+
+def test_refresh_keeps_mirror_when_servers_fails(conn, outage):
+    inventory = Inventory()
+    assert inventory.refresh(conn)['total'] == 20
+    outage(r'^/cloud/servers')
+    with pytest.raises(NetActuateException):
+        inventory.refresh(conn)
+    assert len(inventory) == 20
+
+
+def test_arefresh_keeps_mirror_when_packages_fails(server, outage):
+    inventory = Inventory()
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver('key',
+                                               host=server.url) as driver:
+            await inventory.arefresh(driver)
+            outage(r'^/cloud/packages')
+            with pytest.raises(NetActuateException):
+                await inventory.arefresh(driver)
+
+    asyncio.run(run())
+    assert len(inventory) == 20
+
+
+def test_failed_summary_is_retried(conn, outage):
+    inventory = Inventory()
+    failing = outage(r'^/cloud/serversummary/100003$')
+    counts = inventory.refresh(conn)
+    assert counts['summaries'] == 19
+    assert inventory.get('100003')['summary'] is None
+    failing.active = False
+    counts = inventory.refresh(conn)
+    assert counts['summaries'] == 1
+    assert inventory.get('100003')['summary']['mbpkgid'] == 100003
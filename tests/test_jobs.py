@@ -0,0 +1,108 @@
+"""naapi.jobs"""
+import asyncio
+import pytest
+from naapi.aioapi import NetActuateNodeDriver
+from naapi.exceptions import (NetActuateException, API_ERROR, SERVER_ERROR,
+                              TIMEOUT)
+from naapi.jobs import JobWatcher
+
+
+def test_wait_all_against_mock(server):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            async with JobWatcher(conn, min_interval=0.01) as watcher:
+                return await watcher.wait_all(
+                    [(100000, 1), (100000, 2), (100001, 3)], timeout=5)
+
+    jobs = asyncio.run(run())
+    assert jobs[('100001', '3')]['status'] == 5
+
+
+class Garbled:
+    """A driver whose job records have an unreadable status"""
+    @staticmethod
+    async def get_job(mbpkgid, job_id):
+        return {'id': int(job_id), 'mbpkgid': int(mbpkgid), 'status': 'n/a'}
+
+    @staticmethod
+    async def get_jobs(mbpkgid):
+        return 42
+
+
+def test_unreadable_record_fails_waiters():
+    async def run():
+        async with JobWatcher(Garbled(), min_interval=0.01) as watcher:
+            with pytest.raises(ValueError):
+                await watcher.wait_for((1, 1), timeout=5)
+            with pytest.raises(TypeError):
+                await watcher.wait_all([(2, 1), (2, 2)], timeout=5)
+            assert len(watcher) == 0
+
+    asyncio.run(run())
+
+
+class Flaky:
+    """A driver failing its first polls with a given exception"""
+    def __init__(self, exc, failures):
+        self.exc = exc
+        self.failures = failures
+        self.calls = 0
+
+    async def get_job(self, mbpkgid, job_id):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc
+        return {'id': int(job_id), 'mbpkgid': int(mbpkgid), 'status': 5}
+
+
+def test_transient_errors_are_polled_again():
+    async def run():
+        driver = Flaky(NetActuateException(TIMEOUT, 'timed out'), 3)
+        async with JobWatcher(driver, min_interval=0.01,
+                              max_errors=3) as watcher:
+            record = await watcher.wait_for((1, 1), timeout=5)
+        return record, driver.calls
+
+    record, calls = asyncio.run(run())
+    assert record['status'] == 5
+    assert calls == 4
+
+
+def test_transient_errors_give_up_after_max_errors():
+    async def run():
+        driver = Flaky(NetActuateException(SERVER_ERROR, 'busy'), 100)
+        async with JobWatcher(driver, min_interval=0.01,
+                              max_errors=2) as watcher:
+            with pytest.raises(NetActuateException) as raised:
+                await watcher.wait_for((1, 1), timeout=5)
+        return raised.value, driver.calls
+
+    exc, calls = asyncio.run(run())
+    assert exc.code == SERVER_ERROR
+    assert calls == 3
+
+
+def test_permanent_error_fails_at_once():
+    async def run():
+        driver = Flaky(NetActuateException(API_ERROR, 'bad key'), 100)
+        async with JobWatcher(driver, min_interval=0.01) as watcher:
+            with pytest.raises(NetActuateException):
+                await watcher.wait_for((1, 1), timeout=5)
+        return driver.calls
+
+    assert asyncio.run(run()) == 1
+
+
+def test_error_payload_fails_waiters(server, outage):
+    outage(r'^/cloud/serverjob/?$')
+
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            async with JobWatcher(conn, min_interval=0.01) as watcher:
+                with pytest.raises(NetActuateException) as raised:
+                    await watcher.wait_for((100000, 7), timeout=5)
+                return raised.value
+
+    exc = asyncio.run(run())
+    assert exc.code == API_ERROR
+    assert 'outage' in exc.message
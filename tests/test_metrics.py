@@ -0,0 +1,98 @@
+"""naapi.metrics"""
+import asyncio
+import pytest
+from naapi import aioapi
+from naapi.api import NetActuateNodeDriver
+from naapi.endpoints import ENDPOINTS
+from naapi.exceptions import NetActuateException, SERVER_ERROR
+from naapi.metrics import (ROUTES, Instrumentation, LatencyHistogram,
+                           body_size, endpoint_template)
+from naapi.ratelimit import RetryPolicy
+
+
+def test_routes_cover_endpoints():
+    for endpoint in ENDPOINTS:
+        for route in (endpoint.route, endpoint.alt):
+            if route is None:
+                continue
+            assert route.template in ROUTES
+            path = route.path(dict((field, 123) for field in route.fields))
+            assert endpoint_template(path) == route.template
+    assert endpoint_template('/cloud/locations/') == '/cloud/locations/'
+
+
+def test_hooks_see_every_request(server, outage):
+    instrument = Instrumentation()
+    seen = []
+    instrument.add_hook(pre=lambda info: seen.append(('pre', info.endpoint)),
+                        post=lambda info: seen.append(
+                            ('post', info.endpoint, info.status)))
+    instrument.add_hook(post=lambda info: 1 / 0)
+    outage(r'^/cloud/status/', status=503)
+    with NetActuateNodeDriver('key', host=server.url, instrument=instrument,
+                              retry=RetryPolicy(retries=1, backoff=0)) \
+            as conn:
+        conn.servers(100001)
+        with pytest.raises(NetActuateException):
+            conn.status(100001)
+    assert seen == [('pre', '/cloud/server/{mbpkgid}'),
+                    ('post', '/cloud/server/{mbpkgid}', 200),
+                    ('pre', '/cloud/status/{mbpkgid}'),
+                    ('post', '/cloud/status/{mbpkgid}', 503)]
+    metrics = instrument.metrics
+    key = ('/cloud/server/{mbpkgid}', 'GET')
+    assert metrics.requests[key + ('200',)] == 1
+    assert metrics.bytes[key] > 0
+    assert metrics.requests[('/cloud/status/{mbpkgid}', 'GET',
+                             SERVER_ERROR)] == 1
+    assert metrics.retries[('/cloud/status/{mbpkgid}', 'GET')] == 1
+
+
+def test_async_driver_shares_instrumentation(server):
+    instrument = Instrumentation()
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver(
+                'key', host=server.url, instrument=instrument) as conn:
+            await asyncio.gather(*[conn.status(mbpkgid)
+                                   for mbpkgid in range(100000, 100005)])
+
+    asyncio.run(run())
+    with NetActuateNodeDriver('key', host=server.url,
+                              instrument=instrument) as conn:
+        conn.status(100005)
+    key = ('/cloud/status/{mbpkgid}', 'GET')
+    assert instrument.metrics.requests[key + ('200',)] == 6
+    assert instrument.metrics.latency[key].count == 6
+
+
+def test_prometheus_text(server):
+    with NetActuateNodeDriver('key', host=server.url,
+                              instrument=True) as conn:
+        conn.servers()
+        text = conn.instrument.metrics.prometheus_text()
+    lines = text.splitlines()
+    assert ('naapi_requests_total{endpoint="/cloud/servers/",method="GET",'
+            'status="200"} 1') in lines
+    assert ('naapi_request_duration_seconds_count{endpoint="/cloud/servers/"'
+            ',method="GET"} 1') in lines
+    assert any(line.startswith(
+        'naapi_request_duration_seconds_bucket{endpoint="/cloud/servers/",'
+        'method="GET",le="+Inf"} 1') for line in lines)
+
+
+def test_histogram():
+    histogram = LatencyHistogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.1, 1), (1.0, 3),
+                                      (float('inf'), 4)]
+    assert histogram.quantile(0.5) == 1.0
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def test_body_size():
+    assert body_size({}, b'abc') == 3
+    assert body_size({'Content-Length': '10'}) == 10
+    assert body_size({}, 'é') == 2
+    assert body_size(None) == 0
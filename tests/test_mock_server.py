@@ -0,0 +1,20 @@
+"""benchmarks.mock_server"""
+import time
+from benchmarks.mock_server import MockProcess
+from naapi.api import NetActuateNodeDriver
+
+
+def test_responses_are_not_delayed(server):
+    with NetActuateNodeDriver('key', host=server.url, retry=False) as conn:
+        conn.summary(100001)
+        start = time.perf_counter()
+        for _ in range(20):
+            assert conn.summary(100001).ok
+        # unbuffered writes cost ~40ms each in delayed ACKs
+        assert time.perf_counter() - start < 0.4
+
+
+def test_server_in_a_child_process():
+    with MockProcess(servers=5) as server, \
+            NetActuateNodeDriver('key', host=server.url) as conn:
+        assert len(conn.servers().json()) == 5
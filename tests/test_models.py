@@ -0,0 +1,56 @@
+"""naapi.models records, on their own and from a typed driver"""
+import pytest
+from naapi.api import NetActuateNodeDriver
+from naapi.models import Job, RecordList, Server, build
+
+
+def test_record_is_slotted():
+    job = Job(id=1, status=5, note='kept')
+    assert not hasattr(job, '__dict__')
+    with pytest.raises(AttributeError):
+        job.anything = 1
+    assert job.extra == {'note': 'kept'}
+    assert job.to_dict() == {'id': 1, 'status': 5, 'note': 'kept'}
+
+
+def test_get_returns_default_for_unset_fields():
+    job = Job(id=1, status=None)
+    assert job.get('status') is None
+    assert job.get('status', 0) == 0
+    assert job.get('command', 'build') == 'build'
+    assert job.get('missing', 'x') == 'x'
+    assert Job(id=1, status=0).get('status', 5) == 0
+    assert 'status' not in job
+    with pytest.raises(KeyError):
+        job['missing']  # pylint: disable=pointless-statement
+
+
+def test_strings_are_interned():
+    first = Server(mbpkgid=1, state=''.join(['run', 'ning']))
+    second = Server(mbpkgid=2, state=''.join(['runn', 'ing']))
+    assert first.state is second.state
+    assert first != second
+    assert Server(mbpkgid=1, state='running') == first
+    assert hash(Server(mbpkgid=1)) == hash(first)
+
+
+def test_build_shapes():
+    records = build(Job, [{'id': 1}, {'id': 2}])
+    assert isinstance(records, RecordList)
+    assert records.to_list() == [{'id': 1}, {'id': 2}]
+    assert records[1].id == 2
+    assert [job.id for job in records[:2]] == [1, 2]
+    assert build(Job, {'7': {'id': 7}})[0].id == 7
+    assert build(Job, {'id': 3}).id == 3
+    assert build(Job, {'error': 1, 'msg': 'no'}) == {'error': 1, 'msg': 'no'}
+
+
+def test_typed_driver(server):
+    with NetActuateNodeDriver('key', host=server.url, typed=True) as conn:
+        servers = conn.servers()
+        one = conn.servers(100004)
+    assert isinstance(servers, RecordList)
+    assert len(servers) == 20
+    assert isinstance(servers[4], Server)
+    assert servers[4].mbpkgid == 100004
+    assert one.fqdn == servers[4].fqdn
@@ -0,0 +1,108 @@
+"""naapi.pipeline against the mock server"""
+import asyncio
+import itertools
+import re
+import pytest
+from naapi.aioapi import NetActuateNodeDriver
+from naapi.exceptions import NetActuateException, API_ERROR
+from naapi.jobs import JobWatcher
+from naapi.pipeline import STAGES, ProvisionPipeline
+
+
+@pytest.fixture
+def orders(server):
+    """Serve buy_build and bgpcreatesessions, return the orders seen"""
+    seen = []
+    ids = itertools.count(100000)
+    jobs = itertools.count(1)
+
+    def buy_build(params):
+        seen.append(params)
+        if params.get('fqdn') == 'refused.example.com':
+            return None
+        return {'mbpkgid': next(ids), 'id': next(jobs)}
+
+    def bgp(params, mbpkgid):
+        return {'mbpkgid': int(mbpkgid), 'group_id': params['group_id'],
+                'sessions': 2 if params.get('redundant') else 1}
+    server.api.routes[:0] = [
+        (re.compile(r'^/cloud/buy_build/?$'), buy_build),
+        (re.compile(r'^/cloud/bgpcreatesessions/(\d+)$'), bgp),
+    ]
+    return seen
+
+
+def provision(server, specs, **kwargs):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url,
+                                        retry=False) as conn:
+            async with JobWatcher(conn, min_interval=0.01) as watcher:
+                pipeline = ProvisionPipeline(conn, watcher=watcher,
+                                             retry_backoff=0, **kwargs)
+                return await pipeline.run(specs), pipeline.stats()
+    return asyncio.run(run())
+
+
+def spec(index, **extra):
+    return dict({'fqdn': 'node{0}.example.com'.format(index),
+                 'plan': 'VR1x1x25', 'location': 'LAX', 'image': 5},
+                **extra)
+
+
+def test_nodes_reach_every_stage(server, orders):
+    specs = [spec(index, bgp_group=17, bgp_redundant=index % 2)
+             for index in range(6)]
+    nodes, stats = provision(server, specs)
+    assert all(node.ok for node in nodes)
+    assert [node.spec['fqdn'] for node in nodes] == [
+        item['fqdn'] for item in specs]
+    assert sorted(node.mbpkgid for node in nodes) == list(
+        range(100000, 100006))
+    assert all(node.job['status'] == 5 for node in nodes)
+    assert all(node.ipv4 and node.ipv6 for node in nodes)
+    assert nodes[1].bgp['sessions'] == 2
+    assert set(nodes[0].timings) == set(STAGES)
+    # pipeline options never reach buy_build
+    assert all('bgp_group' not in order for order in orders)
+    assert stats['bgp']['succeeded'] == 6
+    assert stats['build']['throughput'] > 0
+
+
+def test_failed_build_stops_only_that_node(server, orders):
+    specs = [spec(0), {'fqdn': 'refused.example.com'}, spec(2)]
+    nodes, stats = provision(server, specs)
+    assert [node.ok for node in nodes] == [True, False, True]
+    assert nodes[1].stage == 'build'
+    assert isinstance(nodes[1].error, NetActuateException)
+    assert nodes[1].error.code == API_ERROR
+    # build is never retried, a failed order may have gone through
+    assert len(orders) == 3
+    assert stats['build']['failed'] == 1
+    assert stats['wait']['succeeded'] == 2
+
+
+def test_addresses_retried(server, orders, outage):
+    failing = outage(r'^/cloud/ipv6/100000$', status=503)
+    route = server.api.route
+
+    def recover(path, params):
+        if failing.hits >= 2:
+            failing.active = False
+        return route(path, params)
+    server.api.route = recover
+    nodes, stats = provision(server, [spec(0)],
+                             retries={'addresses': 3})
+    assert nodes[0].ok
+    assert nodes[0].attempts['addresses'] == 3
+    assert stats['addresses']['retries'] == 2
+
+
+def test_retries_run_out(server, orders, outage):
+    outage(r'^/cloud/ipv4/', status=404)
+    nodes, stats = provision(server, [spec(0), spec(1)],
+                             retries={'addresses': 1})
+    assert not any(node.ok for node in nodes)
+    assert all(node.stage == 'addresses' for node in nodes)
+    assert all(node.attempts['addresses'] == 2 for node in nodes)
+    assert stats['addresses']['failed'] == 2
+    assert stats['bgp']['succeeded'] == 0
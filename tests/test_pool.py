@@ -0,0 +1,51 @@
+"""naapi.pool and naapi.aiopool against the mock server"""
+import asyncio
+from naapi.aiopool import AsyncClientPool
+from naapi.pool import ClientPool
+from naapi.ratelimit import TokenBucket
+
+
+class Closing:
+    """Counts close() calls on a driver"""
+    def __init__(self, driver):
+        self.closed = 0
+        self._close = driver.close
+        driver.close = self.close
+
+    def close(self):
+        self.closed += 1
+        return self._close()
+
+
+def test_close_closes_drivers(server):
+    pool = ClientPool({'acme': 'key1', 'globex': 'key2'}, host=server.url)
+    assert pool.merge('servers').ok
+    closing = [Closing(driver) for driver in pool.drivers.values()]
+    pool.close()
+    assert [spy.closed for spy in closing] == [1, 1]
+
+
+def test_accounts_get_their_own_bucket(server):
+    bucket = TokenBucket(5, burst=2)
+    with ClientPool(['key1', 'key2'], rate_limit=bucket,
+                    host=server.url) as pool:
+        limiters = [driver.limiter for driver in pool.drivers.values()]
+    assert bucket not in limiters
+    assert limiters[0] is not limiters[1]
+    assert all(limiter.rate == 5 and limiter.burst == 2
+               for limiter in limiters)
+
+
+def test_async_close_closes_drivers(server):
+    async def run():
+        pool = AsyncClientPool(['key1', 'key2'], rate_limit=TokenBucket(5),
+                               host=server.url)
+        assert (await pool.merge('servers')).ok
+        limiters = [driver.limiter for driver in pool.drivers.values()]
+        session = pool.transport.get_session()
+        await pool.close()
+        return session, limiters
+
+    session, limiters = asyncio.run(run())
+    assert limiters[0] is not limiters[1]
+    assert session.closed
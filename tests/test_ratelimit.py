@@ -0,0 +1,131 @@
+"""naapi.ratelimit and the drivers' retry loops against the mock server"""
+import asyncio
+import time
+import pytest
+from naapi import aioapi
+from naapi.api import NetActuateNodeDriver
+from naapi.exceptions import (NetActuateException, RATE_LIMITED,
+                              SERVER_ERROR)
+from naapi.ratelimit import RetryPolicy, TokenBucket, make_retry
+from naapi.transports import RequestsTransport
+
+
+class Closing:
+    """A transport counting the responses closed by the driver"""
+    def __init__(self):
+        self.transport = RequestsTransport()
+        self.errors = self.transport.errors
+        self.timeouts = self.transport.timeouts
+        self.closed = 0
+
+    def request(self, *args, **kwargs):
+        response = self.transport.request(*args, **kwargs)
+        close = response.close
+
+        def counted():
+            self.closed += 1
+            close()
+        response.close = counted
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+def test_make_retry():
+    assert make_retry(None) is None
+    assert make_retry(False) is None
+    assert make_retry(0) is None
+    assert make_retry(True).retries == RetryPolicy().retries
+    assert make_retry(2).retries == 2
+    policy = RetryPolicy(retries=1)
+    assert make_retry(policy) is policy
+
+
+def test_retry_zero_returns_the_response(server, outage):
+    failing = outage(r'^/cloud/sizes', status=503)
+    with NetActuateNodeDriver('key', host=server.url, retry=0) as conn:
+        response = conn.plans()
+    assert response.status_code == 503
+    assert failing.hits == 1
+
+
+def test_retries_exhausted_closes_responses(server, outage):
+    failing = outage(r'^/cloud/sizes', status=503)
+    transport = Closing()
+    with NetActuateNodeDriver('key', host=server.url, transport=transport,
+                              retry=RetryPolicy(retries=2, backoff=0)) \
+            as conn:
+        with pytest.raises(NetActuateException) as raised:
+            conn.plans()
+    transport.close()
+    assert raised.value.code == SERVER_ERROR
+    assert raised.value.status == 503
+    assert raised.value.attempts == 3
+    assert failing.hits == 3
+    assert transport.closed == 3
+
+
+def test_retry_recovers(server, outage):
+    failing = outage(r'^/cloud/sizes', status=502)
+    route = server.api.route
+
+    def recover(path, params):
+        if failing.hits >= 2:
+            failing.active = False
+        return route(path, params)
+    server.api.route = recover
+    with NetActuateNodeDriver('key', host=server.url,
+                              retry=RetryPolicy(retries=3, backoff=0)) \
+            as conn:
+        assert conn.plans().ok
+    assert failing.hits == 3
+
+
+def test_async_retries_exhausted(server, outage):
+    failing = outage(r'^/cloud/sizes', status=429)
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver(
+                'key', host=server.url,
+                retry=RetryPolicy(retries=1, backoff=0)) as conn:
+            with pytest.raises(NetActuateException) as raised:
+                await conn.plans()
+            return raised.value
+
+    exc = asyncio.run(run())
+    assert exc.code == RATE_LIMITED
+    assert exc.attempts == 2
+    assert failing.hits == 2
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # the first token is free, the other five wait 20ms each
+    assert time.monotonic() - start >= 0.09
+    assert bucket.waited >= 0.09
+
+
+def test_token_bucket_max_wait():
+    bucket = TokenBucket(1, burst=1, max_wait=0.1)
+    bucket.acquire()
+    with pytest.raises(NetActuateException) as raised:
+        bucket.acquire()
+    assert raised.value.code == RATE_LIMITED
+    assert bucket.throttled == 1
+
+
+def test_limited_driver(server):
+    bucket = TokenBucket(100, burst=1)
+
+    async def run():
+        async with aioapi.NetActuateNodeDriver(
+                'key', host=server.url, rate_limit=bucket) as conn:
+            await asyncio.gather(*[conn.plans() for _ in range(6)])
+
+    start = time.monotonic()
+    asyncio.run(run())
+    assert time.monotonic() - start >= 0.045
@@ -0,0 +1,20 @@
+"""naapi.response"""
+import json
+from naapi.response import JSONText
+
+
+def test_json_text_headers_are_per_instance():
+    first = JSONText('[]')
+    second = JSONText('{}')
+    first.headers['X-Test'] = '1'
+    assert second.headers == {}
+    assert JSONText.from_body('[]', 404, {'A': 'b'}).headers == {'A': 'b'}
+
+
+def test_from_value_is_text_with_the_value():
+    value = [{'id': 1, 'name': 'Los Angeles, US'}]
+    response = JSONText.from_value(value)
+    assert isinstance(response, str)
+    assert response.json() is value
+    assert json.loads(response) == value
+    assert response.headers['Content-Type'] == 'application/json'
@@ -0,0 +1,117 @@
+"""naapi.stream"""
+import asyncio
+import json
+import pytest
+from naapi.api import NetActuateNodeDriver
+from naapi.exceptions import NetActuateException
+from naapi.stream import JSONArrayParser, aiter_items, iter_items
+
+RECORDS = [
+    {'fqdn': 'node1.example.com', 'notes': 'quote " and \\ backslash'},
+    {'name': 'São Paulo, BR', 'emoji': '\U0001f680', 'esc': 'é\n'},
+    {'nested': {'list': [1, [2, {'deep': []}]], 'empty': {}}},
+    [], {}, 12345, -1.5e3, True, False, None, 'text, with ] and [',
+]
+
+
+def split(body, size):
+    return [body[index:index + size] for index in range(0, len(body), size)]
+
+
+def parse(chunks):
+    parser = JSONArrayParser()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items + parser.close()
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1 << 20])
+def test_any_chunk_boundary(size):
+    body = json.dumps(RECORDS, ensure_ascii=False).encode('utf-8')
+    assert parse(split(body, size)) == RECORDS
+
+
+def test_escapes_split_inside_unicode_escape():
+    body = json.dumps(RECORDS, ensure_ascii=True).encode('ascii')
+    assert b'\\u00e3' in body
+    for size in (1, 4, 5):
+        assert parse(split(body, size)) == RECORDS
+
+
+def test_multibyte_utf8_split_mid_character():
+    body = json.dumps(['é\U0001f680'], ensure_ascii=False).encode()
+    # every byte on its own, the decoder has to carry partial characters
+    assert parse([body[index:index + 1] for index in range(len(body))]) == \
+        ['é\U0001f680']
+
+
+def test_text_chunks():
+    assert parse(['[{"a":', ' 1}, ', '2', '3]']) == [{'a': 1}, 23]
+
+
+@pytest.mark.parametrize('body', ['[]', '  [ ]  ', '\n[\r\n\t]\n'])
+def test_empty_arrays(body):
+    assert parse(split(body.encode(), 1)) == []
+
+
+def test_whitespace_everywhere():
+    body = ' \n [ 1 ,\n\t{ "a" : [ 1 , 2 ] } ,\r\n "x" ] \n'
+    assert parse(split(body, 1)) == [1, {'a': [1, 2]}, 'x']
+
+
+def test_elements_come_out_as_they_close():
+    parser = JSONArrayParser()
+    assert parser.feed(b'[{"a": 1}, {"b"') == [{'a': 1}]
+    assert parser.feed(b': 2}, 10') == [{'b': 2}]
+    # 10 may still become 100
+    assert parser.feed(b'0]') == [100]
+    assert parser.close() == []
+
+
+@pytest.mark.parametrize('body', ['[1, 2', '[{"a": 1}, {"b"', '["abc',
+                                  '[1, 2,'])
+def test_truncated_stream(body):
+    with pytest.raises(ValueError):
+        parse([body.encode()])
+
+
+def test_empty_document():
+    with pytest.raises(ValueError):
+        parse([b'  '])
+
+
+def test_data_after_the_array():
+    with pytest.raises(ValueError):
+        parse([b'[1] 2'])
+
+
+@pytest.mark.parametrize('value', [{'a': 1}, 'text', 42, None])
+def test_non_array_top_level(value):
+    body = json.dumps(value).encode()
+    assert parse(split(body, 1)) == [value]
+    assert list(iter_items(split(body, 1))) == [value]
+
+
+def test_error_payload_raises():
+    body = b'{"error": 1, "msg": "invalid key"}'
+    with pytest.raises(NetActuateException) as info:
+        list(iter_items(split(body, 3)))
+    assert 'invalid key' in str(info.value)
+
+
+def test_aiter_items():
+    async def chunks():
+        for chunk in split(json.dumps(RECORDS).encode(), 5):
+            yield chunk
+
+    async def run():
+        return [item async for item in aiter_items(chunks())]
+
+    assert asyncio.run(run()) == RECORDS
+
+
+def test_iter_servers_against_mock(server):
+    with NetActuateNodeDriver('key', host=server.url) as conn:
+        streamed = list(conn.iter_servers())
+        assert streamed == conn.servers().json()
@@ -0,0 +1,121 @@
+"""naapi.watch"""
+import asyncio
+import pytest
+from naapi.aioapi import NetActuateNodeDriver
+from naapi.watch import ADDED, CHANGED, REMOVED, FleetWatcher
+
+
+class Fleet:
+    """A driver answering servers() from a list that tests change"""
+    def __init__(self, count):
+        self.nodes = [{'mbpkgid': index, 'state': 'running', 'uptime': 0}
+                        for index in range(1, count + 1)]
+        self.fail = False
+
+    async def servers(self):
+        if self.fail:
+            raise ValueError('down')
+        return [dict(server) for server in self.nodes]
+
+
+def test_poll_reports_only_changes():
+    fleet = Fleet(3)
+
+    async def run():
+        watcher = FleetWatcher(fleet, min_interval=1, max_interval=4,
+                               backoff=2, ignore=('uptime',))
+        polls = [await watcher.poll()]
+        intervals = [watcher.interval]
+        fleet.nodes[0]['uptime'] = 10
+        polls.append(await watcher.poll())
+        intervals.append(watcher.interval)
+        fleet.nodes[1]['state'] = 'stopped'
+        del fleet.nodes[2]
+        fleet.nodes.append({'mbpkgid': 9, 'state': 'running'})
+        polls.append(await watcher.poll())
+        intervals.append(watcher.interval)
+        return polls, intervals
+
+    polls, intervals = asyncio.run(run())
+    # the first poll fills the snapshot, ignored keys never count
+    assert polls[:2] == [[], []]
+    assert sorted((event.kind, event.mbpkgid) for event in polls[2]) == [
+        (ADDED, '9'), (CHANGED, '2'), (REMOVED, '3')]
+    changed = [event for event in polls[2] if event.kind == CHANGED][0]
+    assert changed.old['server']['state'] == 'running'
+    assert changed.new['server']['state'] == 'stopped'
+    # idle polls back off to max_interval, a change tightens it again
+    assert intervals == [2, 4, 1]
+
+
+def test_failed_poll_removes_nothing():
+    fleet = Fleet(2)
+
+    async def run():
+        watcher = FleetWatcher(fleet, min_interval=0.01)
+        await watcher.poll()
+        fleet.fail = True
+        with pytest.raises(ValueError):
+            await watcher.poll()
+        fleet.fail = False
+        return await watcher.poll()
+
+    assert asyncio.run(run()) == []
+
+
+def test_events_and_callbacks_until_close():
+    fleet = Fleet(2)
+    called = []
+
+    async def consume(watcher):
+        return [(event.kind, event.mbpkgid)
+                async for event in watcher.events()]
+
+    async def callback(event):
+        called.append(event.mbpkgid)
+
+    async def run():
+        watcher = FleetWatcher(fleet, min_interval=0.01, max_interval=0.01)
+        watcher.on_change(callback)
+        watcher.on_change(lambda event: 1 / 0)
+        consumer = asyncio.ensure_future(consume(watcher))
+        await asyncio.sleep(0.05)
+        fleet.nodes[0]['state'] = 'stopped'
+        fleet.fail = True
+        await asyncio.sleep(0.05)
+        fleet.fail = False
+        await asyncio.sleep(0.05)
+        await watcher.close()
+        return await asyncio.wait_for(consumer, 1), watcher.errors
+
+    events, errors = asyncio.run(run())
+    assert events == [(CHANGED, '1')]
+    assert called == ['1']
+    assert errors > 0
+
+
+def test_slow_subscriber_drops_oldest():
+    async def run():
+        watcher = FleetWatcher(Fleet(5), min_interval=10, initial=True,
+                               max_queue=2)
+        events = watcher.events()
+        first = await events.__anext__()
+        second = await events.__anext__()
+        await watcher.close()
+        with pytest.raises(StopAsyncIteration):
+            await events.__anext__()
+        return first.mbpkgid, second.mbpkgid, watcher.dropped
+
+    assert asyncio.run(run()) == ('4', '5', 3)
+
+
+def test_status_against_mock(server):
+    async def run():
+        async with NetActuateNodeDriver('key', host=server.url) as conn:
+            watcher = FleetWatcher(conn, status=True, initial=True)
+            return await watcher.poll()
+
+    events = asyncio.run(run())
+    assert len(events) == 20
+    assert all(event.kind == ADDED for event in events)
+    assert 'status' in events[0].new['status']